@@ -22,6 +22,7 @@ if exists apk; then
     apk add --no-cache \
         bash \
         grep \
+        gzip \
         privoxy \
         sed \
         wget
@@ -54,6 +55,7 @@ if exists apt-get; then
     apt-get install --no-install-recommends -y \
         bash \
         grep \
+        gzip \
         privoxy \
         sed \
         wget
@@ -110,6 +112,7 @@ if exists pacman; then
     pacman -Sy \
         bash \
         grep \
+        gzip \
         privoxy \
         sed \
         wget
@@ -19,7 +19,6 @@
 #
 #                 TODO:
 #                  - implement:
-#                     domain-based filter
 #                     id->class combination
 #                     class->id combination
 #
@@ -30,7 +29,9 @@ set -euo pipefail
 # dependencies
 DEPENDS=(
     'bash'
+    'awk'
     'grep'
+    'gzip'
     'privoxy'
     'sed'
     'wget'
@@ -46,6 +47,13 @@ FILTERTYPES=(
     "attribute_global_endswith"
     "class_global"
     "id_global"
+    "attribute_domain_name"
+    "attribute_domain_exact"
+    "attribute_domain_contain"
+    "attribute_domain_startswith"
+    "attribute_domain_endswith"
+    "class_domain"
+    "id_domain"
 )
 
 DEFAULT_URLS=(
@@ -60,6 +68,8 @@ DEFAULT_URLS=(
 ######################################################################
 
 SCRIPTNAME="$(basename "$(readlink -f "${0}")")"
+# <main> is replaced by release process
+SCRIPT_VERSION="<main>"
 
 function usage() {
     get_config_path
@@ -69,56 +79,127 @@ function usage() {
     echo "      -h:         Show this help."
     echo "      -a:         Run in 'Activate Mode', which registers converted lists in Privoxy configuration file. (default mode) [env: ACTIVATE=1]"
     echo "      -A:         Run in 'Convert Mode', which does *not* register converted lists in Privoxy configuration file. [env: ACTIVATE=0]"
+    echo "      -b path:    Export converted lists as bundle (tar.gz with manifest and .sha256 file) to given path for installation by -i. (default: empty, export disabled) [env: BUNDLE_FILE='']"
     echo "      -c path:    Path to script configuration file. (default = ${SCRIPTCONF} - OS specific) [env: SCRIPTCONF='']"
     echo "      -C:         Don't write configuration file [env: NO_CONFIG=1]"
     echo "      -d path:    Path to store generated list files (*.action & *.filter) in. (default = directory of privoxy-config - OS specific) [env: LISTS_DIR='']"
+    echo "      -D:         Run in 'Scheduler Mode', which keeps running and refreshes each list when it expired, needs -k. Intervals are set by REFRESH_* and SCHEDULER_MIN_SLEEP within the configuration file."
+    echo "      -e engine:  Convert lists with given engine, either 'shell' or 'python' (needs python3 and package privoxy_blocklist next to this script). (default: shell) [env: ENGINE=shell]"
     echo "      -f filter:  Only activate given content filter, can be used multiple times. (default: empty, content-filter disabled) [env: FILTERS=()]"
     echo "                  Supported values: ${FILTERTYPES[*]}"
+    echo "      -i bundle:  Install lists of given bundle path or URL exported by -b instead of converting any list. (default: empty, lists are converted) [env: IMPORT_BUNDLE='']"
+    echo "      -j number:  Number of lists downloaded in parallel. (default: 4) [env: PARALLEL_DOWNLOADS=4]"
+    echo "      -k path:    Path to persistent cache for downloaded lists, enables conditional downloads. (default: empty, cache disabled) [env: CACHE_DIR='']"
+    echo "      -l path:    Drop block patterns and content filters without hits within given Privoxy log, can be used multiple times. (default: empty, pruning disabled) [env: PRUNE_LOGS=()]"
+    echo "                  Requests are logged by Privoxy with debug 1 or 1024 and content filter hits with debug 64, needs python3 and package privoxy_blocklist next to this script."
+    echo "      -m:         Merge all lists into one list (merged.script.*) without duplicate patterns. [env: MERGE_LISTS=1]"
     echo "      -p path:    Path to Privoxy config file. (default = OS specific) [env: PRIVOXY_CONF='']"
+    echo "      -P path:    Write metrics of each run into given Prometheus textfile-collector file (*.prom). (default: empty, metrics disabled) [env: METRICS_FILE='']"
     echo "      -q:         Don't give any output. [env: DBG='-1']"
     echo "      -r:         Remove all lists build by this script."
+    echo "      -s:         Convert lists as stream without intermediate files per rule type to limit memory and temporary files. [env: STREAMING=1]"
     echo "      -t path:    Define path for temporary files. (default: /tmp/${SCRIPTNAME}) [env: TMPDIR='']"
+    echo "      -T path:    Append wall time, bytes and rules of each stage of each list as JSON lines to given file. (default: empty, timings disabled) [env: TIMINGS_FILE='']"
     echo "      -u URL:     Process given list URL, can be used multiple times. (default: ${DEFAULT_URLS[*]}) [env: URLS=()]"
     echo "      -U:         Update configuration file based on given parameters and exit."
     echo "      -v 1:       Enable verbosity 1. Show a little bit more output. [env: DBG=1]"
     echo "      -v 2:       Enable verbosity 2. Show a lot more output. [env: DBG=2]"
     echo "      -v 3:       Enable verbosity 3. Show all possible output and don't delete temporary files.(For debugging only!!) [env: DBG=3]"
     echo "      -V:         Show version."
+    echo "      -x page:    Run in 'Analyze Mode', which times each job of the generated filterfiles on given HTML page and exits, can be used multiple times."
+    echo "                  tests/response.html next to this script is analyzed as well, needs python3 and package privoxy_blocklist next to this script."
 }
 
 # shellcheck disable=SC2317  # function is called in case of FILTERS not empty
-function activate_config() {
-    local file_name file_path file_type option
-    file_path="$1"
-    file_name="$(basename "${file_path}")"
-    case "${file_name}" in
-        *"action")
-            file_type="action"
-            option="actionsfile"
+function stage() {
+    # copy given generated file into STAGING_DIR to install all lists at once by install_staged
+    mkdir -p "${STAGING_DIR}"
+    copy "$1" "${STAGING_DIR}"
+    STAGED+=("${LISTS_DIR}/$(basename "$1")")
+}
+
+# shellcheck disable=SC2317  # function is called in case of FILTERS not empty
+function config_option() {
+    # print option of Privoxy config registering files of given type
+    case "$1" in
+        "action")
+            echo "actionsfile"
             ;;
-        *"filter")
-            file_type="filter"
-            option="filterfile"
+        "filter")
+            echo "filterfile"
             ;;
     esac
-    copy "${file_path}" "${LISTS_DIR}"
-    if [ "${ACTIVATE}" -eq 0 ]; then
-        info "Skip activation of '${file_name}' due to 'Convert Mode'."
+}
+
+# shellcheck disable=SC2317  # function is called in case of FILTERS not empty
+function install_staged() {
+    # install all staged files at once
+    #   files are renamed into LISTS_DIR within the same file system, thus Privoxy never reads partly written lists
+    #   registrations of all new files are added to PRIVOXY_CONF within one rewrite, thus Privoxy reloads it only once
+    #   files with the same content as the installed ones are kept, thus Privoxy does not parse them again
+    #   files are registered in the order they were staged, as the order of lists within PRIVOXY_CONF sets their precedence
+    local changed=() config_tmp file_name file_path file_type option registrations=() staged
+    local -A entries=()
+    if ! [ -d "${STAGING_DIR}" ]; then
+        return 0
+    fi
+    for staged in "${STAGED[@]}"; do
+        file_name="$(basename "${staged}")"
+        file_path="${STAGING_DIR}/${file_name}"
+        if [ -f "${LISTS_DIR}/${file_name}" ] \
+            && [ "$(checksum < "${file_path}")" = "$(checksum < "${LISTS_DIR}/${file_name}")" ]; then
+            debug 1 "Keep unchanged '${file_name}'."
+            rm -f "${file_path}"
+        else
+            mv -f "${file_path}" "${LISTS_DIR}/${file_name}"
+            changed+=("${file_name}")
+        fi
+        if [ "${ACTIVATE}" -eq 0 ]; then
+            info "Skip activation of '${file_name}' due to 'Convert Mode'."
+            continue
+        fi
+        if grep -q "${LISTS_DIR}/${file_name}" "${PRIVOXY_CONF}"; then
+            continue
+        fi
+        file_type="${file_name##*.}"
+        if [ "${OS_FLAVOR}" = "openwrt" ]; then
+            entries[${file_type}]+="\tlist\t$(config_option "${file_type}")\t'${LISTS_DIR}/${file_name}'\n"
+        else
+            entries[${file_type}]+="$(config_option "${file_type}") ${LISTS_DIR}/${file_name}\n"
+        fi
+    done
+    rmdir "${STAGING_DIR}"
+    if [ "${#changed[@]}" -eq 0 ]; then
+        debug 0 "No list changed."
+    else
+        debug 0 "Changed lists: ${changed[*]}"
+    fi
+    metric "changed_files" "${#changed[@]}"
+    if [ "${#entries[@]}" -eq 0 ]; then
         return 0
     fi
-    if ! grep -q "${LISTS_DIR}/${file_name}" "${PRIVOXY_CONF}"; then
-        debug 0 "Modifying ${PRIVOXY_CONF} ..."
-        # ensure generated config is above user.* to allow overriding
+    debug 0 "Modifying ${PRIVOXY_CONF} ..."
+    # ensure generated config is above user.* to allow overriding
+    for file_type in "${!entries[@]}"; do
+        option="$(config_option "${file_type}")"
         if [ "${OS_FLAVOR}" = "openwrt" ]; then
-            sed "s%^\(\s*#*\s*list\s\s*${option}\s\s*'user\.${file_type}'\)%\tlist\t${option}\t'${LISTS_DIR}/${file_name}'\n\1%" "${PRIVOXY_CONF}" > "${TMPDIR}/config"
+            registrations+=("-e" "s%^\(\s*#*\s*list\s\s*${option}\s\s*'user\.${file_type}'\)%${entries[${file_type}]}\1%")
         else
-            sed "s%^\(#*\s*${option} user\.${file_type}\)%${option} ${LISTS_DIR}/${file_name}\n\1%" "${PRIVOXY_CONF}" > "${TMPDIR}/config"
+            registrations+=("-e" "s%^\(#*\s*${option} user\.${file_type}\)%${entries[${file_type}]}\1%")
         fi
-        debug 0 "... modification done."
-        debug 0 "Installing new config ..."
-        copy "${TMPDIR}/config" "${PRIVOXY_CONF}"
-        debug 0 "... installation done"
+    done
+    sed "${registrations[@]}" "${PRIVOXY_CONF}" > "${TMPDIR}/config"
+    debug 0 "... modification done."
+    debug 0 "Installing new config ..."
+    # replace config by renaming a copy keeping its permissions within the same directory
+    config_tmp="$(dirname "${PRIVOXY_CONF}")/.$(basename "${PRIVOXY_CONF}").${TMPNAME}"
+    cp -p "${PRIVOXY_CONF}" "${config_tmp}"
+    cat "${TMPDIR}/config" > "${config_tmp}"
+    if [ "${ACTIVATE}" -eq 1 ]; then
+        chown "${PRIVOXY_USER}:${PRIVOXY_GROUP}" "${config_tmp}"
     fi
+    mv -f "${config_tmp}" "${PRIVOXY_CONF}"
+    debug 0 "... installation done"
 }
 
 # shellcheck disable=SC2317  # function is called in case of FILTERS not empty
@@ -201,7 +282,7 @@ function get_group() {
 }
 
 function write_config() {
-    local filters="" urls=""
+    local bundle_file cache_dir engine filter_max_bytes filter_max_selectors filters="" entry import_bundle log merge_lists metrics_file parallel_downloads prune_days prune_keep="" prune_logs="" refresh_interval refresh_intervals="" refresh_jitter scheduler_min_sleep source streaming timings_file urls=""
     # convert to list of quoted strings
     for filter in "${OPT_FILTERS[@]:-"${FILTERS[@]}"}"; do
         filters+="\"${filter}\" "
@@ -210,6 +291,37 @@ function write_config() {
     for url in "${OPT_URLS[@]:-"${URLS[@]:-"${DEFAULT_URLS[@]}"}"}"; do
         urls+="\"${url}\" "
     done
+    # convert to list of quoted strings
+    for log in "${OPT_PRUNE_LOGS[@]:-"${PRUNE_LOGS[@]:-}"}"; do
+        if [ -n "${log}" ]; then
+            prune_logs+="\"${log}\" "
+        fi
+    done
+    for source in "${PRUNE_KEEP[@]:-}"; do
+        if [ -n "${source}" ]; then
+            prune_keep+="\"${source}\" "
+        fi
+    done
+    prune_days="${PRUNE_DAYS:-30}"
+    for entry in "${REFRESH_INTERVALS[@]:-}"; do
+        if [ -n "${entry}" ]; then
+            refresh_intervals+="\"${entry}\" "
+        fi
+    done
+    refresh_interval="${REFRESH_INTERVAL:-0}"
+    refresh_jitter="${REFRESH_JITTER:-0}"
+    scheduler_min_sleep="${SCHEDULER_MIN_SLEEP:-300}"
+    parallel_downloads="${OPT_PARALLEL_DOWNLOADS:-"${PARALLEL_DOWNLOADS:-4}"}"
+    cache_dir="${OPT_CACHE_DIR:-"${CACHE_DIR:-}"}"
+    merge_lists="${OPT_MERGE_LISTS:-"${MERGE_LISTS:-0}"}"
+    streaming="${OPT_STREAMING:-"${STREAMING:-0}"}"
+    engine="${OPT_ENGINE:-"${ENGINE:-shell}"}"
+    timings_file="${OPT_TIMINGS_FILE:-"${TIMINGS_FILE:-}"}"
+    metrics_file="${OPT_METRICS_FILE:-"${METRICS_FILE:-}"}"
+    bundle_file="${OPT_BUNDLE_FILE:-"${BUNDLE_FILE:-}"}"
+    import_bundle="${OPT_IMPORT_BUNDLE:-"${IMPORT_BUNDLE:-}"}"
+    filter_max_selectors="${FILTER_MAX_SELECTORS:-1000}"
+    filter_max_bytes="${FILTER_MAX_BYTES:-32768}"
     cat > "${SCRIPTCONF}" << EOF
 # Config of privoxy-blocklist
 
@@ -222,6 +334,39 @@ URLS=(${urls})
 #   empty by default to deactivate as content filters slowdown privoxy a lot
 FILTERS=(${filters})
 
+# budget of each content filter job, every job is a separate pass over the page
+#   less jobs mean less passes but larger regexes, check the jobs per filter reported with -v 1
+#   maximum number of selectors per job, privoxy cannot handle more than 2000
+FILTER_MAX_SELECTORS=${filter_max_selectors}
+#   maximum length of the regex of a job in bytes, PCRE limits compiled patterns to 64 KiB by default
+FILTER_MAX_BYTES=${filter_max_bytes}
+
+# number of lists downloaded in parallel
+PARALLEL_DOWNLOADS=${parallel_downloads}
+
+# merge all lists into one list without duplicate patterns (1 = enabled, 0 = disabled)
+MERGE_LISTS=${merge_lists}
+
+# convert lists as stream without intermediate files per rule type (1 = enabled, 0 = disabled)
+#   limits memory and temporary files e.g. on routers with TMPDIR in RAM, but neither prunes domains nor sorts selectors
+#   domain based content filters are not supported while streaming
+STREAMING=${streaming}
+
+# engine converting the lists, both generate the same lists
+#   "shell" uses sed and awk, "python" needs python3 and the package privoxy_blocklist next to the script
+#   streaming always uses the shell engine
+ENGINE="${engine}"
+
+# array of Privoxy logs to prune block patterns and content filters without hits by
+#   requests are logged with debug 1 or 1024 and content filter hits with debug 64 within the Privoxy config
+#   rotated logs compressed by gzip can be given as well, empty to disable pruning, e.g. ("/var/log/privoxy/logfile")
+#   needs python3 and the package privoxy_blocklist next to the script
+PRUNE_LOGS=(${prune_logs})
+# number of last days of the logs to count hits in, 0 for the whole logs
+PRUNE_DAYS=${prune_days}
+# array of URLs or names of lists which are never pruned, e.g. ("easyprivacy")
+PRUNE_KEEP=(${prune_keep})
+
 # config for privoxy initscript providing PRIVOXY_CONF, PRIVOXY_USER and PRIVOXY_GROUP
 INIT_CONF="/etc/conf.d/privoxy"
 
@@ -235,6 +380,31 @@ INIT_CONF="/etc/conf.d/privoxy"
 TMPNAME="\$(basename "\$(readlink -f "\${0}")")"
 # directory for temporary files
 TMPDIR="${OPT_TMPDIR:-"/tmp/\${TMPNAME}"}"
+# directory to keep downloaded lists and their validators (ETag, Last-Modified, Expires) between runs
+#   empty to disable caching, e.g. "/var/cache/\${TMPNAME}"
+CACHE_DIR="${cache_dir}"
+# refresh of cached lists, used with CACHE_DIR e.g. by the scheduler mode (-D)
+#   array of intervals in seconds per URL or list name replacing the update frequency of the list header, e.g. ("easylist=21600")
+REFRESH_INTERVALS=(${refresh_intervals})
+#   interval in seconds of lists without update frequency in their header, 0 to check them on every run
+#   and daily within the scheduler mode
+REFRESH_INTERVAL=${refresh_interval}
+#   maximum random seconds added to the expiry of each list to spread downloads of many hosts, e.g. 3600
+REFRESH_JITTER=${refresh_jitter}
+# minimal seconds between runs of the scheduler mode (-D), failed lists are retried after it
+SCHEDULER_MIN_SLEEP=${scheduler_min_sleep}
+# file to append per-stage timings of each run to as JSON lines
+#   empty to disable timings, e.g. "/var/log/\${TMPNAME}-timings.json"
+TIMINGS_FILE="${timings_file}"
+# file to write metrics of the last run to in Prometheus text format, written atomically
+#   empty to disable metrics, e.g. "/var/lib/prometheus/node-exporter/\${TMPNAME}.prom"
+METRICS_FILE="${metrics_file}"
+# file to export converted lists to as bundle for installation on other hosts
+#   empty to disable export, e.g. "/var/www/\${TMPNAME}.tar.gz"
+BUNDLE_FILE="${bundle_file}"
+# path or URL of bundle to install instead of converting URLS, e.g. on hosts with low resources
+#   empty to convert URLS, e.g. "https://example.org/\${TMPNAME}.tar.gz"
+IMPORT_BUNDLE="${import_bundle}"
 
 # Debug-level
 #   -1 = quiet
@@ -287,6 +457,21 @@ function prepare() {
             if [ -z "${OPT_TMPDIR}" ]; then
                 OPT_TMPDIR="${TMPDIR}"
             fi
+            if [ -z "${OPT_CACHE_DIR}" ]; then
+                OPT_CACHE_DIR="${CACHE_DIR:-}"
+            fi
+            if [ -z "${OPT_TIMINGS_FILE}" ]; then
+                OPT_TIMINGS_FILE="${TIMINGS_FILE:-}"
+            fi
+            if [ -z "${OPT_METRICS_FILE}" ]; then
+                OPT_METRICS_FILE="${METRICS_FILE:-}"
+            fi
+            if [ -z "${OPT_BUNDLE_FILE}" ]; then
+                OPT_BUNDLE_FILE="${BUNDLE_FILE:-}"
+            fi
+            if [ -z "${OPT_IMPORT_BUNDLE}" ]; then
+                OPT_IMPORT_BUNDLE="${IMPORT_BUNDLE:-}"
+            fi
             write_config
             exit 0
         fi
@@ -314,6 +499,68 @@ function prepare() {
         TMPDIR="${OPT_TMPDIR}"
     fi
     debug 2 "TMPDIR: ${TMPDIR:-}"
+    if [ -n "${OPT_PARALLEL_DOWNLOADS}" ]; then
+        PARALLEL_DOWNLOADS="${OPT_PARALLEL_DOWNLOADS}"
+    fi
+    PARALLEL_DOWNLOADS="${PARALLEL_DOWNLOADS:-4}"
+    debug 2 "Parallel downloads: ${PARALLEL_DOWNLOADS}"
+    if [ -n "${OPT_CACHE_DIR}" ]; then
+        CACHE_DIR="${OPT_CACHE_DIR}"
+    fi
+    CACHE_DIR="${CACHE_DIR:-}"
+    debug 2 "CACHE_DIR: ${CACHE_DIR:-disabled}"
+    REFRESH_INTERVAL="${REFRESH_INTERVAL:-0}"
+    REFRESH_JITTER="${REFRESH_JITTER:-0}"
+    SCHEDULER_MIN_SLEEP="${SCHEDULER_MIN_SLEEP:-300}"
+    debug 2 "Refresh intervals: ${REFRESH_INTERVALS[*]:-none}, default: ${REFRESH_INTERVAL}, jitter: ${REFRESH_JITTER}, scheduler minimal sleep: ${SCHEDULER_MIN_SLEEP}"
+    if [ -n "${OPT_MERGE_LISTS}" ]; then
+        MERGE_LISTS="${OPT_MERGE_LISTS}"
+    fi
+    MERGE_LISTS="${MERGE_LISTS:-0}"
+    debug 2 "Merge lists: ${MERGE_LISTS}"
+    if [ -n "${OPT_STREAMING}" ]; then
+        STREAMING="${OPT_STREAMING}"
+    fi
+    STREAMING="${STREAMING:-0}"
+    debug 2 "Streaming: ${STREAMING}"
+    if [ -n "${OPT_ENGINE}" ]; then
+        ENGINE="${OPT_ENGINE}"
+    fi
+    ENGINE="${ENGINE:-shell}"
+    debug 2 "Conversion engine: ${ENGINE}"
+    if [ -n "${OPT_PRUNE_LOGS[*]}" ]; then
+        PRUNE_LOGS=("${OPT_PRUNE_LOGS[@]}")
+    fi
+    debug 2 "Prune logs: ${PRUNE_LOGS[*]:-disabled}"
+    PRUNE_DAYS="${PRUNE_DAYS:-30}"
+    debug 2 "Prune days: ${PRUNE_DAYS}"
+    if [ -n "${OPT_TIMINGS_FILE}" ]; then
+        TIMINGS_FILE="${OPT_TIMINGS_FILE}"
+    fi
+    TIMINGS_FILE="${TIMINGS_FILE:-}"
+    debug 2 "TIMINGS_FILE: ${TIMINGS_FILE:-disabled}"
+    if [ -n "${OPT_METRICS_FILE}" ]; then
+        METRICS_FILE="${OPT_METRICS_FILE}"
+    fi
+    METRICS_FILE="${METRICS_FILE:-}"
+    debug 2 "METRICS_FILE: ${METRICS_FILE:-disabled}"
+    if [ -n "${OPT_BUNDLE_FILE}" ]; then
+        BUNDLE_FILE="${OPT_BUNDLE_FILE}"
+    fi
+    BUNDLE_FILE="${BUNDLE_FILE:-}"
+    debug 2 "BUNDLE_FILE: ${BUNDLE_FILE:-disabled}"
+    if [ -n "${OPT_IMPORT_BUNDLE}" ]; then
+        IMPORT_BUNDLE="${OPT_IMPORT_BUNDLE}"
+    fi
+    IMPORT_BUNDLE="${IMPORT_BUNDLE:-}"
+    debug 2 "IMPORT_BUNDLE: ${IMPORT_BUNDLE:-disabled}"
+    # installing a bundle replaces downloading and converting the lists
+    if [ -n "${IMPORT_BUNDLE}" ] && [ "${method}" = "main" ]; then
+        method="import_bundle"
+    fi
+    FILTER_MAX_SELECTORS="${FILTER_MAX_SELECTORS:-1000}"
+    FILTER_MAX_BYTES="${FILTER_MAX_BYTES:-32768}"
+    debug 2 "Content filter job budget: ${FILTER_MAX_SELECTORS} selectors, ${FILTER_MAX_BYTES} bytes"
     TMPNAME="${TMPNAME:-"$(basename "$(readlink -f "${0}")")"}"
 
     # load privoxy config
@@ -350,6 +597,8 @@ function prepare() {
 
     # set privoxy config dir
     LISTS_DIR="${LISTS_DIR:-"$(dirname "${PRIVOXY_CONF}")"}"
+    # generated files are staged within LISTS_DIR to allow renaming them into place
+    STAGING_DIR="${LISTS_DIR}/.${TMPNAME}.staging"
     if ! [ -d "${LISTS_DIR}" ]; then
         mkdir -p "${LISTS_DIR}"
         if [ "${ACTIVATE}" -eq 1 ]; then
@@ -357,10 +606,81 @@ function prepare() {
         fi
     fi
 
-    if [ -z "${URLS[*]:-}" ]; then
+    # installing bundles and analyzing filterfiles does not download any list
+    if [ -z "${URLS[*]:-}" ] && [ "${method}" != "import_bundle" ] && [ "${method}" != "analyze" ]; then
         error "no URLs given. Either provide -u or set environment variable URLS."
         exit 3
     fi
+    if ! [[ "${PARALLEL_DOWNLOADS}" =~ ^[1-9][0-9]*$ ]]; then
+        error "PARALLEL_DOWNLOADS must be a positive number, got '${PARALLEL_DOWNLOADS}'."
+        exit 3
+    fi
+    # privoxy cannot handle more than 2000 or-connected strings within one regex
+    if ! [[ "${FILTER_MAX_SELECTORS}" =~ ^[1-9][0-9]*$ ]] || [ "${FILTER_MAX_SELECTORS}" -gt 2000 ]; then
+        error "FILTER_MAX_SELECTORS must be a number between 1 and 2000, got '${FILTER_MAX_SELECTORS}'."
+        exit 3
+    fi
+    if ! [[ "${FILTER_MAX_BYTES}" =~ ^[1-9][0-9]*$ ]]; then
+        error "FILTER_MAX_BYTES must be a positive number, got '${FILTER_MAX_BYTES}'."
+        exit 3
+    fi
+    if ! [[ "${REFRESH_INTERVAL}" =~ ^[0-9]+$ ]] || ! [[ "${REFRESH_JITTER}" =~ ^[0-9]+$ ]]; then
+        error "REFRESH_INTERVAL and REFRESH_JITTER must be numbers, got '${REFRESH_INTERVAL}' and '${REFRESH_JITTER}'."
+        exit 3
+    fi
+    for entry in "${REFRESH_INTERVALS[@]:-}"; do
+        if [ -n "${entry}" ] && ! [[ "${entry}" =~ .=[1-9][0-9]*$ ]]; then
+            error "REFRESH_INTERVALS must contain entries like 'URL=seconds' or 'list=seconds', got '${entry}'."
+            exit 3
+        fi
+    done
+    if ! [[ "${SCHEDULER_MIN_SLEEP}" =~ ^[1-9][0-9]*$ ]]; then
+        error "SCHEDULER_MIN_SLEEP must be a positive number, got '${SCHEDULER_MIN_SLEEP}'."
+        exit 3
+    fi
+    if [ "${method}" = "schedule" ] && [ -z "${CACHE_DIR}" ]; then
+        error "Scheduler Mode keeps the expiry of each list within the cache. Either provide -k or set CACHE_DIR."
+        exit 3
+    fi
+    if [ "${method}" = "schedule" ] && [ "${REFRESH_INTERVAL}" -eq 0 ]; then
+        # lists without expiry would be downloaded again after each SCHEDULER_MIN_SLEEP otherwise
+        REFRESH_INTERVAL=86400
+        debug 1 "Lists without expiry are refreshed after ${REFRESH_INTERVAL} seconds within Scheduler Mode."
+    fi
+    if [ "${STREAMING}" -eq 1 ] && grep -q '_domain' <(printf '%s\n' "${FILTERS[@]}"); then
+        info "Domain based content filters are not supported while streaming, skipping them."
+    fi
+    case "${ENGINE}" in
+        "shell") ;;
+        "python")
+            if [ "${STREAMING}" -eq 1 ]; then
+                info "The python engine does not support streaming, converting lists with the shell engine."
+            elif ! run_python -c 'import privoxy_blocklist' 2> /dev/null; then
+                error "The python engine needs python3 and the package privoxy_blocklist within $(dirname "$(readlink -f "${0}")"). Exit"
+                exit 1
+            fi
+            ;;
+        *)
+            error "ENGINE must be either 'shell' or 'python', got '${ENGINE}'."
+            exit 3
+            ;;
+    esac
+    if [ -n "${PRUNE_LOGS[*]:-}" ]; then
+        if ! [[ "${PRUNE_DAYS}" =~ ^[0-9]+$ ]]; then
+            error "PRUNE_DAYS must be a number, got '${PRUNE_DAYS}'."
+            exit 3
+        fi
+        for log in "${PRUNE_LOGS[@]}"; do
+            if ! [ -r "${log}" ]; then
+                error "Privoxy log ${log} is not readable."
+                exit 3
+            fi
+        done
+        if ! run_python -c 'import privoxy_blocklist' 2> /dev/null; then
+            error "Pruning lists needs python3 and the package privoxy_blocklist within $(dirname "$(readlink -f "${0}")"). Exit"
+            exit 1
+        fi
+    fi
     if [ -z "${TMPDIR:-}" ]; then
         error "no TMPDIR given. Either provide -t or set environment variable TMPDIR."
         exit 3
@@ -369,6 +689,24 @@ function prepare() {
         error "no PRIVOXY_CONF given. Either provide -p or set environment variable PRIVOXY_CONF."
         exit 3
     fi
+
+    if [ -n "${CACHE_DIR}" ] && ! [ -d "${CACHE_DIR}" ]; then
+        mkdir -p "${CACHE_DIR}"
+        chmod 700 "${CACHE_DIR}"
+    fi
+    if [ -n "${TIMINGS_FILE}" ] && ! [ -d "$(dirname "${TIMINGS_FILE}")" ]; then
+        mkdir -p "$(dirname "${TIMINGS_FILE}")"
+    fi
+    if [ -n "${METRICS_FILE}" ] && ! [ -d "$(dirname "${METRICS_FILE}")" ]; then
+        mkdir -p "$(dirname "${METRICS_FILE}")"
+    fi
+    if [ -n "${BUNDLE_FILE}${IMPORT_BUNDLE}" ] && ! type -p tar > /dev/null; then
+        error "The command 'tar' can't be found, but is needed for bundles. Please install the package providing 'tar' and run $0 again. Exit"
+        exit 1
+    fi
+    if [ -n "${BUNDLE_FILE}" ] && ! [ -d "$(dirname "${BUNDLE_FILE}")" ]; then
+        mkdir -p "$(dirname "${BUNDLE_FILE}")"
+    fi
 }
 
 function debug() {
@@ -397,476 +735,1392 @@ function filter_active() {
 }
 
 # shellcheck disable=SC2317
-function main() {
-    for url in "${URLS[@]}"; do
-        debug 0 "Processing ${url} ..."
-        file="${TMPDIR}/$(basename "${url}")"
-        address_file="${file}.address"
-        address_except_file="${file}.address_except"
-        url_file="${file}.url"
-        url_except_file="${file}.url_except"
-        domain_name_file="${file}.domain"
-        domain_name_except_file="${file}.domain_except"
-        regex_file="${file}.regex"
-        regex_except_file="${file}.regex_except"
-        html_file="${file}.html"
-        html_except_file="${file}.html_except"
-        actionfile=${file%\.*}.script.action
-        filterfile=${file%\.*}.script.filter
-        list="$(basename "${file%\.*}")"
+function checksum() {
+    # print SHA256 checksum of stdin
+    if type -p sha256sum > /dev/null; then
+        sha256sum | cut -d' ' -f1
+    else
+        shasum -a 256 | cut -d' ' -f1
+    fi
+}
 
-        # download list
-        debug 0 "Downloading ${url} ..."
-        wget -t 3 --no-check-certificate -O "${file}" "${url}" > "${TMPDIR}/wget-${url//\//\#}.log" 2>&1
-        debug 2 "$(cat "${TMPDIR}/wget-${url//\//\#}.log")"
-        debug 0 ".. downloading done."
-        if ! grep -qE '^.*\[Adblock.*\].*$' "${file}"; then
-            info "The list recieved from ${url} does not contain AdblockPlus list header. Try to process anyway."
+# shellcheck disable=SC2317
+function read_list() {
+    # print given downloaded list, gzip compressed lists are decompressed while reading
+    #   lists are kept compressed as downloaded to reduce the size of TMPDIR and CACHE_DIR
+    if [ "$(head -c 2 "$1" | od -An -tx1 | tr -d ' \n')" = "1f8b" ]; then
+        gzip -dc "$1"
+    else
+        cat "$1"
+    fi
+}
+
+# shellcheck disable=SC2317
+function now() {
+    # print current time in microseconds
+    #   EPOCHREALTIME is available since bash 5.0, its decimal separator depends on the locale
+    if [ -n "${EPOCHREALTIME:-}" ]; then
+        echo "${EPOCHREALTIME//[.,]/}"
+    else
+        echo "$(($(date +%s) * 1000000))"
+    fi
+}
+
+# shellcheck disable=SC2317
+function since() {
+    # print seconds since given time in microseconds
+    local elapsed
+    elapsed="$(($(now) - $1))"
+    printf '%d.%06d\n' "$((elapsed / 1000000))" "$((elapsed % 1000000))"
+}
+
+# shellcheck disable=SC2317
+function escape() {
+    # print given string with backslashes and double quotes escaped for JSON strings and Prometheus labels
+    local value="${1//\\/\\\\}"
+    echo "${value//\"/\\\"}"
+}
+
+# shellcheck disable=SC2317
+function timing() {
+    # append wall time of given stage of current list since given start as JSON line to TIMINGS_FILE
+    #   bytes are the size of all given files, rules the given number or the number of lines of all given files
+    local bytes=0 rules seconds stage
+    if [ -z "${TIMINGS_FILE}" ]; then
+        return 0
+    fi
+    seconds="$(since "$2")"
+    stage="$1"
+    rules="$3"
+    shift 3
+    if [ "$#" -gt 0 ]; then
+        bytes="$(cat "$@" 2> /dev/null | wc -c || true)"
+        if [ -z "${rules}" ]; then
+            rules="$(cat "$@" 2> /dev/null | wc -l || true)"
+        fi
+    fi
+    printf '{"run":%d,"list":"%s","stage":"%s","seconds":%s,"bytes":%d,"rules":%d}\n' \
+        "$((RUN_START / 1000000))" "$(escape "${list}")" "${stage}" "${seconds}" "${bytes}" "${rules:-0}" >> "${TIMINGS_FILE}"
+}
+
+# shellcheck disable=SC2317
+function metric() {
+    # collect given sample of given metric, written to METRICS_FILE by write_metrics
+    if [ -z "${METRICS_FILE}" ]; then
+        return 0
+    fi
+    echo "privoxy_blocklist_$1 $2" >> "${TMPDIR}/metrics"
+}
+
+# shellcheck disable=SC2317
+function download_metrics() {
+    # collect transferred bytes, duration and status of download of current list since given start
+    local bytes=0 label start status
+    if [ -z "${METRICS_FILE}" ]; then
+        return 0
+    fi
+    status="$1"
+    start="$2"
+    label="list=\"$(escape "${list}")\""
+    if [ "${status}" -eq 0 ]; then
+        bytes="$(wc -c < "${file}")"
+    fi
+    metric "download_duration_seconds{${label}}" "$(since "${start}")"
+    metric "download_bytes{${label}}" "$((bytes))"
+    metric "download_status{${label}}" "${status}"
+}
+
+# shellcheck disable=SC2317
+function rule_metrics() {
+    # collect number of rules per bucket and number of jobs per content filter of current list from given action- and filterfile
+    #   rules of content filters are the number of selectors named in the description of each filter
+    #   all domain based filters are counted as content filter "domain"
+    if [ -z "${METRICS_FILE}" ]; then
+        return 0
+    fi
+    LIST="$(escape "${list}")" TYPES="${FILTERTYPES[*]}" awk '
+        BEGIN {
+            type_count = split(ENVIRON["TYPES"], types, " ")
+            split("block exception image_exception", buckets, " ")
+            for (i = 1; i in buckets; i++) {
+                rules[buckets[i]] = 0
+            }
+            label = "{list=\"" ENVIRON["LIST"] "\","
+        }
+        FNR == 1 {
+            action = (FILENAME ~ /action$/)
+            bucket = ""
+            filter = ""
+        }
+        action && /^[{].*[}]$/ {
+            bucket = ""
+            if ($0 ~ /handle-as-image/) {
+                bucket = "image_exception"
+            } else if ($0 ~ /^[{] -block [}]$/) {
+                bucket = "exception"
+            } else if ($0 ~ /^[{] [+]block[{]/) {
+                bucket = "block"
+            }
+            next
+        }
+        action {
+            if (bucket != "" && $0 != "" && $0 !~ /^#/) {
+                rules[bucket]++
+            }
+            next
+        }
+        /^FILTER: / {
+            filter = ""
+            for (i = 1; i <= type_count; i++) {
+                if (substr($2, length($2) - length(types[i])) == "_" types[i]) {
+                    filter = types[i]
+                }
+            }
+            # domain based filters combine all content filters of one domain
+            if (filter == "" && $2 ~ /_domain_[^_]*$/) {
+                filter = "domain"
+            }
+            if (filter != "" && match($0, /[(][0-9]+ selectors[)]/)) {
+                rules[filter] += substr($0, RSTART + 1, RLENGTH - 1)
+                jobs[filter] += 0
+            }
+            next
+        }
+        filter != "" && /^s@/ {
+            jobs[filter]++
+        }
+        END {
+            for (bucket in rules) {
+                printf "privoxy_blocklist_rules%sbucket=\"%s\"} %d\n", label, bucket, rules[bucket]
+            }
+            for (filter in jobs) {
+                printf "privoxy_blocklist_filter_jobs%sfilter=\"%s\"} %d\n", label, filter, jobs[filter]
+            }
+        }
+    ' "$1" "$2" >> "${TMPDIR}/metrics"
+}
+
+# shellcheck disable=SC2317
+function write_metrics() {
+    # write collected metrics of this run with given exit status atomically to METRICS_FILE
+    #   samples of each metric are grouped below its HELP and TYPE line as required by Prometheus text format
+    local help last_success metric_name status
+    if [ -z "${METRICS_FILE}" ]; then
+        return 0
+    fi
+    status="$1"
+    metric "run_duration_seconds" "$(since "${RUN_START}")"
+    metric "last_run_timestamp_seconds" "$(date +%s)"
+    metric "last_run_status" "${status}"
+    if [ "${status}" -eq 0 ]; then
+        last_success="$(date +%s)"
+    else
+        # keep time of last successful run from previous metrics
+        last_success="$(sed -n 's/^privoxy_blocklist_last_success_timestamp_seconds //p' "${METRICS_FILE}" 2> /dev/null || true)"
+    fi
+    if [ -n "${last_success}" ]; then
+        metric "last_success_timestamp_seconds" "${last_success}"
+    fi
+    while read -r metric_name help; do
+        if grep -q "^privoxy_blocklist_${metric_name}[{ ]" "${TMPDIR}/metrics"; then
+            echo "# HELP privoxy_blocklist_${metric_name} ${help}"
+            echo "# TYPE privoxy_blocklist_${metric_name} gauge"
+            grep "^privoxy_blocklist_${metric_name}[{ ]" "${TMPDIR}/metrics"
+        fi
+    done > "${METRICS_FILE}.$$" << EOF
+run_duration_seconds Wall time of the last run in seconds.
+last_run_timestamp_seconds Unix time of the end of the last run.
+last_run_status Exit status of the last run, 0 on success.
+last_success_timestamp_seconds Unix time of the end of the last successful run.
+download_duration_seconds Wall time of the download of each list in seconds.
+download_bytes Bytes transferred by the download of each list, 0 if not modified.
+download_status Exit status of wget for each list, 304 if not modified.
+rules Number of rules of each list per bucket, content filter buckets count selectors.
+filter_jobs Number of regex jobs of each list per content filter.
+changed_files Number of installed action- and filterfiles whose content changed.
+EOF
+    # textfile collectors only read *.prom files, renaming within the same directory is atomic
+    chmod 644 "${METRICS_FILE}.$$"
+    mv "${METRICS_FILE}.$$" "${METRICS_FILE}"
+}
+
+# shellcheck disable=SC2317
+function cache_path() {
+    # return path of cached list for given URL
+    echo "${CACHE_DIR}/${1//\//\#}"
+}
+
+# shellcheck disable=SC2317
+function cache_expires() {
+    # store expiration time of cached list of given URL and list name
+    #   the interval of the list within REFRESH_INTERVALS is used first, then the update frequency of its header
+    #   AdblockPlus lists define their update frequency by e.g. '! Expires: 4 days (update frequency)'
+    #   lists without both expire after REFRESH_INTERVAL, if set, REFRESH_JITTER spreads refreshes of many hosts
+    local cache_file entry expires interval="" list url unit
+    cache_file="$1"
+    url="$2"
+    list="$3"
+    for entry in "${REFRESH_INTERVALS[@]:-}"; do
+        # URLs may contain '=', thus the interval is taken from the last one
+        if [ "${entry%=*}" = "${url}" ] || [ "${entry%=*}" = "${list}" ]; then
+            interval="${entry##*=}"
+        fi
+    done
+    if [ -z "${interval}" ]; then
+        # sed stops reading at the first match, thus ignore the broken pipe of decompressing lists
+        expires="$(read_list "${cache_file}" | sed -n '/^!\s*Expires:\s*[0-9]/{s/^!\s*Expires:\s*\([0-9][0-9]*\)\s*\([a-zA-Z]*\).*/\1 \2/p;q}' || true)"
+        if [ -n "${expires}" ]; then
+            unit="${expires#* }"
+            case "${unit,,}" in
+                "h"*)
+                    interval="$((${expires%% *} * 3600))"
+                    ;;
+                *)
+                    interval="$((${expires%% *} * 86400))"
+                    ;;
+            esac
+        elif [ "${REFRESH_INTERVAL}" -gt 0 ]; then
+            interval="${REFRESH_INTERVAL}"
         fi
+    fi
+    if [ -z "${interval}" ]; then
+        rm -f "${cache_file}.expires"
+        return 0
+    fi
+    echo "$(($(date +%s) + interval + (RANDOM * 32768 + RANDOM) % (REFRESH_JITTER + 1)))" > "${cache_file}.expires"
+}
 
-        # remove comments
-        sed -i '/^!.*/d;1,1 d' "${file}"
-        set +e
-        # generate rule based files
+# shellcheck disable=SC2317
+function cache_store() {
+    # store downloaded list with its validators taken from wget server response log
+    local cache_file file list log_file url
+    file="$1"
+    log_file="$2"
+    cache_file="$3"
+    url="$4"
+    list="$5"
+    cp "${file}" "${cache_file}"
+    sed -n 's/^\s*ETag:\s*\(.*\)\s*$/\1/Ip' "${log_file}" | tail -n 1 > "${cache_file}.etag"
+    sed -n 's/^\s*Last-Modified:\s*\(.*\)\s*$/\1/Ip' "${log_file}" | tail -n 1 > "${cache_file}.last_modified"
+    cache_expires "${cache_file}" "${url}" "${list}"
+}
+
+# shellcheck disable=SC2317
+function download() {
+    # download given URL into given file while logging into per-URL log & status file
+    #   status 304 marks lists which did not change since last run
+    local cache_file file list log_file start status url wget_args=()
+    start="$(now)"
+    url="$1"
+    file="$2"
+    list="$(basename "${file%\.*}")"
+    log_file="${TMPDIR}/wget-${url//\//\#}.log"
+    rm -f "${log_file}.status"
+    if [ -n "${CACHE_DIR}" ]; then
+        cache_file="$(cache_path "${url}")"
+        if [ -f "${cache_file}" ] && [ "$(cat "${cache_file}.expires" 2> /dev/null || echo 0)" -gt "$(date +%s)" ]; then
+            echo "List of ${url} has not expired yet, using cached version." > "${log_file}"
+            cp "${cache_file}" "${file}"
+            timing "download" "${start}" "" "${file}"
+            download_metrics 304 "${start}"
+            echo 304 > "${log_file}.status"
+            return 0
+        fi
+        if [ -f "${cache_file}" ]; then
+            if [ -s "${cache_file}.etag" ]; then
+                wget_args+=("--header" "If-None-Match: $(< "${cache_file}.etag")")
+            fi
+            if [ -s "${cache_file}.last_modified" ]; then
+                wget_args+=("--header" "If-Modified-Since: $(< "${cache_file}.last_modified")")
+            fi
+        fi
+        # print server response to read validators and response code from log
+        wget_args+=("-S")
+    fi
+    # lists are compressed about 4:1, the response is stored as received and decompressed by read_list
+    wget_args+=("--header" "Accept-Encoding: gzip")
+    if wget -t 3 --no-check-certificate "${wget_args[@]}" -O "${file}" "${url}" > "${log_file}" 2>&1; then
+        status=0
+    else
+        status="$?"
+    fi
+    if [ -n "${CACHE_DIR}" ]; then
+        if [ "$(sed -n 's/^\s*HTTP\/[0-9.]*\s\s*\([0-9][0-9]*\).*/\1/p' "${log_file}" | tail -n 1)" = "304" ]; then
+            cp "${cache_file}" "${file}"
+            cache_expires "${cache_file}" "${url}" "${list}"
+            status=304
+        elif [ "${status}" -eq 0 ]; then
+            cache_store "${file}" "${log_file}" "${cache_file}" "${url}" "${list}"
+        fi
+    fi
+    timing "download" "${start}" "" "${file}"
+    download_metrics "${status}" "${start}"
+    echo "${status}" > "${log_file}.status"
+}
+
+# shellcheck disable=SC2317
+function fetch() {
+    # download all lists in parallel limited by PARALLEL_DOWNLOADS
+    local url
+    for url in "${URLS[@]}"; do
+        while [ "$(jobs -rp | wc -l)" -ge "${PARALLEL_DOWNLOADS}" ]; do
+            wait -n || true
+        done
+        debug 0 "Downloading ${url} ..."
+        download "${url}" "${TMPDIR}/$(basename "${url%.gz}")" &
+    done
+    wait
+    debug 0 ".. downloading done."
+}
+
+# shellcheck disable=SC2317
+function classify() {
+    # sort all rules of given list into rule based files within one pass
+    #   rules are written into every matching file, counts of each type are printed
+    #   rules are read from the optional second argument instead of the list, e.g. "-" for stdin
+    awk -v prefix="$1" '
+        BEGIN {
+            split("domain domain_except address address_except url url_except regex regex_except html html_except image_except", types, " ")
+            for (i in types) {
+                count[types[i]] = 0
+                printf "" > (prefix "." types[i])
+            }
+        }
+        function add(type) {
+            print > (prefix "." type)
+            count[type]++
+        }
         ## domain-name block
-        grep -E '^\|\|.*' "${file}" > "${domain_name_file}"
-        grep -E '^@@\|\|.*' "${file}" > "${domain_name_except_file}"
+        /^[|][|]/ { add("domain") }
+        /^@@[|][|]/ { add("domain_except") }
         ## exact address block
-        grep -E '^\|[^|].*\|' "${file}" > "${address_file}"
-        grep -E '^@@\|[^|].*\|' "${file}" > "${address_except_file}"
+        /^[|][^|].*[|]/ { add("address") }
+        /^@@[|][^|].*[|]/ { add("address_except") }
         ## url block
-        grep '^/[^^]' "${file}" > "${url_file}"
-        grep '^@@/[^^]' "${file}" > "${url_except_file}"
+        /^\/[^^]/ { add("url") }
+        /^@@\/[^^]/ { add("url_except") }
         ## regex block
-        grep '^/^' "${file}" > "${regex_file}"
-        grep '^@@/^' "${file}" > "${regex_except_file}"
+        /^\/\^/ { add("regex") }
+        /^@@\/\^/ { add("regex_except") }
         ## html element block
-        grep -E '^.*##.+' "${file}" > "${html_file}"
-        grep -E '^.*#@#.+' "${file}" > "${html_except_file}"
-        set -e
-
-        # convert AdblockPlus list to Privoxy list
-        # blocklist of urls
-        debug 1 "Creating actionfile for ${list} ..."
-        echo "{ +block{${list}} }" > "${actionfile}"
-        sed '
-        # skip domains with additional filter definition
-        /\$.*/d
-        # skip domains with HTML filter
-        /#/d
-        # replace characters to match Privoxy domain syntax
-        s/\?/\\?/g;s/\*/.*/g;s/(/\\(/g;s/)/\\)/g;s/\[/\\[/g;s/\]/\\]/g
-        # replace marking seperator of Adblock
-        s/\^$//g
-        # replace domain matcher
-        s/^||/\./g
-        ' "${domain_name_file}" >> "${actionfile}"
-        sed '
-        # skip domains with additional filter definition
-        /\$.*/d
-        # skip domains with HTML filter
-        /#/d
-        # replace characters to match Privoxy domain syntax
-        s/\?/\\?/g;s/\*/.*/g;s/(/\\(/g;s/)/\\)/g;s/\[/\\[/g;s/\]/\\]/g
-        # replace marking seperator of Adblock
-        s/\^$//g
-        # handle exact domain matching
-        s/^|\([^|][^|]*\)|/^\1\$/g;s/|$/\$/g
-        ' "${address_file}" >> "${actionfile}"
-
-        echo > "${filterfile}"
-        if [ -n "${FILTERS[*]}" ]; then
-            debug 1 "... creating filterfile for ${list} ..."
-            if filter_active "class_global"; then
-                debug 1 "... processing global 'class'-matches ..."
-                (
-                    # allow handling of left-over lines from last while-loop-run
-                    shopt -s lastpipe
-                    echo "FILTER: ${list}_class_global Tag filter of ${list}"
-                    lines=()
-                    # using while-loop as privoxy cannot handle more than 2000 or-connected strings within one regex
-                    sed -e '
-                        # only process gloabl class matches
-                        /^##\..*/!d
-                        # remove all combinations with attribute matching
-                        /^##\..*\[.*/d
-                        # remove all matches with combinators
-                        /^##\..*[>+~ :].*/d
-                        # cleanup
-                        s/^##\.//g
-                        # prepare regex merging
-                        s/$/|/
-                    ' "${html_file}" | while read -r line; do
-                        # number of matches within one rule impacts runtime of each request to modify the content
-                        if [ "${#lines[@]}" -lt 1000 ]; then
-                            lines+=("${line}")
-                            continue
-                        fi
-                        # complexity of regex impacts runtime of each request to modify the content
-                        # using removal of whole HTML tag as multiple matches with different classes in same element are not possible
-                        # printf to inject both quoting characters " and '
-                        printf 's@<([a-zA-Z0-9]+)\\s+.*class=[%s][^%s]*(' "\"'" "\"'"
-                        # using tr to merge lines because sed-based approachs takes up to 6 MB RAM and >10 seconds during testing
-                        printf '%s\n' "${lines[@]}" | sed '$ s/|//' | tr -d '\n'
-                        # printf to inject both quoting characters " and '
-                        printf ')[^%s]*[%s].*>.*<\/\\1[^>]*>@@g\n' "\"'" "\"'"
-                        lines=()
-                    done
-                    # process last chunk with less than 1000 entries
-                    if [ "${#lines[@]}" -gt 0 ]; then
-                        printf 's@<([a-zA-Z0-9]+)\\s+.*class=[%s][^%s]*(' "\"'" "\"'"
-                        printf '%s\n' "${lines[@]}" | sed '$ s/|//' | tr -d '\n'
-                        printf ')[^%s]*[%s].*>.*<\/\\1[^>]*>@@g\n' "\"'" "\"'"
-                    fi
-                    shopt -u lastpipe
-                ) >> "${filterfile}"
-
-                debug 1 "... registering ${list}_class_global in actionfile ..."
-                (
-                    echo "{ +filter{${list}_class_global} }"
-                    echo "/"
-                ) >> "${actionfile}"
-                debug 1 "... registered ..."
-                # FIXME: add class handling with domains
-                # FIXME: add class handling with combinators
-                # FIXME: add class with defined HTML tag ?
-                # FIXME: add class with cascading
+        /##./ { add("html") }
+        /#@#./ { add("html_except") }
+        ## image allowlist
+        /^@@.*\$.*image/ { add("image_except") }
+        END {
+            for (i = 1; i in types; i++) {
+                printf "%s=%d\n", types[i], count[types[i]]
+            }
+        }
+    ' "${2:-$1}"
+}
+
+# shellcheck disable=SC2317
+function split_selectors() {
+    # sort HTML element rules of given file into one file per content filter within one pass
+    #   rules are written into every matching file as selectors prepared for regex merging
+    local html_file="$1"
+    sed -n '
+        # keep original rule to process it for each content filter
+        h
+
+        # only process gloabl class matches
+        /^##\..*/!b id_global
+        # remove all combinations with attribute matching
+        /^##\..*\[.*/b id_global
+        # remove all matches with combinators
+        /^##\..*[>+~ :].*/b id_global
+        # cleanup
+        s/^##\.//g
+        # prepare regex merging
+        s/$/|/
+        w '"${html_file}"'.class_global
+
+        :id_global
+        g
+        # only process gloabl id-only matches
+        /^###.*/!b attribute_global_name
+        # remove all matches with combinators
+        /^###.*[>+~ ].*/b attribute_global_name
+        # cleanup
+        s/^###//g
+        # prepare regex merging
+        s/$/|/
+        w '"${html_file}"'.id_global
+
+        :attribute_global_name
+        g
+        # only process gloabl attributes
+        /^##\[[^=][^=]*$/!b attribute_global_exact
+        # remove all matches with combinators
+        /^##.*[>+~ ].*/b attribute_global_exact
+        # cleanup
+        s/^##//g
+        # convert attribute name-only matches
+        s/^\[\([^=][^=]*\)\]/\1/g
+        # convert dots
+        s/\.\([^\.]\)/\\.\1/g
+        # convert combined attribute name-only matches (e.g. ##[data-freestar-ad][id])
+        s/\]\s*\[/[^>]*/g
+        s/$/|/
+        w '"${html_file}"'.attribute_global_name
+
+        :attribute_global_exact
+        g
+        # only process gloabl classes
+        /^##\[[^=^*][^=^*]*=.*$/!b attribute_global_contain
+        # remove all matches with combinators
+        /^##.*[>+~ ].*/b attribute_global_contain
+        # cleanup
+        s/^##//g
+        # convert attribute name-only matches
+        s/^\[\([^=][^=]*\)=\(.*\)\]/\1=\2/g
+        # convert dots
+        s/\.\([^\.]\)/\\.\1/g
+        s/$/|/
+        w '"${html_file}"'.attribute_global_exact
+
+        :attribute_global_contain
+        g
+        # only process gloabl classes
+        /^##\[[^*][^*]*\*=.*$/!b attribute_global_startswith
+        # remove all matches with combinators
+        /^##.*[>+~ ].*/b attribute_global_startswith
+        # cleanup
+        s/^##//g
+        # convert dots
+        s/\.\([^\.]\)/\\.\1/g
+        # convert attribute based filter with contain match
+        s/^\[\([^*][^*]*\)\*=\(["'"'"']*\)\([^"][^"]*\)"*\(["'"'"']*\)\]/\1=\2[^>]*\3[^>]*\4/g
+        s/$/|/
+        w '"${html_file}"'.attribute_global_contain
+
+        :attribute_global_startswith
+        g
+        # only process gloabl classes
+        /^##\[[^=^][^=^]*\^=.*$/!b attribute_global_endswith
+        # remove all matches with combinators
+        /^##.*[>+~ ].*/b attribute_global_endswith
+        # cleanup
+        s/^##//g
+        # convert dots
+        s/\.\([^\.]\)/\\.\1/g
+        # convert attribute based filter with startwith match
+        s/^\[\([^^][^^]*\)^=\(["'"'"']*\)\(.*[^"'"'"']\)\(["'"'"']*\)\]/\1=\2\3[^>]*\4/g
+        s/$/|/
+        w '"${html_file}"'.attribute_global_startswith
+
+        :attribute_global_endswith
+        g
+        # only process gloabl classes
+        /^##\[[^$][^=$]*\$=.*$/!d
+        # remove all matches with combinators
+        /^##.*[>+~ ].*/d
+        # cleanup
+        s/^##//g
+        # convert dots
+        s/\.\([^\.]\)/\\.\1/g
+        # convert attribute based filter with endswith match
+        s/^\[\([^\$][^\$]*\)\$=\(["'"'"']*\)\(.*[^"'"'"']\)\(["'"'"']*\)\]/\1=\2[^>]*\3\4/g
+        s/$/|/
+        w '"${html_file}"'.attribute_global_endswith
+    ' "${html_file}"
+}
+
+# shellcheck disable=SC2317
+function job_template() {
+    # set job_prefix and job_suffix of the caller to the regex template of given content filter
+    # complexity of regex impacts runtime of each request to modify the content
+    # using removal of whole HTML tag as multiple matches with different classes in same element are not possible
+    # [^>]* keeps matching of attributes within the opening tag, .* backtracks across the whole line and may remove enclosing tags
+    # .*? removes content up to the first closing tag instead of the last one of the line, e.g. of minified pages
+    # printf to inject both quoting characters " and '
+    case "$1" in
+        "class_"*)
+            # FIXME: add class handling with combinators
+            # FIXME: add class with defined HTML tag ?
+            # FIXME: add class with cascading
+            job_prefix="$(printf 's@<([a-zA-Z0-9]+)\\s[^>]*class=[%s][^%s]*(' "\"'" "\"'")"
+            job_suffix="$(printf ')[^%s]*[%s][^>]*>.*?<\/\\1[^>]*>@@g' "\"'" "\"'")"
+            ;;
+        "id_"*)
+            # FIXME: add id handling with combinators
+            # FIXME: add id with cascading
+            job_prefix="$(printf 's@<([a-zA-Z0-9]+)\\s[^>]*id=[%s](' "\"'")"
+            job_suffix="$(printf ')[%s][^>]*>.*?<\/\\1[^>]*>@@g' "\"'")"
+            ;;
+        *)
+            # FIXME: add attribute handling with combinators
+            # FIXME: add combination of classes and attributes: ##.OUTBRAIN[data-widget-id^="FMS_REELD_"]
+            job_prefix="$(printf 's@<([a-zA-Z0-9]+)\\s[^>]*(')"
+            job_suffix="$(printf ')[^>]*>.*?<\/\\1[^>]*>@@g')"
+            ;;
+    esac
+}
+
+# shellcheck disable=SC2317
+function domain_selectors() {
+    # print element hiding rules of given file restricted to domains as one global rule per domain
+    #   the domain is appended after a "#", e.g. example.com,example.org##.ad becomes ##.ad#example.com and ##.ad#example.org
+    #   rules excluding domains by ~ are skipped as Privoxy cannot exclude hosts from a single selector
+    #   entity wildcards like example.* are converted to Privoxy's trailing dot matching any top-level domain
+    awk -F '##' '
+        $1 == "" || $1 ~ /~/ {
+            next
+        }
+        {
+            selector = substr($0, length($1) + 3)
+            count = split($1, domains, ",")
+            for (i = 1; i <= count; i++) {
+                domain = tolower(domains[i])
+                sub(/[.][*]$/, ".", domain)
+                if (domain ~ /^[a-z0-9][a-z0-9.-]*$/) {
+                    print "##" selector "#" domain
+                }
+            }
+        }
+    ' "$1"
+}
+
+# shellcheck disable=SC2317
+function domain_filters() {
+    # print one content filter per domain of given keyed selectors and jobs, keyed lines start with the domain
+    #   each filter is registered for its domain and all its subdomains in the actionfile
+    #   jobs must be sorted by domain, jobs of one domain keep their order
+    LIST="${list}" ACTIONFILE="${actionfile}" awk '
+        FILENAME == ARGV[1] {
+            selectors[$1]++
+            next
+        }
+        $1 != domain {
+            domain = $1
+            name = ENVIRON["LIST"] "_domain_" domain
+            gsub(/[^a-zA-Z0-9._-]/, "_", name)
+            # number of selectors is read by rule_metrics
+            print "FILTER: " name " Tag filter of " ENVIRON["LIST"] " for " domain " (" selectors[domain] " selectors)"
+            print "{ +filter{" name "} }" >> ENVIRON["ACTIONFILE"]
+            print "." domain >> ENVIRON["ACTIONFILE"]
+        }
+        {
+            print substr($0, length($1) + 2)
+        }
+    ' "$1" "$2"
+}
+
+# shellcheck disable=SC2317
+function merge_selectors() {
+    # merge sorted selectors read from stdin into jobs using given regex prefix and suffix
+    #   with "keyed" as third argument each selector is prefixed by a key and a space, e.g. its domain,
+    #   selectors of different keys never share a job and each job is prefixed by its key and a space
+    #   number of matches within one rule impacts runtime of each request to modify the content
+    #   size of each job is limited by FILTER_MAX_SELECTORS and FILTER_MAX_BYTES
+    #   common prefixes of selectors are factored into a trie-shaped regex, e.g. ad(?:-(?:banner|box)|vert),
+    #   which matches exactly the same strings as the flat alternation but lets PCRE drop branches early
+    JOB_PREFIX="$1" JOB_SUFFIX="$2" JOB_KEYED="${3:-}" JOB_MAX_SELECTORS="${FILTER_MAX_SELECTORS}" JOB_MAX_BYTES="${FILTER_MAX_BYTES}" awk '
+        # split selector into regex atoms including their quantifiers
+        #   returns -1 for selectors which cannot be factored safely (groups, alternations, braces)
+        function tokenize(selector, idx,    atom, end, n) {
+            n = 0
+            while (selector != "") {
+                atom = substr(selector, 1, 1)
+                if (atom ~ /[(){}|]/) {
+                    return -1
+                }
+                if (atom == "\\") {
+                    atom = substr(selector, 1, 2)
+                } else if (atom == "[") {
+                    end = 2
+                    if (substr(selector, end, 1) == "^") {
+                        end++
+                    }
+                    if (substr(selector, end, 1) == "]") {
+                        end++
+                    }
+                    while (end <= length(selector) && substr(selector, end, 1) != "]") {
+                        if (substr(selector, end, 1) == "\\") {
+                            end++
+                        }
+                        end++
+                    }
+                    if (end > length(selector)) {
+                        return -1
+                    }
+                    atom = substr(selector, 1, end)
+                }
+                selector = substr(selector, length(atom) + 1)
+                while (match(selector, /^[*+?][?+]?/)) {
+                    atom = atom substr(selector, 1, RLENGTH)
+                    selector = substr(selector, RLENGTH + 1)
+                }
+                tokens[idx, ++n] = atom
+            }
+            return n
+        }
+        # concatenate atoms of selector starting at given depth
+        function rest(idx, depth,    result) {
+            result = ""
+            for (; depth <= ntokens[idx]; depth++) {
+                result = result tokens[idx, depth]
+            }
+            return result
+        }
+        # build alternation of selectors first to last which share their first depth-1 atoms
+        function factor(first, last, depth, top,    alternatives, count, idx, next_idx, optional, result) {
+            count = 0
+            optional = 0
+            idx = first
+            while (idx <= last) {
+                if (ntokens[idx] < depth) {
+                    # selector is a prefix of the following ones
+                    optional = 1
+                    idx++
+                    continue
+                }
+                next_idx = idx
+                while (next_idx < last && ntokens[next_idx + 1] >= depth && tokens[next_idx + 1, depth] == tokens[idx, depth]) {
+                    next_idx++
+                }
+                if (next_idx == idx) {
+                    alternatives[++count] = rest(idx, depth)
+                } else {
+                    alternatives[++count] = tokens[idx, depth] factor(idx, next_idx, depth + 1, 0)
+                }
+                idx = next_idx + 1
+            }
+            result = alternatives[1]
+            for (idx = 2; idx <= count; idx++) {
+                result = result "|" alternatives[idx]
+            }
+            if (top || (count == 1 && !optional)) {
+                return result
+            }
+            return "(?:" result ")" (optional ? "?" : "")
+        }
+        # print job of selectors first to last followed by given unfactored selectors
+        #   jobs exceeding the byte budget are split in halves as factoring adds groups to the regex
+        function emit(first, last, extra,    alternation, middle) {
+            alternation = first <= last ? factor(first, last, 1, 1) : ""
+            if (extra != "") {
+                alternation = alternation (alternation != "" ? "|" : "") extra
+            }
+            if (first < last && length(ENVIRON["JOB_PREFIX"] alternation ENVIRON["JOB_SUFFIX"]) > max_bytes) {
+                middle = int((first + last) / 2)
+                emit(first, middle, "")
+                emit(middle + 1, last, extra)
+                return
+            }
+            print (keyed ? key " " : "") ENVIRON["JOB_PREFIX"] alternation ENVIRON["JOB_SUFFIX"]
+        }
+        function flush() {
+            if (selectors == 0) {
+                return
+            }
+            emit(1, count, plain)
+            split("", tokens)
+            split("", ntokens)
+            count = 0
+            plain = ""
+            selectors = 0
+            bytes = length(ENVIRON["JOB_PREFIX"] ENVIRON["JOB_SUFFIX"])
+        }
+        BEGIN {
+            max_selectors = ENVIRON["JOB_MAX_SELECTORS"] + 0
+            max_bytes = ENVIRON["JOB_MAX_BYTES"] + 0
+            bytes = length(ENVIRON["JOB_PREFIX"] ENVIRON["JOB_SUFFIX"])
+            keyed = (ENVIRON["JOB_KEYED"] == "keyed")
+        }
+        {
+            if (keyed) {
+                # start a new job for each key
+                if (substr($0, 1, index($0, " ") - 1) != key) {
+                    flush()
+                    key = substr($0, 1, index($0, " ") - 1)
+                }
+                $0 = substr($0, index($0, " ") + 1)
+            }
+            # selectors end with "|" for regex merging
+            sub(/[|]$/, "")
+            if ($0 == "") {
+                next
+            }
+            # start a new job if the selector would exceed the byte budget of the current one
+            if (selectors > 0 && bytes + length($0) + 1 > max_bytes) {
+                flush()
+            }
+            if ((n = tokenize($0, count + 1)) < 0) {
+                plain = plain (plain != "" ? "|" : "") $0
+            } else {
+                ntokens[++count] = n
+            }
+            bytes += length($0) + 1
+            if (++selectors >= max_selectors) {
+                flush()
+            }
+        }
+        END {
+            flush()
+        }
+    '
+}
+
+# shellcheck disable=SC2317
+function domain_patterns() {
+    # convert domain-name block rules read from stdin into Privoxy patterns
+    sed '
+    # skip domains with additional filter definition
+    /\$.*/d
+    # skip domains with HTML filter
+    /#/d
+    # replace characters to match Privoxy domain syntax
+    s/\?/\\?/g;s/\*/.*/g;s/(/\\(/g;s/)/\\)/g;s/\[/\\[/g;s/\]/\\]/g
+    # replace marking seperator of Adblock
+    s/\^$//g
+    # replace domain matcher
+    s/^||/\./g
+    '
+}
+
+# shellcheck disable=SC2317
+function address_patterns() {
+    # convert exact address block rules read from stdin into Privoxy patterns
+    sed '
+    # skip domains with additional filter definition
+    /\$.*/d
+    # skip domains with HTML filter
+    /#/d
+    # replace characters to match Privoxy domain syntax
+    s/\?/\\?/g;s/\*/.*/g;s/(/\\(/g;s/)/\\)/g;s/\[/\\[/g;s/\]/\\]/g
+    # replace marking seperator of Adblock
+    s/\^$//g
+    # handle exact domain matching
+    s/^|\([^|][^|]*\)|/^\1\$/g;s/|$/\$/g
+    '
+}
+
+# shellcheck disable=SC2317
+function exception_patterns() {
+    # convert domain-name exception rules read from stdin into Privoxy patterns
+    sed 's/^@@//g;/\$.*/d;/#/d;s/\./\\./g;s/\?/\\?/g;s/\*/.*/g;s/(/\\(/g;s/)/\\)/g;s/\[/\\[/g;s/\]/\\]/g;s/\^/[\/\&:\?=_]/g;s/^||/\./g;s/^|/^/g;s/|$/\$/g;/|/d'
+}
+
+# shellcheck disable=SC2317
+function image_patterns() {
+    # convert image exception rules read from stdin into Privoxy patterns
+    sed '/^@@.*/!d;s/^@@//g;/\$.*image.*/!d;s/\$.*image.*//g;/#/d;s/\./\\./g;s/\?/\\?/g;s/\*/.*/g;s/(/\\(/g;s/)/\\)/g;s/\[/\\[/g;s/\]/\\]/g;s/\^/[\/\&:\?=_]/g;s/^||/\./g;s/^|/^/g;s/|$/\$/g;/|/d'
+}
+
+# shellcheck disable=SC2317
+function prune_domains() {
+    # append Privoxy patterns read from stdin to given file except patterns covered by a broader domain pattern
+    #   e.g. ".ads.example.com" and ".example.com/ads/" are covered by ".example.com"
+    #   uses a trie of reversed domain labels (com -> example -> ads) built from all patterns without path
+    #   exceptions in following sections still apply as they override every matching pattern of this section
+    #   number of removed patterns is printed
+    awk -v target="$1" '
+        function reverse_labels(host, labels, count, i, reversed) {
+            count = split(tolower(host), labels, ".")
+            reversed = labels[count]
+            for (i = count - 1; i > 0; i--) {
+                reversed = reversed "." labels[i]
+            }
+            return reversed
+        }
+        {
+            patterns[++count] = $0
+            host = $0
+            path = ""
+            if ((i = index(host, "/")) > 0) {
+                path = substr(host, i)
+                host = substr(host, 1, i - 1)
+            }
+            # only plain domain patterns without wildcards can cover or be covered
+            if (host !~ /^\.[a-zA-Z0-9_-]+(\.[a-zA-Z0-9_-]+)*$/) {
+                next
+            }
+            node[count] = reverse_labels(substr(host, 2))
+            has_path[count] = path != ""
+            if (!has_path[count]) {
+                trie[node[count]] = 1
+            }
+        }
+        END {
+            for (i = 1; i <= count; i++) {
+                if (patterns[i] in seen) {
+                    removed++
+                    continue
+                }
+                seen[patterns[i]] = 1
+                if (i in node) {
+                    parent = node[i]
+                    covered = has_path[i] && (parent in trie)
+                    while (!covered && sub(/\.[^.]*$/, "", parent)) {
+                        covered = parent in trie
+                    }
+                    if (covered) {
+                        removed++
+                        continue
+                    }
+                }
+                print patterns[i] >> target
+            }
+            print removed + 0
+        }
+    '
+}
+
+# shellcheck disable=SC2317
+function convert() {
+    # convert downloaded AdblockPlus list into Privoxy action- and filterfile
+    local address_file domain_name_except_file domain_name_file domains_file filter html_file image_except_file job_prefix job_suffix pruned selectors start
+    address_file="${file}.address"
+    domain_name_file="${file}.domain"
+    domain_name_except_file="${file}.domain_except"
+    html_file="${file}.html"
+    domains_file="${file}.html.domains"
+    image_except_file="${file}.image_except"
+    # generate rule based files
+    start="$(now)"
+    classify "${file}" > "${file}.counts"
+    timing "classify" "${start}" "" "${file}"
+    debug 1 "... rules per type: $(tr '\n' ' ' < "${file}.counts")"
+
+    # convert AdblockPlus list to Privoxy list
+    # blocklist of urls
+    debug 1 "Creating actionfile for ${list} ..."
+    start="$(now)"
+    echo "{ +block{${list}} }" > "${actionfile}"
+    pruned="$(domain_patterns < "${domain_name_file}" | prune_domains "${actionfile}")"
+    debug 1 "... removed ${pruned} block patterns covered by broader domain patterns ..."
+    address_patterns < "${address_file}" >> "${actionfile}"
+    timing "actions" "${start}" "" "${domain_name_file}" "${address_file}"
+
+    echo > "${filterfile}"
+    if [ -n "${FILTERS[*]}" ]; then
+        debug 1 "... creating filterfile for ${list} ..."
+        start="$(now)"
+        split_selectors "${html_file}"
+        timing "selectors" "${start}" "" "${html_file}"
+        for filter in "class_global" "id_global" "attribute_global_name" "attribute_global_exact" "attribute_global_contain" "attribute_global_startswith" "attribute_global_endswith"; do
+            if ! filter_active "${filter}"; then
+                continue
             fi
+            debug 1 "... processing '${filter}'-matches ..."
+            start="$(now)"
+            selectors="$(wc -l < "${html_file}.${filter}" | tr -d ' ')"
+            # number of selectors is read by rule_metrics
+            echo "FILTER: ${list}_${filter} Tag filter of ${list} (${selectors} selectors)" >> "${filterfile}"
+            job_template "${filter}"
+            # sorting groups selectors with common prefixes into the same job
+            sort -u "${html_file}.${filter}" \
+                | merge_selectors "${job_prefix}" "${job_suffix}" > "${html_file}.${filter}.jobs"
+            debug 1 "... merged ${selectors} '${filter}'-rules into $(wc -l < "${html_file}.${filter}.jobs" | tr -d ' ') jobs ..."
+            cat "${html_file}.${filter}.jobs" >> "${filterfile}"
+            timing "${filter}" "${start}" "${selectors}" "${html_file}.${filter}.jobs"
+
+            debug 1 "... registering ${list}_${filter} in actionfile ..."
+            (
+                echo "{ +filter{${list}_${filter}} }"
+                echo "/"
+            ) >> "${actionfile}"
+            debug 1 "... registered ..."
+        done
+    fi
 
-            if filter_active "id_global"; then
-                debug 1 "... processing global 'id'-matches ..."
-                echo "FILTER: ${list}_id_global Tag filter of ${list}" >> "${filterfile}"
-                (
-                    # allow handling of left-over lines from last while-loop-run
-                    shopt -s lastpipe
-                    lines=()
-                    # using while-loop as privoxy cannot handle more than 2000 or-connected strings within one regex
-                    sed -e '
-                        # only process gloabl id-only matches
-                        /^###.*/!d
-                        # remove all matches with combinators
-                        /^###.*[>+~ ].*/d
-                        # cleanup
-                        s/^###//g
-                        # prepare regex merging
-                        s/$/|/
-                    ' "${html_file}" | while read -r line; do
-                        # number of matches within one rule impacts runtime of each request to modify the content
-                        if [ "${#lines[@]}" -lt 1000 ]; then
-                            lines+=("$line")
-                            continue
-                        fi
-                        # complexity of regex impacts runtime of each request to modify the content
-                        # using removal of whole HTML tag as multiple matches with different classes in same element are not possible
-                        # printf to inject both quoting characters " and '
-                        printf 's@<([a-zA-Z0-9]+)\\s+.*id=[%s](' "\"'"
-                        # using tr to merge lines because sed-based approachs takes up to 6 MB RAM and >10 seconds during testing
-                        printf '%s\n' "${lines[@]}" | sed '$ s/|//' | tr -d '\n'
-                        # printf to inject both quoting characters " and '
-                        printf ')[%s].*>.*<\/\\1[^>]*>@@g\n' "\"'"
-                        lines=()
-                    done
-                    # process last chunk with less than 1000 entries
-                    if [ "${#lines[@]}" -gt 0 ]; then
-                        printf 's@<([a-zA-Z0-9]+)\\s+.*id=[%s](' "\"'"
-                        printf '%s\n' "${lines[@]}" | sed '$ s/|//' | tr -d '\n'
-                        printf ')[%s].*>.*<\/\\1[^>]*>@@g\n' "\"'"
-                    fi
-                    shopt -u lastpipe
-                ) >> "${filterfile}"
-
-                debug 1 "... registering ${list}_id_global in actionfile ..."
-                (
-                    echo "{ +filter{${list}_id_global} }"
-                    echo "/"
-                ) >> "${actionfile}"
-                debug 1 "... registered ..."
-                # FIXME: add id handling with domains
-                # FIXME: add id handling with combinators
-                # FIXME: add id with cascading
+    # create domain based filters
+    #   all rules of one domain are combined into one filter which is only activated for this domain
+    if grep -q '_domain' <(printf '%s\n' "${FILTERS[@]}"); then
+        debug 1 "... creating domain based filters for ${list} ..."
+        start="$(now)"
+        domain_selectors "${html_file}" > "${domains_file}"
+        split_selectors "${domains_file}"
+        : > "${domains_file}.selectors"
+        : > "${domains_file}.jobs"
+        for filter in "class_domain" "id_domain" "attribute_domain_name" "attribute_domain_exact" "attribute_domain_contain" "attribute_domain_startswith" "attribute_domain_endswith"; do
+            if ! filter_active "${filter}"; then
+                continue
             fi
+            job_template "${filter}"
+            # move domain in front of selector as key, dots of domains were escaped for attribute filters
+            #   C locale keeps all selectors of one domain together
+            sed 's/^\(.*\)#\([^#]*\)|$/\2 \1|/;h;s/ .*//;s/\\\././g;G;s/\n[^ ]*//' "${domains_file}.${filter/_domain/_global}" \
+                | LC_ALL=C sort -u > "${domains_file}.${filter}"
+            merge_selectors "${job_prefix}" "${job_suffix}" keyed < "${domains_file}.${filter}" >> "${domains_file}.jobs"
+            cat "${domains_file}.${filter}" >> "${domains_file}.selectors"
+        done
+        # stable sort keeps order of content filters within each domain
+        LC_ALL=C sort -s -k1,1 "${domains_file}.jobs" | domain_filters "${domains_file}.selectors" - >> "${filterfile}"
+        debug 1 "... merged $(wc -l < "${domains_file}.selectors" | tr -d ' ') domain based rules into $(grep -c '^FILTER: .*_domain_' "${filterfile}" || true) domain filters ..."
+        timing "domains" "${start}" "$(wc -l < "${domains_file}.selectors")" "${domains_file}.jobs"
+    fi
 
-            debug 1 "... processing 'attribute'-matches with no HTML tag ..."
-            (
-                shopt -s lastpipe
-
-                if filter_active "attribute_global_name"; then
-                    # allow handling of left-over lines from last while-loop-run
-                    echo "FILTER: ${list}_attribute_global_name Tag filter of ${list}"
-                    lines=()
-                    # using while-loop as privoxy cannot handle more than 2000 or-connected strings within one regex
-                    sed -e '
-                        # only process gloabl attributes
-                        /^##\[[^=][^=]*$/!d
-                        # remove all matches with combinators
-                        /^##.*[>+~ ].*/d
-                        # cleanup
-                        s/^##//g
-                        # convert attribute name-only matches
-                        s/^\[\([^=][^=]*\)\]/\1/g
-                        # convert dots
-                        s/\.\([^\.]\)/\\.\1/g
-                        # convert combined attribute name-only matches (e.g. ##[data-freestar-ad][id])
-                        s/\]\s*\[/.*/g
-                        s/$/|/
-                    ' "${html_file}" | sort -u | while read -r line; do
-                        # number of matches within one rule impacts runtime of each request to modify the content
-                        if [ "${#lines[@]}" -lt 1000 ]; then
-                            lines+=("$line")
-                            continue
-                        fi
-                        # complexity of regex impacts runtime of each request to modify the content
-                        # using removal of whole HTML tag as multiple matches with different classes in same element are not possible
-                        # printf to inject both quoting characters " and '
-                        printf 's@<([a-zA-Z0-9]+)\\s+.*('
-                        # using tr to merge lines because sed-based approachs takes up to 6 MB RAM and >10 seconds during testing
-                        printf '%s\n' "${lines[@]}" | sed '$ s/|//' | tr -d '\n'
-                        # printf to inject both quoting characters " and '
-                        printf ').*>.*<\/\\1[^>]*>@@g\n'
-                        lines=()
-                    done
-                    # process last chunk with less than 1000 entries
-                    if [ "${#lines[@]}" -gt 0 ]; then
-                        printf 's@<([a-zA-Z0-9]+)\\s+.*('
-                        printf '%s\n' "${lines[@]}" | sed '$ s/|//' | tr -d '\n'
-                        printf ').*>.*<\/\\1[^>]*>@@g\n'
-                    fi
-                fi
+    debug 1 "... creating and adding allowlist for urls ..."
+    start="$(now)"
+    # allowlist of urls
+    echo "{ -block }" >> "${actionfile}"
+    exception_patterns < "${domain_name_except_file}" >> "${actionfile}"
+    debug 1 "... created and added allowlist - creating and adding image handler ..."
+    # allowlist of image urls
+    echo "{ -block +handle-as-image }" >> "${actionfile}"
+    image_patterns < "${image_except_file}" >> "${actionfile}"
+    timing "exceptions" "${start}" "" "${domain_name_except_file}" "${image_except_file}"
+    debug 1 "... created and added image handler ..."
+    debug 1 "... created actionfile for ${list}."
+}
 
-                if filter_active "attribute_global_exact"; then
-                    echo "FILTER: ${list}_attribute_global_exact Tag filter of ${list}"
-                    lines=()
-                    # using while-loop as privoxy cannot handle more than 2000 or-connected strings within one regex
-                    sed -e '
-                        # only process gloabl classes
-                        /^##\[[^=^*][^=^*]*=.*$/!d
-                        # remove all matches with combinators
-                        /^##.*[>+~ ].*/d
-                        # cleanup
-                        s/^##//g
-                        # convert attribute name-only matches
-                        s/^\[\([^=][^=]*\)=\(.*\)\]/\1=\2/g
-                        # convert dots
-                        s/\.\([^\.]\)/\\.\1/g
-                        s/$/|/
-                    ' "${html_file}" | sort -u | while read -r line; do
-                        # number of matches within one rule impacts runtime of each request to modify the content
-                        if [ "${#lines[@]}" -lt 1000 ]; then
-                            lines+=("$line")
-                            continue
-                        fi
-                        # complexity of regex impacts runtime of each request to modify the content
-                        # using removal of whole HTML tag as multiple matches with different classes in same element are not possible
-                        # printf to inject both quoting characters " and '
-                        printf 's@<([a-zA-Z0-9]+)\\s+.*('
-                        # using tr to merge lines because sed-based approachs takes up to 6 MB RAM and >10 seconds during testing
-                        printf '%s\n' "${lines[@]}" | sed '$ s/|//' | tr -d '\n'
-                        # printf to inject both quoting characters " and '
-                        printf ').*>.*<\/\\1[^>]*>@@g\n'
-                        lines=()
-                    done
-                    # process last chunk with less than 1000 entries
-                    if [ "${#lines[@]}" -gt 0 ]; then
-                        printf 's@<([a-zA-Z0-9]+)\\s+.*('
-                        printf '%s\n' "${lines[@]}" | sed '$ s/|//' | tr -d '\n'
-                        printf ').*>.*<\/\\1[^>]*>@@g\n'
-                    fi
-                fi
+# shellcheck disable=SC2317
+function run_python() {
+    # run python3 with given arguments finding the package privoxy_blocklist next to this script
+    PYTHONPATH="$(dirname "$(readlink -f "${0}")")${PYTHONPATH:+":${PYTHONPATH}"}" python3 "$@"
+}
 
-                if filter_active "attribute_global_contain"; then
-                    echo "FILTER: ${list}_attribute_global_contain Tag filter of ${list}"
-                    lines=()
-                    # using while-loop as privoxy cannot handle more than 2000 or-connected strings within one regex
-                    sed -e '
-                        # only process gloabl classes
-                        /^##\[[^*][^*]*\*=.*$/!d
-                        # remove all matches with combinators
-                        /^##.*[>+~ ].*/d
-                        # cleanup
-                        s/^##//g
-                        # convert dots
-                        s/\.\([^\.]\)/\\.\1/g
-                        # convert attribute based filter with contain match
-                        s/^\[\([^*][^*]*\)\*=\(["'"'"']*\)\([^"][^"]*\)"*\(["'"'"']*\)\]/\1=\2.*\3.*\4/g
-                        s/$/|/
-                    ' "${html_file}" | sort -u | while read -r line; do
-                        # number of matches within one rule impacts runtime of each request to modify the content
-                        if [ "${#lines[@]}" -lt 1000 ]; then
-                            lines+=("$line")
-                            continue
-                        fi
-                        # complexity of regex impacts runtime of each request to modify the content
-                        # using removal of whole HTML tag as multiple matches with different classes in same element are not possible
-                        # printf to inject both quoting characters " and '
-                        printf 's@<([a-zA-Z0-9]+)\\s+.*('
-                        # using tr to merge lines because sed-based approachs takes up to 6 MB RAM and >10 seconds during testing
-                        printf '%s\n' "${lines[@]}" | sed '$ s/|//' | tr -d '\n'
-                        # printf to inject both quoting characters " and '
-                        printf ').*>.*<\/\\1[^>]*>@@g\n'
-                        lines=()
-                    done
-                    # process last chunk with less than 1000 entries
-                    if [ "${#lines[@]}" -gt 0 ]; then
-                        printf 's@<([a-zA-Z0-9]+)\\s+.*('
-                        printf '%s\n' "${lines[@]}" | sed '$ s/|//' | tr -d '\n'
-                        printf ').*>.*<\/\\1[^>]*>@@g\n'
-                    fi
-                fi
+# shellcheck disable=SC2317
+function python_convert() {
+    # convert downloaded AdblockPlus list like convert using the python engine within one pass over the list
+    #   the engine prints the same messages and writes the same timings as convert
+    local args=("${file}" --name "${list}" --actionfile "${actionfile}" --filterfile "${filterfile}" --max-selectors "${FILTER_MAX_SELECTORS}" --max-bytes "${FILTER_MAX_BYTES}" --debug "${DBG:-0}") filter
+    for filter in "${FILTERS[@]}"; do
+        args+=(--filter "${filter}")
+    done
+    if [ -n "${TIMINGS_FILE}" ]; then
+        args+=(--timings "${TIMINGS_FILE}" --run "$((RUN_START / 1000000))")
+    fi
+    run_python -m privoxy_blocklist "${args[@]}"
+}
 
-                if filter_active "attribute_global_startswith"; then
-                    echo "FILTER: ${list}_attribute_global_startswith Tag filter of ${list}"
-                    lines=()
-                    # using while-loop as privoxy cannot handle more than 2000 or-connected strings within one regex
-                    sed -e '
-                        # only process gloabl classes
-                        /^##\[[^=^][^=^]*\^=.*$/!d
-                        # remove all matches with combinators
-                        /^##.*[>+~ ].*/d
-                        # cleanup
-                        s/^##//g
-                        # convert dots
-                        s/\.\([^\.]\)/\\.\1/g
-                        # convert attribute based filter with startwith match
-                        s/^\[\([^^][^^]*\)^=\(["'"'"']*\)\(.*[^"'"'"']\)\(["'"'"']*\)\]/\1=\2\3.*\4/g
-                        s/$/|/
-                    ' "${html_file}" | sort -u | while read -r line; do
-                        # number of matches within one rule impacts runtime of each request to modify the content
-                        if [ "${#lines[@]}" -lt 1000 ]; then
-                            lines+=("$line")
-                            continue
-                        fi
-                        # complexity of regex impacts runtime of each request to modify the content
-                        # using removal of whole HTML tag as multiple matches with different classes in same element are not possible
-                        # printf to inject both quoting characters " and '
-                        printf 's@<([a-zA-Z0-9]+)\\s+.*('
-                        # using tr to merge lines because sed-based approachs takes up to 6 MB RAM and >10 seconds during testing
-                        printf '%s\n' "${lines[@]}" | sed '$ s/|//' | tr -d '\n'
-                        # printf to inject both quoting characters " and '
-                        printf ').*>.*<\/\\1[^>]*>@@g\n'
-                        lines=()
-                    done
-                    # process last chunk with less than 1000 entries
-                    if [ "${#lines[@]}" -gt 0 ]; then
-                        printf 's@<([a-zA-Z0-9]+)\\s+.*('
-                        printf '%s\n' "${lines[@]}" | sed '$ s/|//' | tr -d '\n'
-                        printf ').*>.*<\/\\1[^>]*>@@g\n'
-                    fi
-                fi
+# shellcheck disable=SC2317
+function read_usage() {
+    # read requests and content filter hits of the last PRUNE_DAYS days from PRUNE_LOGS once for all lists
+    #   the usage is not related to a single list
+    local list="" start
+    debug 0 "Reading Privoxy logs ${PRUNE_LOGS[*]} ..."
+    start="$(now)"
+    run_python -m privoxy_blocklist.prune usage --output "${TMPDIR}/usage.json" --days "${PRUNE_DAYS}" --debug "${DBG:-0}" "${PRUNE_LOGS[@]}"
+    timing "usage" "${start}" "" "${PRUNE_LOGS[@]}"
+}
 
-                if filter_active "attribute_global_endswith"; then
-                    echo "FILTER: ${list}_attribute_global_endswith Tag filter of ${list}"
-                    lines=()
-                    # using while-loop as privoxy cannot handle more than 2000 or-connected strings within one regex
-                    sed -e '
-                        # only process gloabl classes
-                        /^##\[[^$][^=$]*\$=.*$/!d
-                        # remove all matches with combinators
-                        /^##.*[>+~ ].*/d
-                        # cleanup
-                        s/^##//g
-                        # convert dots
-                        s/\.\([^\.]\)/\\.\1/g
-                        # convert attribute based filter with endswith match
-                        s/^\[\([^\$][^\$]*\)\$=\(["'"'"']*\)\(.*[^"'"'"']\)\(["'"'"']*\)\]/\1=\2.*\3\4/g
-                        s/$/|/
-                    ' "${html_file}" | sort -u | while read -r line; do
-                        # number of matches within one rule impacts runtime of each request to modify the content
-                        if [ "${#lines[@]}" -lt 1000 ]; then
-                            lines+=("$line")
-                            continue
-                        fi
-                        # complexity of regex impacts runtime of each request to modify the content
-                        # using removal of whole HTML tag as multiple matches with different classes in same element are not possible
-                        # printf to inject both quoting characters " and '
-                        printf 's@<([a-zA-Z0-9]+)\\s+.*('
-                        # using tr to merge lines because sed-based approachs takes up to 6 MB RAM and >10 seconds during testing
-                        printf '%s\n' "${lines[@]}" | sed '$ s/|//' | tr -d '\n'
-                        # printf to inject both quoting characters " and '
-                        printf ').*>.*<\/\\1[^>]*>@@g\n'
-                        lines=()
-                    done
-                    # process last chunk with less than 1000 entries
-                    if [ "${#lines[@]}" -gt 0 ]; then
-                        printf 's@<([a-zA-Z0-9]+)\\s+.*('
-                        printf '%s\n' "${lines[@]}" | sed '$ s/|//' | tr -d '\n'
-                        printf ').*>.*<\/\\1[^>]*>@@g\n'
-                    fi
-                fi
-                shopt -u lastpipe
-            ) >> "${filterfile}"
+# shellcheck disable=SC2317
+function prune_list() {
+    # drop block patterns and content filters without hits within the Privoxy logs from converted list
+    #   lists given by URL or name in PRUNE_KEEP are kept as converted
+    local source start
+    for source in "${PRUNE_KEEP[@]:-}"; do
+        if [ "${source}" = "${url}" ] || [ "${source}" = "${list}" ]; then
+            debug 0 "... ${list} is kept by PRUNE_KEEP, skipping pruning."
+            return 0
+        fi
+    done
+    debug 0 "... pruning ${list} by Privoxy logs ..."
+    start="$(now)"
+    run_python -m privoxy_blocklist.prune trim --usage "${TMPDIR}/usage.json" --debug "${DBG:-0}" "${actionfile}" "${filterfile}"
+    timing "prune" "${start}" "" "${actionfile}" "${filterfile}"
+}
 
-            debug 1 "... registering ${list}_attribute filters in actionfile ..."
-            (
-                if filter_active "attribute_global_name"; then
-                    echo "{ +filter{${list}_attribute_global_name} }"
-                    echo "/"
-                fi
-                if filter_active "attribute_global_exact"; then
-                    echo "{ +filter{${list}_attribute_global_exact} }"
-                    echo "/"
-                fi
-                if filter_active "attribute_global_contain"; then
-                    echo "{ +filter{${list}_attribute_global_contain} }"
-                    echo "/"
-                fi
-                if filter_active "attribute_global_startswith"; then
-                    echo "{ +filter{${list}_attribute_global_startswith} }"
-                    echo "/"
+# shellcheck disable=SC2317
+function stream_convert() {
+    # convert downloaded list like convert without writing the uncompressed list or any file per rule type
+    #   classify and split_selectors write into named pipes read by the converter of each rule type running in parallel,
+    #   thus memory is bounded by the buffers of each process and the content filter job budget instead of the list size
+    #   only parts of the action- and filterfile are written, domain patterns are not pruned and selectors not sorted
+    local filter filters=() html_file job_prefix job_suffix pid pids=() start type
+    html_file="${file}.html"
+    for filter in "class_global" "id_global" "attribute_global_name" "attribute_global_exact" "attribute_global_contain" "attribute_global_startswith" "attribute_global_endswith"; do
+        if filter_active "${filter}"; then
+            filters+=("${filter}")
+        fi
+    done
+    debug 1 "Streaming ${list} into actionfile and filterfile ..."
+    start="$(now)"
+    for type in domain domain_except address address_except url url_except regex regex_except html html_except image_except; do
+        mkfifo "${file}.${type}"
+    done
+    domain_patterns < "${file}.domain" > "${actionfile}.domain" &
+    pids+=("$!")
+    address_patterns < "${file}.address" > "${actionfile}.address" &
+    pids+=("$!")
+    exception_patterns < "${file}.domain_except" > "${actionfile}.domain_except" &
+    pids+=("$!")
+    image_patterns < "${file}.image_except" > "${actionfile}.image_except" &
+    pids+=("$!")
+    # every named pipe needs a reader as writing into it blocks until then
+    for type in address_except url url_except regex regex_except html_except; do
+        cat > /dev/null < "${file}.${type}" &
+        pids+=("$!")
+    done
+    if [ -n "${filters[*]}" ]; then
+        for filter in "class_global" "id_global" "attribute_global_name" "attribute_global_exact" "attribute_global_contain" "attribute_global_startswith" "attribute_global_endswith"; do
+            mkfifo "${html_file}.${filter}"
+            if filter_active "${filter}"; then
+                job_template "${filter}"
+                # count selectors while merging them into jobs in the order of the list
+                awk -v count="${html_file}.${filter}.count" '{ print } END { print NR > count }' < "${html_file}.${filter}" \
+                    | merge_selectors "${job_prefix}" "${job_suffix}" > "${html_file}.${filter}.jobs" &
+            else
+                cat > /dev/null < "${html_file}.${filter}" &
+            fi
+            pids+=("$!")
+        done
+        split_selectors "${html_file}" &
+    else
+        cat > /dev/null < "${html_file}" &
+    fi
+    pids+=("$!")
+    read_list "${file}" | sed '/^!.*/d;1,1 d' | classify "${file}" - > "${file}.counts"
+    for pid in "${pids[@]}"; do
+        wait "${pid}"
+    done
+    debug 1 "... rules per type: $(tr '\n' ' ' < "${file}.counts")"
+
+    # assemble action- and filterfile in the order of convert
+    echo "{ +block{${list}} }" > "${actionfile}"
+    cat "${actionfile}.domain" "${actionfile}.address" >> "${actionfile}"
+    echo > "${filterfile}"
+    for filter in "${filters[@]}"; do
+        # number of selectors is read by rule_metrics
+        echo "FILTER: ${list}_${filter} Tag filter of ${list} ($(cat "${html_file}.${filter}.count") selectors)" >> "${filterfile}"
+        cat "${html_file}.${filter}.jobs" >> "${filterfile}"
+        debug 1 "... merged $(cat "${html_file}.${filter}.count") '${filter}'-rules into $(wc -l < "${html_file}.${filter}.jobs" | tr -d ' ') jobs ..."
+        (
+            echo "{ +filter{${list}_${filter}} }"
+            echo "/"
+        ) >> "${actionfile}"
+    done
+    {
+        echo "{ -block }"
+        cat "${actionfile}.domain_except"
+        echo "{ -block +handle-as-image }"
+        cat "${actionfile}.image_except"
+    } >> "${actionfile}"
+    rm -f "${actionfile}".{domain,address,domain_except,image_except} "${file}".{domain,domain_except,address,address_except,url,url_except,regex,regex_except,html,html_except,image_except} "${html_file}".*
+    timing "stream" "${start}" "" "${actionfile}" "${filterfile}"
+    debug 1 "... streamed ${list}."
+}
+
+# shellcheck disable=SC2317
+function merge_actions() {
+    # merge given actionfiles into first given file while removing duplicate patterns of each action
+    #   block patterns stay in section of the first list defining them to keep it as block reason,
+    #   patterns of other actions are grouped by list with a comment naming the list
+    #   number of removed duplicates is printed
+    local target="$1"
+    shift 1
+    awk -v target="${target}" '
+        FNR == 1 {
+            list = FILENAME
+            sub(/^.*\//, "", list)
+            sub(/\.script\.action$/, "", list)
+        }
+        /^[{].*[}]$/ {
+            kind = $0
+            # block sections only differ by list name
+            if (kind ~ /^[{] [+]block[{].*[}] [}]$/) {
+                kind = "{ +block }"
+            }
+            if (!(kind in kinds)) {
+                kinds[kind] = ++kind_count
+                kind_order[kind_count] = kind
+                header[kind] = $0
+            }
+            group = ++group_count[kind]
+            group_header[kind, group] = $0
+            group_list[kind, group] = list
+            pattern_count[kind, group] = 0
+            next
+        }
+        {
+            if ((kind, $0) in seen) {
+                duplicates++
+                next
+            }
+            seen[kind, $0] = 1
+            patterns[kind, group_count[kind], ++pattern_count[kind, group_count[kind]]] = $0
+        }
+        END {
+            for (k = 1; k <= kind_count; k++) {
+                kind = kind_order[k]
+                if (kind != "{ +block }") {
+                    print header[kind] > target
+                }
+                for (group = 1; group <= group_count[kind]; group++) {
+                    if (pattern_count[kind, group] == 0) {
+                        continue
+                    }
+                    if (kind == "{ +block }") {
+                        print group_header[kind, group] > target
+                    }
+                    print "# list: " group_list[kind, group] > target
+                    for (i = 1; i <= pattern_count[kind, group]; i++) {
+                        print patterns[kind, group, i] > target
+                    }
+                }
+            }
+            print duplicates + 0
+        }
+    ' "$@"
+}
+
+# shellcheck disable=SC2317
+function export_bundle() {
+    # export given installed lists into BUNDLE_FILE to install them on other hosts by import_bundle
+    #   the manifest lists script version, content filters, source URLs and the checksum of each file
+    #   the checksum of the bundle is written to BUNDLE_FILE.sha256 in the format of sha256sum
+    local bundle_dir file_path
+    bundle_dir="${TMPDIR}/bundle"
+    rm -rf "${bundle_dir}"
+    mkdir -p "${bundle_dir}"
+    {
+        echo "# bundle of ${TMPNAME}"
+        echo "version ${SCRIPT_VERSION}"
+        echo "created $(date +%s)"
+        echo "filters ${FILTERS[*]}"
+        printf 'url %s\n' "${URLS[@]}"
+        for file_path in "$@"; do
+            cp "${file_path}" "${bundle_dir}"
+            echo "file $(checksum < "${file_path}") $(basename "${file_path}")"
+        done
+    } > "${bundle_dir}/manifest"
+    tar -C "${bundle_dir}" -cf - manifest "${@##*/}" | gzip -c > "${BUNDLE_FILE}.$$"
+    echo "$(checksum < "${BUNDLE_FILE}.$$")  $(basename "${BUNDLE_FILE}")" > "${BUNDLE_FILE}.sha256.$$"
+    chmod 644 "${BUNDLE_FILE}.$$" "${BUNDLE_FILE}.sha256.$$"
+    mv "${BUNDLE_FILE}.$$" "${BUNDLE_FILE}"
+    mv "${BUNDLE_FILE}.sha256.$$" "${BUNDLE_FILE}.sha256"
+}
+
+function main() {
+    local bundled=() conversion_cache download_status duplicates failed_status=0 install_stamp installed_urls=() merged_actions=() merged_filters=() start
+    # start of run, grouping all timings of this run
+    RUN_START="$(now)"
+    # remove files staged by an aborted run
+    rm -rf "${STAGING_DIR}"
+    STAGED=()
+    fetch
+    if [ -n "${PRUNE_LOGS[*]:-}" ]; then
+        read_usage
+    fi
+    for url in "${URLS[@]}"; do
+        debug 0 "Processing ${url} ..."
+        file="${TMPDIR}/$(basename "${url%.gz}")"
+        actionfile=${file%\.*}.script.action
+        filterfile=${file%\.*}.script.filter
+        list="$(basename "${file%\.*}")"
+
+        # check download of list
+        debug 2 "$(cat "${TMPDIR}/wget-${url//\//\#}.log")"
+        download_status="$(cat "${TMPDIR}/wget-${url//\//\#}.log.status" 2> /dev/null || echo 1)"
+        if [ "${download_status}" -ne 0 ] && [ "${download_status}" -ne 304 ]; then
+            error "Downloading ${url} failed with exit code ${download_status}. Skipping list."
+            failed_status="${download_status}"
+            continue
+        fi
+        # stamp of installed lists to detect changes of script or configuration
+        install_stamp="${SCRIPT_VERSION} ${LISTS_DIR} ${FILTERS[*]} ${FILTER_MAX_SELECTORS} ${FILTER_MAX_BYTES} ${STREAMING} ${ACTIVATE} ${PRIVOXY_CONF}"
+        # pruned lists depend on the latest logs, thus they are converted on every run
+        #   registrations removed from PRIVOXY_CONF since the last run are added again by installing the lists
+        if [ "${download_status}" -eq 304 ] \
+            && [ "${MERGE_LISTS}" -eq 0 ] \
+            && [ -z "${PRUNE_LOGS[*]:-}" ] \
+            && [ -f "${LISTS_DIR}/${list}.script.action" ] \
+            && [ -f "${LISTS_DIR}/${list}.script.filter" ] \
+            && [ "$(cat "$(cache_path "${url}").installed" 2> /dev/null)" = "${install_stamp}" ] \
+            && { [ "${ACTIVATE}" -eq 0 ] \
+                || { grep -q "${LISTS_DIR}/${list}.script.action" "${PRIVOXY_CONF}" \
+                    && grep -q "${LISTS_DIR}/${list}.script.filter" "${PRIVOXY_CONF}"; }; }; then
+            debug 0 "... ${url} not modified since last run, skipping conversion."
+            rule_metrics "${LISTS_DIR}/${list}.script.action" "${LISTS_DIR}/${list}.script.filter"
+            bundled+=("${LISTS_DIR}/${list}.script.action" "${LISTS_DIR}/${list}.script.filter")
+            continue
+        fi
+        if ! read_list "${file}" | grep -E '^.*\[Adblock.*\].*$' > /dev/null; then
+            info "The list recieved from ${url} does not contain AdblockPlus list header. Try to process anyway."
+        fi
+
+        if [ "${STREAMING}" -eq 1 ]; then
+            # conversion cache is skipped as its checksum needs the uncompressed list without comments
+            stream_convert
+        else
+            # remove comments while decompressing the list, thus the uncompressed list is only written once
+            start="$(now)"
+            read_list "${file}" | sed '/^!.*/d;1,1 d' > "${file}.list"
+            mv "${file}.list" "${file}"
+            timing "comments" "${start}" "" "${file}"
+            if [ -n "${CACHE_DIR}" ]; then
+                # converted lists only depend on list content & name, script version and content filters
+                conversion_cache="${CACHE_DIR}/converted/${list}/$({
+                    echo "${SCRIPT_VERSION} ${FILTERS[*]} ${FILTER_MAX_SELECTORS} ${FILTER_MAX_BYTES}"
+                    cat "${file}"
+                } | checksum)"
+            fi
+            if [ -n "${CACHE_DIR}" ] && [ -f "${conversion_cache}.script.action" ] && [ -f "${conversion_cache}.script.filter" ]; then
+                debug 0 "... ${url} found in conversion cache, reusing converted lists."
+                start="$(now)"
+                cp "${conversion_cache}.script.action" "${actionfile}"
+                cp "${conversion_cache}.script.filter" "${filterfile}"
+                timing "cache" "${start}" "" "${actionfile}" "${filterfile}"
+            else
+                if [ "${ENGINE}" = "python" ]; then
+                    python_convert
+                else
+                    convert
                 fi
-                if filter_active "attribute_global_endswith"; then
-                    echo "{ +filter{${list}_attribute_global_endswith} }"
-                    echo "/"
+                if [ -n "${CACHE_DIR}" ]; then
+                    # only keep latest conversion of each list
+                    rm -rf "${CACHE_DIR}/converted/${list}"
+                    mkdir -p "${CACHE_DIR}/converted/${list}"
+                    cp "${actionfile}" "${conversion_cache}.script.action"
+                    cp "${filterfile}" "${conversion_cache}.script.filter"
                 fi
-            ) >> "${actionfile}"
-            debug 1 "... registered ..."
+            fi
+        fi
 
-            # FIXME: add attribute handling with domains
-            # FIXME: add attribute handling with combinators
-            # FIXME: add combination of classes and attributes: ##.OUTBRAIN[data-widget-id^="FMS_REELD_"]
+        if [ -n "${PRUNE_LOGS[*]:-}" ]; then
+            prune_list
+        fi
+
+        rule_metrics "${actionfile}" "${filterfile}"
+
+        if [ "${MERGE_LISTS}" -eq 1 ]; then
+            merged_actions+=("${actionfile}")
+            merged_filters+=("${filterfile}")
+            debug 0 "... ${url} converted successfully."
+            continue
         fi
 
-        # create domain based allowlist
-
-        # create domain based blocklist
-        #    domains=$(sed '/^#/d;/#/!d;s/,~/,\*/g;s/~/;:\*/g;s/^\([a-zA-Z]\)/;:\1/g' ${file})
-        #    [ -n "${domains}" ] && debug 1 "... creating domainbased filterfiles ..."
-        #    debug 2 "Found Domains: ${domains}."
-        #    ifs=$IFS
-        #    IFS=";:"
-        #    for domain in ${domains}
-        #    do
-        #      dns=$(echo ${domain} | awk -F ',' '{print $1}' | awk -F '#' '{print $1}')
-        #      debug 2 "Modifying line: ${domain}"
-        #      debug 1 "   ... creating filterfile for ${dns} ..."
-        #      sed '' ${file} > ${file%\.*}-${dns%~}.script.filter
-        #      debug 1 "   ... filterfile created ..."
-        #      debug 1 "   ... adding filterfile for ${dns} to actionfile ..."
-        #      echo "{ +filter{${list}-${dns}} }" >> ${actionfile}
-        #      echo "${dns}" >> ${actionfile}
-        #      debug 1 "   ... filterfile added ..."
-        #    done
-        #    IFS=${ifs}
-        #    debug 1 "... all domainbased filterfiles created ..."
-
-        debug 1 "... creating and adding allowlist for urls ..."
-        # allowlist of urls
-        echo "{ -block }" >> "${actionfile}"
-        sed 's/^@@//g;/\$.*/d;/#/d;s/\./\\./g;s/\?/\\?/g;s/\*/.*/g;s/(/\\(/g;s/)/\\)/g;s/\[/\\[/g;s/\]/\\]/g;s/\^/[\/\&:\?=_]/g;s/^||/\./g;s/^|/^/g;s/|$/\$/g;/|/d' "${domain_name_except_file}" >> "${actionfile}"
-        debug 1 "... created and added allowlist - creating and adding image handler ..."
-        # allowlist of image urls
-        echo "{ -block +handle-as-image }" >> "${actionfile}"
-        sed '/^@@.*/!d;s/^@@//g;/\$.*image.*/!d;s/\$.*image.*//g;/#/d;s/\./\\./g;s/\?/\\?/g;s/\*/.*/g;s/(/\\(/g;s/)/\\)/g;s/\[/\\[/g;s/\]/\\]/g;s/\^/[\/\&:\?=_]/g;s/^||/\./g;s/^|/^/g;s/|$/\$/g;/|/d' "${file}" >> "${actionfile}"
-        debug 1 "... created and added image handler ..."
-        debug 1 "... created actionfile for ${list}."
-
-        # install Privoxy actionsfile
-        activate_config "${actionfile}"
-
-        # install Privoxy filterfile
-        activate_config "${filterfile}"
-
-        debug 0 "... ${url} installed successfully."
+        # stage Privoxy actionsfile and filterfile to install all lists at once
+        start="$(now)"
+        stage "${actionfile}"
+        stage "${filterfile}"
+        timing "staging" "${start}" "" "${actionfile}" "${filterfile}"
+        installed_urls+=("${url}")
+        debug 0 "... ${url} converted successfully."
+    done
+
+    if [ "${MERGE_LISTS}" -eq 1 ]; then
+        if [ "${failed_status}" -ne 0 ]; then
+            # keep previously merged lists instead of installing a merged list missing some lists
+            error "Skipping installation of merged lists as not all lists could be processed."
+        elif [ -n "${merged_actions[*]}" ]; then
+            debug 0 "Merging all lists ..."
+            list="merged"
+            start="$(now)"
+            duplicates="$(merge_actions "${TMPDIR}/merged.script.action" "${merged_actions[@]}")"
+            cat "${merged_filters[@]}" > "${TMPDIR}/merged.script.filter"
+            timing "merge" "${start}" "" "${TMPDIR}/merged.script.action" "${TMPDIR}/merged.script.filter"
+            debug 0 "... removed ${duplicates} duplicate patterns."
+            rule_metrics "${TMPDIR}/merged.script.action" "${TMPDIR}/merged.script.filter"
+            start="$(now)"
+            stage "${TMPDIR}/merged.script.action"
+            stage "${TMPDIR}/merged.script.filter"
+            timing "staging" "${start}" "" "${TMPDIR}/merged.script.action" "${TMPDIR}/merged.script.filter"
+        fi
+    fi
+
+    # install all lists at once
+    list=""
+    start="$(now)"
+    if [ -n "${STAGED[*]}" ]; then
+        debug 0 "Installing all lists ..."
+        install_staged
+        timing "install" "${start}" "" "${STAGED[@]}"
+        if [ -n "${CACHE_DIR}" ] && [ -n "${installed_urls[*]}" ]; then
+            for url in "${installed_urls[@]}"; do
+                echo "${install_stamp}" > "$(cache_path "${url}").installed"
+            done
+        fi
+        bundled+=("${STAGED[@]}")
+        debug 0 "... all lists installed successfully."
+    fi
+    if [ -n "${BUNDLE_FILE}" ]; then
+        if [ "${failed_status}" -ne 0 ]; then
+            # keep previously exported bundle instead of exporting a bundle missing some lists
+            error "Skipping export of bundle as not all lists could be processed."
+        elif [ -n "${bundled[*]}" ]; then
+            debug 0 "Exporting bundle ${BUNDLE_FILE} ..."
+            start="$(now)"
+            export_bundle "${bundled[@]}"
+            timing "export" "${start}" "" "${BUNDLE_FILE}"
+            debug 0 "... bundle exported."
+        fi
+    fi
+    # whole run is not related to a single list
+    timing "total" "${RUN_START}" 0
+    write_metrics "${failed_status}"
+    return "${failed_status}"
+}
+
+# shellcheck disable=SC2317
+function import_bundle() {
+    # install lists of bundle exported by export_bundle from IMPORT_BUNDLE, either a path or a URL
+    #   no list is downloaded or converted, the checksums of the bundle and of all its files are verified first
+    local bundle bundle_dir file_hash file_name files=() start
+    RUN_START="$(now)"
+    list=""
+    rm -rf "${STAGING_DIR}"
+    STAGED=()
+    bundle="${TMPDIR}/bundle.tar.gz"
+    bundle_dir="${TMPDIR}/bundle"
+    rm -rf "${bundle_dir}"
+    mkdir -p "${bundle_dir}"
+    debug 0 "Importing bundle ${IMPORT_BUNDLE} ..."
+    start="$(now)"
+    if [[ "${IMPORT_BUNDLE}" == *"://"* ]]; then
+        if ! wget -t 3 --no-check-certificate -O "${bundle}" "${IMPORT_BUNDLE}" > "${TMPDIR}/wget-bundle.log" 2>&1 \
+            || ! wget -t 3 --no-check-certificate -O "${bundle}.sha256" "${IMPORT_BUNDLE}.sha256" >> "${TMPDIR}/wget-bundle.log" 2>&1; then
+            debug 2 "$(cat "${TMPDIR}/wget-bundle.log")"
+            error "Downloading bundle ${IMPORT_BUNDLE} failed."
+            exit 1
+        fi
+    elif [ -f "${IMPORT_BUNDLE}" ] && [ -f "${IMPORT_BUNDLE}.sha256" ]; then
+        cp "${IMPORT_BUNDLE}" "${bundle}"
+        cp "${IMPORT_BUNDLE}.sha256" "${bundle}.sha256"
+    else
+        error "Bundle ${IMPORT_BUNDLE} or its checksum file ${IMPORT_BUNDLE}.sha256 does not exist."
+        exit 1
+    fi
+    if [ "$(checksum < "${bundle}")" != "$(cut -d' ' -f1 "${bundle}.sha256")" ]; then
+        error "Checksum of bundle ${IMPORT_BUNDLE} does not match ${IMPORT_BUNDLE}.sha256."
+        exit 1
+    fi
+    # only extract files listed in the manifest to never write outside of bundle_dir
+    gzip -dc "${bundle}" | tar -C "${bundle_dir}" -xf - manifest
+    debug 1 "Bundle exported by version $(sed -n 's/^version //p' "${bundle_dir}/manifest") with content filters: $(sed -n 's/^filters //p' "${bundle_dir}/manifest")"
+    debug 2 "Bundle URLs: $(sed -n 's/^url //p' "${bundle_dir}/manifest" | tr '\n' ' ')"
+    while read -r file_hash file_name; do
+        if ! [[ "${file_name}" =~ ^[A-Za-z0-9][A-Za-z0-9_.-]*\.script\.(action|filter)$ ]]; then
+            error "Invalid file '${file_name}' in manifest of bundle ${IMPORT_BUNDLE}."
+            exit 1
+        fi
+        files+=("${file_name}")
+    done < <(sed -n 's/^file //p' "${bundle_dir}/manifest")
+    if [ -z "${files[*]}" ]; then
+        error "Bundle ${IMPORT_BUNDLE} does not contain any list."
+        exit 1
+    fi
+    gzip -dc "${bundle}" | tar -C "${bundle_dir}" -xf - "${files[@]}"
+    while read -r file_hash file_name; do
+        if [ "$(checksum < "${bundle_dir}/${file_name}")" != "${file_hash}" ]; then
+            error "Checksum of '${file_name}' does not match manifest of bundle ${IMPORT_BUNDLE}."
+            exit 1
+        fi
+    done < <(sed -n 's/^file //p' "${bundle_dir}/manifest")
+    timing "import" "${start}" "" "${bundle}"
+    debug 0 "... bundle verified."
+
+    debug 0 "Installing all lists ..."
+    start="$(now)"
+    for file_name in "${files[@]}"; do
+        stage "${bundle_dir}/${file_name}"
+    done
+    install_staged
+    timing "install" "${start}" "" "${STAGED[@]}"
+    debug 0 "... all lists installed successfully."
+    for file_name in "${files[@]}"; do
+        if [[ "${file_name}" == *".action" ]]; then
+            list="${file_name%.script.action}"
+            rule_metrics "${LISTS_DIR}/${file_name}" "${LISTS_DIR}/${list}.script.filter"
+        fi
     done
+    list=""
+    timing "total" "${RUN_START}" 0
+    write_metrics 0
 }
 
 function lock() {
@@ -892,6 +2146,91 @@ function lock() {
     echo $$ > "${PID_FILE}"
 }
 
+# shellcheck disable=SC2317
+function analyze() {
+    # report time and matches of each job of each generated filterfile on sample pages to find expensive jobs
+    local args=() filter_file filter_files=() page sample
+    sample="$(dirname "$(readlink -f "${0}")")/tests/response.html"
+    if [ -f "${sample}" ]; then
+        args+=(--page "${sample}")
+    fi
+    for page in "${ANALYZE_PAGES[@]}"; do
+        if ! [ -f "${page}" ]; then
+            error "Page ${page} does not exist."
+            exit 1
+        fi
+        args+=(--page "${page}")
+    done
+    for filter_file in "${LISTS_DIR}/"*.script.filter; do
+        if [ -f "${filter_file}" ]; then
+            filter_files+=("${filter_file}")
+        fi
+    done
+    if [ -z "${filter_files[*]:-}" ]; then
+        error "No generated filterfiles found within ${LISTS_DIR}."
+        exit 1
+    fi
+    if ! run_python -c 'import privoxy_blocklist' 2> /dev/null; then
+        error "Analyze Mode needs python3 and the package privoxy_blocklist within $(dirname "$(readlink -f "${0}")"). Exit"
+        exit 1
+    fi
+    debug 1 "Analyzing ${#filter_files[@]} filterfiles ..."
+    run_python -m privoxy_blocklist.analyze "${args[@]}" "${filter_files[@]}"
+}
+
+# shellcheck disable=SC2317
+function kill_tree() {
+    # terminate given process and all its descendants
+    #   each process is stopped before collecting its children, thus it cannot start new ones meanwhile
+    local child
+    kill -STOP "$1" 2> /dev/null || return 0
+    for child in $(pgrep -P "$1"); do
+        kill_tree "${child}"
+    done
+    kill -TERM "$1" 2> /dev/null || true
+    kill -CONT "$1" 2> /dev/null || true
+}
+
+# shellcheck disable=SC2317
+function schedule() {
+    # run main again when the next list expires instead of exiting, only expired lists are downloaded and converted
+    #   the expiry of each list is kept within CACHE_DIR by cache_expires, thus it survives restarts
+    #   each run and sleep is a child process, so the lock of lock() stays valid and signals end the sleep immediately
+    local expires next pid="" seconds status url
+    # background processes do not inherit the traps, thus the current run is terminated before removing the lock
+    trap 'if [ -n "${pid}" ]; then kill_tree "${pid}"; wait "${pid}" 2> /dev/null; fi; rm -fr "${TMPDIR}"; exit' INT TERM
+    while true; do
+        # run in subshell to start each run like a new one, errors still abort the run like without scheduler
+        status=0
+        main &
+        pid="$!"
+        wait "${pid}" || status="$?"
+        if [ "${status}" -ne 0 ]; then
+            error "Run failed with exit code ${status}, retrying failed lists later."
+        fi
+        # temporary files of the run are not needed anymore
+        if [ "${DBG:-0}" -lt 3 ]; then
+            find "${TMPDIR}" -mindepth 1 -maxdepth 1 ! -name "$(basename "${PID_FILE}")" -exec rm -rf {} +
+        fi
+        next=""
+        for url in "${URLS[@]}"; do
+            expires="$(cat "$(cache_path "${url}").expires" 2> /dev/null || echo 0)"
+            if [ -z "${next}" ] || [ "${expires}" -lt "${next}" ]; then
+                next="${expires}"
+            fi
+        done
+        # failed downloads keep their past expiry, thus they are retried after SCHEDULER_MIN_SLEEP
+        seconds="$((next - $(date +%s)))"
+        if [ "${seconds}" -lt "${SCHEDULER_MIN_SLEEP}" ]; then
+            seconds="${SCHEDULER_MIN_SLEEP}"
+        fi
+        debug 0 "Next list expires in ${seconds} seconds, sleeping ..."
+        sleep "${seconds}" &
+        pid="$!"
+        wait "${pid}"
+    done
+}
+
 # shellcheck disable=SC2317
 function remove() {
     read -rp "Do you really want to remove all build lists?(y/N) " choice
@@ -914,9 +2253,20 @@ OS="$(uname)"
 ACTIVATE="${ACTIVATE:-1}"
 NO_CONFIG="${NO_CONFIG:-0}"
 OPT_TMPDIR=""
+OPT_PARALLEL_DOWNLOADS=""
+OPT_CACHE_DIR=""
+OPT_MERGE_LISTS=""
+OPT_STREAMING=""
+OPT_ENGINE=""
+OPT_TIMINGS_FILE=""
+OPT_METRICS_FILE=""
+OPT_BUNDLE_FILE=""
+OPT_IMPORT_BUNDLE=""
 OPT_UPDATE_CONFIG=0
+ANALYZE_PAGES=()
 OPT_FILTERS=()
 OPT_URLS=()
+OPT_PRUNE_LOGS=()
 
 # ID_LIKE is mainly used to check for openwrt and set via os-release
 ID_LIKE="unset"
@@ -934,7 +2284,7 @@ case "${ID_LIKE}" in
 esac
 
 # loop for options
-while getopts ":aAc:Cd:f:hp:qrt:u:Uv:V" opt; do
+while getopts ":aAb:c:Cd:De:f:hi:j:k:l:mp:P:qrst:T:u:Uv:Vx:" opt; do
     case "${opt}" in
         "a")
             ACTIVATE=1
@@ -942,6 +2292,9 @@ while getopts ":aAc:Cd:f:hp:qrt:u:Uv:V" opt; do
         "A")
             ACTIVATE=0
             ;;
+        "b")
+            OPT_BUNDLE_FILE="${OPTARG}"
+            ;;
         "c")
             SCRIPTCONF="${OPTARG}"
             ;;
@@ -951,21 +2304,51 @@ while getopts ":aAc:Cd:f:hp:qrt:u:Uv:V" opt; do
         "d")
             LISTS_DIR="${OPTARG}"
             ;;
+        "D")
+            method="schedule"
+            ;;
+        "e")
+            OPT_ENGINE="${OPTARG,,}"
+            ;;
         "f")
             OPT_FILTERS+=("${OPTARG,,}")
             ;;
+        "i")
+            OPT_IMPORT_BUNDLE="${OPTARG}"
+            ;;
+        "j")
+            OPT_PARALLEL_DOWNLOADS="${OPTARG}"
+            ;;
+        "k")
+            OPT_CACHE_DIR="${OPTARG}"
+            ;;
+        "l")
+            OPT_PRUNE_LOGS+=("${OPTARG}")
+            ;;
+        "m")
+            OPT_MERGE_LISTS=1
+            ;;
         "p")
             PRIVOXY_CONF="${OPTARG}"
             ;;
+        "P")
+            OPT_METRICS_FILE="${OPTARG}"
+            ;;
         "q")
             OPT_DBG=-1
             ;;
         "r")
             method="remove"
             ;;
+        "s")
+            OPT_STREAMING=1
+            ;;
         "t")
             OPT_TMPDIR="${OPTARG}"
             ;;
+        "T")
+            OPT_TIMINGS_FILE="${OPTARG}"
+            ;;
         "u")
             OPT_URLS+=("${OPTARG}")
             ;;
@@ -979,10 +2362,13 @@ while getopts ":aAc:Cd:f:hp:qrt:u:Uv:V" opt; do
             fi
             ;;
         "V")
-            # <main> is replaced by release process
-            echo "Version: <main>"
+            echo "Version: ${SCRIPT_VERSION}"
             exit 0
             ;;
+        "x")
+            method="analyze"
+            ANALYZE_PAGES+=("${OPTARG}")
+            ;;
         ":")
             error "-${OPTARG} requires an argument" >&2
             echo
@@ -0,0 +1,23 @@
+"""Python conversion engine of privoxy-blocklist.sh.
+
+Parses AdblockPlus rules into Rule records and converts them into the same Privoxy action- and
+filterfile as the shell engine, e.g.:
+
+    from privoxy_blocklist import Converter
+
+    actions, filters = Converter("easylist", ["class_global"]).convert(lines)
+"""
+
+from privoxy_blocklist.converter import Converter
+from privoxy_blocklist.rules import RULE_TYPES, Rule, classify, parse_rules
+from privoxy_blocklist.selectors import DOMAIN_FILTERS, GLOBAL_FILTERS
+
+__all__ = [
+    "DOMAIN_FILTERS",
+    "GLOBAL_FILTERS",
+    "RULE_TYPES",
+    "Converter",
+    "Rule",
+    "classify",
+    "parse_rules",
+]
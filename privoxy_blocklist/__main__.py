@@ -0,0 +1,98 @@
+"""Command line interface of the Python conversion engine used by privoxy-blocklist.sh -e python.
+
+Converts one downloaded list without comments into Privoxy action- and filterfile, e.g.:
+
+    python3 -m privoxy_blocklist -n easylist -a easylist.script.action \
+        -F easylist.script.filter -f class_global easylist.txt
+"""
+
+import argparse
+import locale
+import sys
+from time import perf_counter
+from typing import Any, Callable, Optional
+
+from privoxy_blocklist.converter import ENCODING, Converter
+from privoxy_blocklist.selectors import DOMAIN_FILTERS, GLOBAL_FILTERS
+
+
+def collation_key() -> Optional[Callable[[str], Any]]:
+    """Return sort key of the collation of the locale like sort, None for byte order."""
+    try:
+        locale.setlocale(locale.LC_COLLATE, "")
+        language, encoding = locale.getlocale(locale.LC_COLLATE)
+    except (locale.Error, ValueError):
+        return None
+    if language in (None, "C", "POSIX"):
+        return None
+
+    def key(text: str) -> Any:
+        return locale.strxfrm(text.encode(ENCODING).decode(encoding or "utf-8", "surrogateescape"))
+
+    return key
+
+
+def escape(value: str) -> str:
+    """Return given string with backslashes and double quotes escaped for JSON strings."""
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Convert list given by command line arguments."""
+    parser = argparse.ArgumentParser(
+        prog="python3 -m privoxy_blocklist",
+        description="Convert AdblockPlus list into Privoxy action- and filterfile.",
+    )
+    parser.add_argument("list_file", help="downloaded list without comments")
+    parser.add_argument("-n", "--name", required=True, help="name of the list")
+    parser.add_argument("-a", "--actionfile", required=True, help="path of generated actionfile")
+    parser.add_argument("-F", "--filterfile", required=True, help="path of generated filterfile")
+    parser.add_argument(
+        "-f",
+        "--filter",
+        action="append",
+        default=[],
+        choices=GLOBAL_FILTERS + DOMAIN_FILTERS,
+        help="activate given content filter, can be used multiple times",
+    )
+    parser.add_argument("--max-selectors", type=int, default=1000, help="selectors per job")
+    parser.add_argument("--max-bytes", type=int, default=32768, help="bytes of regex per job")
+    parser.add_argument("-v", "--debug", type=int, default=0, help="verbosity like DBG")
+    parser.add_argument("-T", "--timings", help="append timings of each stage as JSON lines")
+    parser.add_argument("--run", type=int, default=0, help="start of run in seconds for timings")
+    args = parser.parse_args(argv)
+
+    def log(message: str) -> None:
+        if args.debug >= 1:
+            print(message, flush=True)  # noqa: T201
+
+    timings = []
+
+    def timing(stage: str, start: float, rules: int, size: int) -> None:
+        timings.append(
+            f'{{"run":{args.run},"list":"{escape(args.name)}","stage":"{stage}",'
+            f'"seconds":{perf_counter() - start:.6f},"bytes":{size},"rules":{rules}}}\n'
+        )
+
+    converter = Converter(
+        args.name,
+        args.filter,
+        max_selectors=args.max_selectors,
+        max_bytes=args.max_bytes,
+        log=log,
+        timing=timing if args.timings else None,
+        sort_key=collation_key(),
+    )
+    with open(args.list_file, encoding=ENCODING, newline="\n") as list_file:  # noqa: PTH123
+        actions, filters = converter.convert(list_file)
+    for path, lines in ((args.actionfile, actions), (args.filterfile, filters)):
+        with open(path, "w", encoding=ENCODING, newline="\n") as output:  # noqa: PTH123
+            output.writelines(f"{line}\n" for line in lines)
+    if args.timings:
+        with open(args.timings, "a", encoding="UTF-8") as timings_file:  # noqa: PTH123
+            timings_file.writelines(timings)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""Cost analysis of the jobs of generated Privoxy filterfiles, used by privoxy-blocklist.sh -x.
+
+Each job of each FILTER block is run against sample HTML pages and reported with its time and
+number of matches, jobs taking far longer than the others are marked as outliers, e.g.:
+
+    python3 -m privoxy_blocklist.analyze -p tests/response.html easylist.script.filter
+"""
+
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+from typing import Iterable, Iterator, Optional
+
+from privoxy_blocklist.converter import ENCODING
+
+# jobs taking longer than this factor of the median job are outliers, mostly by backtracking
+OUTLIER_FACTOR = 10.0
+# jobs faster than this are never outliers as their time is dominated by noise
+OUTLIER_MIN_SECONDS = 0.001
+# modifiers of Privoxy jobs changing how the pattern matches, g and the others only change replacing
+_FLAGS = {"i": re.IGNORECASE, "m": re.MULTILINE, "s": re.DOTALL, "x": re.VERBOSE}
+_FILTER = re.compile(r"^FILTER: (\S+)")
+# job of given delimiter, e.g. s@pattern@replacement@modifiers, escaped delimiters are kept
+_JOB = re.compile(r"^s(.)((?:\\.|(?!\1).)*)\1((?:\\.|(?!\1).)*)\1(.*)$")
+
+
+class Job:
+    """Single job of a FILTER block and its cost on the analyzed pages."""
+
+    __slots__ = ("chunk", "error", "file", "filter", "matches", "pattern", "regex", "seconds")
+
+    def __init__(self, file: str, filter_name: str, chunk: int, pattern: str, flags: str) -> None:
+        """Compile pattern of given job, jobs Python cannot compile keep the error instead."""
+        self.file = file
+        self.filter = filter_name
+        self.chunk = chunk
+        self.pattern = pattern
+        self.error = ""
+        self.regex: Optional[re.Pattern[str]] = None
+        try:
+            self.regex = re.compile(pattern, sum(_FLAGS.get(flag, 0) for flag in set(flags)))
+        except re.error as error:
+            self.error = str(error)
+        self.seconds = 0.0
+        self.matches = 0
+
+    def __repr__(self) -> str:
+        """Return representation for debugging."""
+        return f"Job({self.filter!r}, {self.chunk!r}, {self.seconds!r}, {self.matches!r})"
+
+    def run(self, page: str, repeat: int) -> None:
+        """Add the fastest of repeat runs on given page and the matches to the cost of the job."""
+        if self.regex is None:
+            return
+        fastest = None
+        for _ in range(repeat):
+            start = perf_counter()
+            matches = sum(1 for _ in self.regex.finditer(page))
+            seconds = perf_counter() - start
+            fastest = seconds if fastest is None else min(fastest, seconds)
+        self.seconds += fastest or 0.0
+        self.matches += matches
+
+
+def split_job(line: str) -> Optional[tuple[str, str, str]]:
+    """Return pattern, replacement and modifiers of given job, e.g. s@<b>@@g, None for others."""
+    job = _JOB.match(line)
+    if job is None:
+        return None
+    return job.group(2), job.group(3), job.group(4)
+
+
+def read_jobs(path: Path) -> Iterator[Job]:
+    """Yield all jobs of given filterfile, chunks are numbered from 1 within each FILTER block."""
+    filter_name = ""
+    chunk = 0
+    with path.open(encoding=ENCODING) as filter_file:
+        for line in filter_file:
+            header = _FILTER.match(line)
+            if header:
+                filter_name = header.group(1)
+                chunk = 0
+                continue
+            job = split_job(line.rstrip("\n"))
+            if filter_name and job is not None:
+                chunk += 1
+                yield Job(str(path), filter_name, chunk, job[0], job[2])
+
+
+def analyze(jobs: list[Job], pages: Iterable[str], repeat: int = 3) -> list[Job]:
+    """Run given jobs on given page contents and return the outliers among them."""
+    for page in pages:
+        for job in jobs:
+            job.run(page, repeat)
+    timed = [job.seconds for job in jobs if job.regex is not None]
+    if not timed:
+        return []
+    threshold = max(median(timed) * OUTLIER_FACTOR, OUTLIER_MIN_SECONDS)
+    return [job for job in jobs if job.seconds > threshold]
+
+
+def report(jobs: list[Job], outliers: list[Job]) -> Iterator[str]:
+    """Yield lines of a table of each FILTER block and its chunks, slowest first."""
+    blocks: dict[tuple[str, str], list[Job]] = {}
+    # jobs are compared by identity, thus large filterfiles are reported in linear time
+    outlier_ids = {id(job) for job in outliers}
+    for job in jobs:
+        blocks.setdefault((job.file, job.filter), []).append(job)
+    yield f"{'filter':<50} {'chunk':>5} {'seconds':>10} {'matches':>8} {'bytes':>7}"
+    for (_, filter_name), block in sorted(
+        blocks.items(), key=lambda item: -sum(job.seconds for job in item[1])
+    ):
+        seconds = sum(job.seconds for job in block)
+        matches = sum(job.matches for job in block)
+        size = sum(len(job.pattern) for job in block)
+        yield f"{filter_name:<50} {'all':>5} {seconds:>10.6f} {matches:>8} {size:>7}"
+        for job in sorted(block, key=lambda job: -job.seconds):
+            line = (
+                f"{'':<50} {job.chunk:>5} {job.seconds:>10.6f} {job.matches:>8}"
+                f" {len(job.pattern):>7}"
+            )
+            if id(job) in outlier_ids:
+                line += "  outlier"
+            if job.error:
+                line += f"  skipped: {job.error}"
+            yield line
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Analyze filterfiles given by command line arguments."""
+    parser = argparse.ArgumentParser(
+        prog="python3 -m privoxy_blocklist.analyze",
+        description="Time each job of Privoxy filterfiles on sample HTML pages.",
+    )
+    parser.add_argument("filter_file", nargs="+", type=Path, help="generated filterfile")
+    parser.add_argument(
+        "-p",
+        "--page",
+        action="append",
+        default=[],
+        type=Path,
+        required=True,
+        help="sample HTML page, can be used multiple times",
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs per job and page")
+    parser.add_argument("--json", action="store_true", help="print each job as JSON line")
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error(f"repeat must be at least 1, got {args.repeat}")
+    for path in args.filter_file + args.page:
+        if not path.is_file():
+            parser.error(f"file not found: {path}")
+
+    jobs = [job for path in args.filter_file for job in read_jobs(path)]
+    pages = [path.read_text(encoding=ENCODING) for path in args.page]
+    start = perf_counter()
+    outliers = analyze(jobs, pages, args.repeat)
+    if args.json:
+        outlier_ids = {id(job) for job in outliers}
+        for job in jobs:
+            print(  # noqa: T201
+                json.dumps(
+                    {
+                        "file": job.file,
+                        "filter": job.filter,
+                        "chunk": job.chunk,
+                        "seconds": round(job.seconds, 6),
+                        "matches": job.matches,
+                        "bytes": len(job.pattern),
+                        "outlier": id(job) in outlier_ids,
+                        "error": job.error,
+                    }
+                )
+            )
+        return 0
+    print(  # noqa: T201
+        f"Analyzed {len(jobs)} jobs on {len(pages)} pages"
+        f" ({sum(len(page) for page in pages)} bytes) in {perf_counter() - start:.2f}s,"
+        f" {len(outliers)} outliers."
+    )
+    for line in report(jobs, outliers):
+        print(line)  # noqa: T201
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
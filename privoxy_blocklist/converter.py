@@ -0,0 +1,241 @@
+"""Conversion of one AdblockPlus list into Privoxy action- and filterfile.
+
+Converter generates the same files as convert() of privoxy-blocklist.sh within one pass over the
+list, block and exception rules are converted while reading, HTML element rules are kept for
+sorting their selectors into jobs.
+"""
+
+import re
+from collections import Counter
+from time import perf_counter
+from typing import Any, Callable, Iterable, Optional
+
+from privoxy_blocklist.patterns import (
+    address_pattern,
+    domain_pattern,
+    exception_pattern,
+    image_pattern,
+    prune_domains,
+)
+from privoxy_blocklist.rules import RULE_TYPES, parse_rules
+from privoxy_blocklist.selectors import (
+    DOMAIN_FILTERS,
+    GLOBAL_FILTERS,
+    domain_filter_name,
+    domain_key,
+    domain_selectors,
+    job_template,
+    merge_selectors,
+    split_selectors,
+)
+
+# lists are read and written byte by byte like sed and awk, independent of their encoding
+ENCODING = "latin-1"
+_DOMAIN_FILTER_LINE = re.compile(r"^FILTER: .*_domain_")
+
+
+def _size(lines: Iterable[str]) -> int:
+    """Return size of given lines in bytes including line breaks."""
+    return sum(len(line) + 1 for line in lines)
+
+
+class Converter:
+    """Convert rules of one list into lines of Privoxy action- and filterfile.
+
+    Lines are expected as read by latin-1 to keep each byte a single character like sed and awk.
+    Messages of convert() are passed to log, stages are passed to timing as name, start time of
+    perf_counter(), number of rules and bytes, like timing() of privoxy-blocklist.sh.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        name: str,
+        filters: Iterable[str] = (),
+        *,
+        max_selectors: int = 1000,
+        max_bytes: int = 32768,
+        log: Optional[Callable[[str], None]] = None,
+        timing: Optional[Callable[[str, float, int, int], None]] = None,
+        sort_key: Optional[Callable[[str], Any]] = None,
+    ) -> None:
+        """Configure conversion of list with given name into given content filters."""
+        self.name = name
+        self.filters = frozenset(filters)
+        self.max_selectors = max_selectors
+        self.max_bytes = max_bytes
+        self.log = log or (lambda message: None)
+        self.timing = timing or (lambda stage, start, rules, size: None)
+        # selectors of global filters are sorted like sort, thus by the collation of the locale
+        self.sort_key = sort_key
+        self.counts = dict.fromkeys(RULE_TYPES, 0)
+        self.sizes = dict.fromkeys(RULE_TYPES, 0)
+
+    def _sorted(self, selectors: list[str]) -> list[str]:
+        """Return given selectors sorted without duplicates like sort -u."""
+        if self.sort_key is None:
+            return sorted(set(selectors))
+        result = []
+        previous = None
+        for key, selector in sorted((self.sort_key(line), line) for line in set(selectors)):
+            # sort -u drops selectors collating equal to the previous one
+            if key != previous:
+                result.append(selector)
+            previous = key
+        return result
+
+    def _merge(self, selectors: Iterable[str], filter_type: str, keyed: bool = False) -> list[str]:
+        """Return jobs of given content filter merging given sorted selectors."""
+        prefix, suffix = job_template(filter_type)
+        return list(
+            merge_selectors(
+                selectors,
+                prefix,
+                suffix,
+                max_selectors=self.max_selectors,
+                max_bytes=self.max_bytes,
+                keyed=keyed,
+            )
+        )
+
+    def convert(self, lines: Iterable[str]) -> tuple[list[str], list[str]]:
+        """Return lines of action- and filterfile converted from given lines of the list."""
+        start = perf_counter()
+        read = 0
+        size = 0
+        domains = []
+        addresses = []
+        exceptions = []
+        images = []
+        html = []
+        # convert each rule while reading the list
+        for rule in parse_rules(lines):
+            read += 1
+            size += len(rule.text) + 1
+            for rule_type in rule.types:
+                self.counts[rule_type] += 1
+                self.sizes[rule_type] += len(rule.text) + 1
+            if "domain" in rule.types:
+                domains.append(domain_pattern(rule.text))
+            if "address" in rule.types:
+                addresses.append(address_pattern(rule.text))
+            if "domain_except" in rule.types:
+                exceptions.append(exception_pattern(rule.text))
+            if "image_except" in rule.types:
+                images.append(image_pattern(rule.text))
+            if "html" in rule.types:
+                html.append(rule.text)
+        self.timing("classify", start, read, size)
+        self.log(
+            "... rules per type: "
+            + "".join(f"{rule_type}={count} " for rule_type, count in self.counts.items())
+        )
+
+        # blocklist of urls
+        self.log(f"Creating actionfile for {self.name} ...")
+        start = perf_counter()
+        actions = [f"{{ +block{{{self.name}}} }}"]
+        patterns, pruned = prune_domains(pattern for pattern in domains if pattern is not None)
+        actions.extend(patterns)
+        self.log(f"... removed {pruned} block patterns covered by broader domain patterns ...")
+        actions.extend(pattern for pattern in addresses if pattern is not None)
+        self.timing(
+            "actions",
+            start,
+            self.counts["domain"] + self.counts["address"],
+            self.sizes["domain"] + self.sizes["address"],
+        )
+
+        filters = [""]
+        if self.filters:
+            self.log(f"... creating filterfile for {self.name} ...")
+            self._global_filters(html, actions, filters)
+        # all rules of one domain are combined into one filter which is only activated for it
+        if any("_domain" in filter_type for filter_type in self.filters):
+            self.log(f"... creating domain based filters for {self.name} ...")
+            self._domain_filters(html, actions, filters)
+
+        self.log("... creating and adding allowlist for urls ...")
+        start = perf_counter()
+        actions.append("{ -block }")
+        actions.extend(pattern for pattern in exceptions if pattern is not None)
+        self.log("... created and added allowlist - creating and adding image handler ...")
+        actions.append("{ -block +handle-as-image }")
+        actions.extend(pattern for pattern in images if pattern is not None)
+        self.timing(
+            "exceptions",
+            start,
+            self.counts["domain_except"] + self.counts["image_except"],
+            self.sizes["domain_except"] + self.sizes["image_except"],
+        )
+        self.log("... created and added image handler ...")
+        self.log(f"... created actionfile for {self.name}.")
+        return actions, filters
+
+    def _global_filters(self, html: list[str], actions: list[str], filters: list[str]) -> None:
+        """Append global content filters of given HTML element rules to action- and filterfile."""
+        start = perf_counter()
+        selectors: dict[str, list[str]] = {filter_type: [] for filter_type in GLOBAL_FILTERS}
+        for rule in html:
+            for filter_type, selector in split_selectors(rule):
+                selectors[filter_type].append(selector)
+        self.timing("selectors", start, self.counts["html"], self.sizes["html"])
+        for filter_type in GLOBAL_FILTERS:
+            if filter_type not in self.filters:
+                continue
+            self.log(f"... processing '{filter_type}'-matches ...")
+            start = perf_counter()
+            count = len(selectors[filter_type])
+            # number of selectors is read by rule_metrics
+            filters.append(
+                f"FILTER: {self.name}_{filter_type} Tag filter of {self.name} ({count} selectors)"
+            )
+            # sorting groups selectors with common prefixes into the same job
+            jobs = self._merge(self._sorted(selectors[filter_type]), filter_type)
+            self.log(f"... merged {count} '{filter_type}'-rules into {len(jobs)} jobs ...")
+            filters.extend(jobs)
+            self.timing(filter_type, start, count, _size(jobs))
+            self.log(f"... registering {self.name}_{filter_type} in actionfile ...")
+            actions.extend([f"{{ +filter{{{self.name}_{filter_type}}} }}", "/"])
+            self.log("... registered ...")
+
+    def _domain_filters(self, html: list[str], actions: list[str], filters: list[str]) -> None:
+        """Append one content filter per domain of given HTML element rules."""
+        start = perf_counter()
+        selectors: dict[str, list[str]] = {filter_type: [] for filter_type in GLOBAL_FILTERS}
+        for rule in html:
+            for domain_rule in domain_selectors(rule):
+                for filter_type, selector in split_selectors(domain_rule):
+                    selectors[filter_type].append(selector)
+        keyed_selectors = []
+        jobs = []
+        for filter_type in DOMAIN_FILTERS:
+            if filter_type not in self.filters:
+                continue
+            # domain in front of selector as key, byte order keeps selectors of a domain together
+            keyed = sorted(
+                {domain_key(line) for line in selectors[filter_type.replace("_domain", "_global")]}
+            )
+            jobs.extend(self._merge(keyed, filter_type, keyed=True))
+            keyed_selectors.extend(keyed)
+        # stable sort keeps order of content filters within each domain
+        jobs.sort(key=lambda job: job.split(" ", 1)[0])
+        domain_counts = Counter(line.split()[0] for line in keyed_selectors)
+        domain = ""
+        for job in jobs:
+            job_domain = job.split(" ", 1)[0]
+            if job_domain != domain:
+                domain = job_domain
+                name = domain_filter_name(self.name, domain)
+                # number of selectors is read by rule_metrics
+                filters.append(
+                    f"FILTER: {name} Tag filter of {self.name} for {domain}"
+                    f" ({domain_counts[domain]} selectors)"
+                )
+                actions.extend([f"{{ +filter{{{name}}} }}", f".{domain}"])
+            filters.append(job[len(domain) + 1 :])
+        domain_filter_count = len([line for line in filters if _DOMAIN_FILTER_LINE.match(line)])
+        self.log(
+            f"... merged {len(keyed_selectors)} domain based rules"
+            f" into {domain_filter_count} domain filters ..."
+        )
+        self.timing("domains", start, len(keyed_selectors), _size(jobs))
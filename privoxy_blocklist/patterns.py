@@ -0,0 +1,129 @@
+"""Conversion of block and exception rules into Privoxy patterns.
+
+Each function converts one rule like the sed script of the same name in privoxy-blocklist.sh
+and returns None for rules which are skipped.
+"""
+
+import re
+from typing import Iterable, Optional
+
+# replace characters to match Privoxy domain syntax
+_ESCAPES = str.maketrans({"?": "\\?", "*": ".*", "(": "\\(", ")": "\\)", "[": "\\[", "]": "\\]"})
+# exceptions additionally escape dots before the other characters
+_EXCEPTION_ESCAPES = str.maketrans(
+    {".": "\\.", "?": "\\?", "*": ".*", "(": "\\(", ")": "\\)", "[": "\\[", "]": "\\]"}
+)
+_EXACT_ADDRESS = re.compile(r"^\|([^|]+)\|")
+_IMAGE_OPTION = re.compile(r"\$.*image.*")
+_PLAIN_DOMAIN = re.compile(r"\.[a-zA-Z0-9_-]+(\.[a-zA-Z0-9_-]+)*")
+
+
+def domain_pattern(rule: str) -> Optional[str]:
+    """Return Privoxy pattern of given domain-name block rule."""
+    # skip domains with additional filter definition or HTML filter
+    if "$" in rule or "#" in rule:
+        return None
+    pattern = rule.translate(_ESCAPES)
+    # replace marking seperator of Adblock
+    if pattern.endswith("^"):
+        pattern = pattern[:-1]
+    # replace domain matcher
+    if pattern.startswith("||"):
+        pattern = "." + pattern[2:]
+    return pattern
+
+
+def address_pattern(rule: str) -> Optional[str]:
+    """Return Privoxy pattern of given exact address block rule."""
+    # skip domains with additional filter definition or HTML filter
+    if "$" in rule or "#" in rule:
+        return None
+    pattern = rule.translate(_ESCAPES)
+    # replace marking seperator of Adblock
+    if pattern.endswith("^"):
+        pattern = pattern[:-1]
+    # handle exact domain matching
+    pattern = _EXACT_ADDRESS.sub(lambda match: f"^{match.group(1)}$", pattern, count=1)
+    if pattern.endswith("|"):
+        pattern = pattern[:-1] + "$"
+    return pattern
+
+
+def _exception(rule: str) -> Optional[str]:
+    """Return Privoxy pattern of given exception rule without leading @@ and options."""
+    pattern = rule.translate(_EXCEPTION_ESCAPES).replace("^", "[/&:?=_]")
+    if pattern.startswith("||"):
+        pattern = "." + pattern[2:]
+    elif pattern.startswith("|"):
+        pattern = "^" + pattern[1:]
+    if pattern.endswith("|"):
+        pattern = pattern[:-1] + "$"
+    # skip exceptions with separators which cannot be converted
+    if "|" in pattern:
+        return None
+    return pattern
+
+
+def exception_pattern(rule: str) -> Optional[str]:
+    """Return Privoxy pattern of given domain-name exception rule."""
+    if rule.startswith("@@"):
+        rule = rule[2:]
+    if "$" in rule or "#" in rule:
+        return None
+    return _exception(rule)
+
+
+def image_pattern(rule: str) -> Optional[str]:
+    """Return Privoxy pattern of given image exception rule."""
+    if not rule.startswith("@@"):
+        return None
+    rule = rule[2:]
+    if not _IMAGE_OPTION.search(rule):
+        return None
+    rule = _IMAGE_OPTION.sub("", rule, count=1)
+    if "#" in rule:
+        return None
+    return _exception(rule)
+
+
+def _reverse_labels(host: str) -> str:
+    """Return labels of given host in reversed order, e.g. com.example.ads."""
+    return ".".join(reversed(host.lower().split(".")))
+
+
+def prune_domains(patterns: Iterable[str]) -> tuple[list[str], int]:
+    """Return given patterns except duplicates and patterns covered by a broader domain pattern.
+
+    Works like prune_domains() of privoxy-blocklist.sh using a trie of reversed domain labels,
+    the number of removed patterns is returned as well.
+    """
+    patterns = list(patterns)
+    nodes: dict[int, tuple[str, bool]] = {}
+    trie = set()
+    for index, pattern in enumerate(patterns):
+        host, separator, _ = pattern.partition("/")
+        # only plain domain patterns without wildcards can cover or be covered
+        if not _PLAIN_DOMAIN.fullmatch(host):
+            continue
+        nodes[index] = (_reverse_labels(host[1:]), separator != "")
+        if not separator:
+            trie.add(nodes[index][0])
+    kept = []
+    seen = set()
+    removed = 0
+    for index, pattern in enumerate(patterns):
+        if pattern in seen:
+            removed += 1
+            continue
+        seen.add(pattern)
+        if index in nodes:
+            parent, has_path = nodes[index]
+            covered = has_path and parent in trie
+            while not covered and "." in parent:
+                parent = parent.rsplit(".", 1)[0]
+                covered = parent in trie
+            if covered:
+                removed += 1
+                continue
+        kept.append(pattern)
+    return kept, removed
@@ -0,0 +1,337 @@
+"""Pruning of generated lists by the requests and content filter runs found in Privoxy logs.
+
+Used by privoxy-blocklist.sh -l, the logs are read once into a usage file which is applied to the
+action- and filterfile of each list, e.g.:
+
+    python3 -m privoxy_blocklist.prune usage -o usage.json --days 30 /var/log/privoxy/logfile
+    python3 -m privoxy_blocklist.prune trim -u usage.json easylist.script.action \
+        easylist.script.filter
+
+Privoxy only logs which requests it received or blocked and how many hits each content filter
+produced on a page, thus block patterns are matched against the logged requests like Privoxy does
+and content filters are kept or dropped as a whole. Content filters are only dropped if they ran
+without any hit, thus dropped filters, new filters and filters of sites not visited within the logs
+are kept by the next run.
+"""
+
+import argparse
+import gzip
+import json
+import re
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, TextIO
+
+from privoxy_blocklist.converter import ENCODING
+
+# e.g. 2024-05-01 12:00:00.123 7f0c3affe6c0 Request: www.example.com/index.html
+_LOG_LINE = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d+ \S+ ([A-Za-z-]+): (.*)$")
+# requests are logged by debug 1 as host and path, blocked ones by debug 1024 as URL
+_REQUEST = re.compile(r"^(?:Blocked: )?(?:[a-zA-Z]+://)?([^/\s:]+)(?::\d+)?(/\S*)?")
+# e.g. filtering example.com/ (size 1024) with 'easylist_class_global' produced 2 hits (new ...
+_FILTER_HITS = re.compile(r"with '([^']+)' produced (\d+) hits")
+_TIMESTAMP = "%Y-%m-%d %H:%M:%S"
+_PLAIN_HOST = re.compile(r"\.?[a-z0-9_-]+(?:\.[a-z0-9_-]+)*")
+_SECTION = re.compile(r"^\{.*\}$")
+_FILTER_ACTION = re.compile(r"^\{ \+filter\{([^}]+)\} \}$")
+_FILTER = re.compile(r"^FILTER: (\S+)")
+_BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
+
+
+class Usage:
+    """Requests, content filter runs and their hits read from Privoxy logs."""
+
+    __slots__ = ("filter_runs", "filters", "requests")
+
+    def __init__(self) -> None:
+        """Start without any request or filter run."""
+        self.requests: Counter[str] = Counter()
+        self.filters: Counter[str] = Counter()
+        self.filter_runs: Counter[str] = Counter()
+
+    def read(self, log: TextIO, since: Optional[datetime] = None) -> None:
+        """Add requests and filter hits of given log logged at or after since."""
+        since_text = since.strftime(_TIMESTAMP) if since is not None else ""
+        for line in log:
+            entry = _LOG_LINE.match(line)
+            # timestamps of Privoxy sort like their text
+            if entry is None or entry.group(1) < since_text:
+                continue
+            kind, message = entry.group(2), entry.group(3)
+            if kind in ("Request", "Crunch"):
+                request = _REQUEST.match(message)
+                if request is not None and (kind == "Request" or message.startswith("Blocked: ")):
+                    self.requests[request.group(1).lower() + (request.group(2) or "/")] += 1
+            elif kind == "Re-Filter":
+                hits = _FILTER_HITS.search(message)
+                if hits is not None:
+                    self.filter_runs[hits.group(1)] += 1
+                    self.filters[hits.group(1)] += int(hits.group(2))
+
+    def dump(self, path: Path) -> None:
+        """Write usage into given JSON file."""
+        path.write_text(
+            json.dumps(
+                {
+                    "requests": self.requests,
+                    "filters": self.filters,
+                    "filter_runs": self.filter_runs,
+                }
+            ),
+            encoding="UTF-8",
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "Usage":
+        """Return usage read from given JSON file written by dump()."""
+        data = json.loads(path.read_text(encoding="UTF-8"))
+        usage = cls()
+        usage.requests.update(data["requests"])
+        usage.filters.update(data["filters"])
+        usage.filter_runs.update(data["filter_runs"])
+        return usage
+
+
+def open_log(path: Path) -> TextIO:
+    """Return given log opened for reading, rotated logs may be compressed by gzip."""
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding=ENCODING)
+    return path.open(encoding=ENCODING)
+
+
+def _host_regex(host: str) -> str:
+    """Return regex of given host pattern using Privoxy's wildcards and unanchored dots."""
+    regex = ""
+    for char in host.lower():
+        regex += {"*": ".*", "?": ".", "[": "[", "]": "]"}.get(char, re.escape(char))
+    # leading dot matches any subdomains, trailing dot any top-level domain
+    if host.startswith("."):
+        regex = r"(?:.*\.)?" + regex[2:]
+    if host.endswith("."):
+        regex = regex[:-2] + r"(?:\..*)?"
+    return regex
+
+
+def _combine(regexes: list[re.Pattern[str]], flags: int = 0) -> Optional[re.Pattern[str]]:
+    """Return one regex matching wherever any of given regexes matches, None if not combinable."""
+    # backreferences would refer to groups of other regexes within the combined one
+    if not regexes or any(_BACKREFERENCE.search(regex.pattern) for regex in regexes):
+        return None
+    try:
+        return re.compile("|".join(f"(?:{regex.pattern})" for regex in regexes), flags)
+    except re.error:
+        return None
+
+
+def group_requests(requests: Counter[str]) -> dict[str, list[tuple[str, int]]]:
+    """Return paths and their counts of given requests grouped by their host."""
+    hosts: dict[str, list[tuple[str, int]]] = {}
+    for url, count in requests.items():
+        host, _, path = url.partition("/")
+        hosts.setdefault(host, []).append(("/" + path, count))
+    return hosts
+
+
+class Patterns:
+    """Block patterns of one actionfile matched against requests like Privoxy.
+
+    Plain domain patterns are looked up by each suffix of the requested host, host patterns with
+    wildcards are matched once per host and patterns without host once per path. Patterns of both
+    are combined into one regex first, thus only hosts and paths matching any of them are matched
+    one by one.
+    """
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        """Compile given patterns, patterns which cannot be compiled always match."""
+        self.hits: Counter[str] = Counter()
+        self.exact: dict[str, list[tuple[str, Optional[re.Pattern[str]]]]] = {}
+        self.suffix: dict[str, list[tuple[str, Optional[re.Pattern[str]]]]] = {}
+        self.hosts: list[tuple[str, re.Pattern[str], Optional[re.Pattern[str]]]] = []
+        self.paths: list[tuple[str, re.Pattern[str]]] = []
+        for pattern in patterns:
+            host, separator, path = pattern.partition("/")
+            try:
+                # paths are matched from their start and case insensitive
+                path_regex = re.compile("/" + path, re.IGNORECASE) if separator else None
+                host_regex = re.compile(_host_regex(host)) if host else None
+            except re.error:
+                self.hits[pattern] += 1
+                continue
+            if _PLAIN_HOST.fullmatch(host.lower()):
+                index = self.suffix if host.startswith(".") else self.exact
+                index.setdefault(host.lower().lstrip("."), []).append((pattern, path_regex))
+            elif host_regex is not None:
+                self.hosts.append((pattern, host_regex, path_regex))
+            elif path_regex is not None:
+                self.paths.append((pattern, path_regex))
+        self.any_host = _combine([host_regex for _, host_regex, _ in self.hosts])
+        self.any_path = _combine([path_regex for _, path_regex in self.paths], re.IGNORECASE)
+
+    def _candidates(self, host: str) -> list[tuple[str, Optional[re.Pattern[str]]]]:
+        """Return patterns matching given host and their path regex."""
+        candidates = list(self.exact.get(host, []))
+        labels = host.split(".")
+        for index in range(len(labels)):
+            candidates.extend(self.suffix.get(".".join(labels[index:]), []))
+        if self.hosts and (self.any_host is None or self.any_host.fullmatch(host)):
+            candidates.extend(
+                (pattern, path_regex)
+                for pattern, host_regex, path_regex in self.hosts
+                if host_regex.fullmatch(host)
+            )
+        return candidates
+
+    def match(self, hosts: dict[str, list[tuple[str, int]]]) -> None:
+        """Add hits of given paths and their counts grouped by host to all matching patterns."""
+        paths: Counter[str] = Counter()
+        for host, host_paths in hosts.items():
+            for pattern, path_regex in self._candidates(host):
+                self.hits[pattern] += sum(
+                    count
+                    for path, count in host_paths
+                    if path_regex is None or path_regex.match(path)
+                )
+            for path, count in host_paths:
+                paths[path] += count
+        # patterns without host match the same path of all hosts
+        if not self.paths:
+            return
+        for path, count in paths.items():
+            if self.any_path is None or self.any_path.match(path):
+                for pattern, path_regex in self.paths:
+                    if path_regex.match(path):
+                        self.hits[pattern] += count
+
+
+def _sections(lines: list[str]) -> Iterator[tuple[str, list[str]]]:
+    """Yield header and lines of each section of an actionfile, lines before any header first."""
+    header = ""
+    section: list[str] = []
+    for line in lines:
+        if _SECTION.match(line):
+            if header or section:
+                yield header, section
+            header, section = line, []
+        else:
+            section.append(line)
+    if header or section:
+        yield header, section
+
+
+def trim_actions(lines: list[str], usage: Usage, keep_filters: set[str]) -> tuple[list[str], int]:
+    """Return given actionfile without unused block patterns and filters not in keep_filters.
+
+    Block patterns are only pruned if the logs contain requests, the number of pruned block
+    patterns is returned as well.
+    """
+    trimmed = []
+    pruned = 0
+    hosts = group_requests(usage.requests)
+    for header, section in _sections(lines):
+        activated = _FILTER_ACTION.match(header)
+        if activated is not None and activated.group(1) not in keep_filters:
+            continue
+        used = section
+        if header.startswith("{ +block{") and usage.requests:
+            patterns = Patterns(line for line in section if line)
+            patterns.match(hosts)
+            used = [line for line in section if not line or patterns.hits[line] > 0]
+            pruned += len(section) - len(used)
+        trimmed.extend(([header] if header else []) + used)
+    return trimmed, pruned
+
+
+def trim_filters(lines: list[str], usage: Usage) -> tuple[list[str], set[str], int]:
+    """Return given filterfile without content filters lacking hits and the kept filters.
+
+    Content filters are only pruned if the logs contain runs of them, as pruned filters are not run
+    by Privoxy anymore, the number of pruned content filters is returned as well.
+    """
+    trimmed = []
+    kept = set()
+    pruned = 0
+    keep = True
+    for line in lines:
+        header = _FILTER.match(line)
+        if header is not None:
+            keep = usage.filter_runs[header.group(1)] == 0 or usage.filters[header.group(1)] > 0
+            if keep:
+                kept.add(header.group(1))
+            else:
+                pruned += 1
+        if keep:
+            trimmed.append(line)
+    return trimmed, kept, pruned
+
+
+def _read_lines(path: Path) -> list[str]:
+    """Return lines of given generated file without line breaks."""
+    return path.read_text(encoding=ENCODING).splitlines()
+
+
+def _write_lines(path: Path, lines: list[str]) -> None:
+    """Write given lines into given generated file."""
+    with path.open("w", encoding=ENCODING, newline="\n") as output:
+        output.writelines(f"{line}\n" for line in lines)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Read logs or trim lists as given by command line arguments."""
+    parser = argparse.ArgumentParser(
+        prog="python3 -m privoxy_blocklist.prune",
+        description="Prune block patterns and content filters without hits in Privoxy logs.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    usage_parser = commands.add_parser("usage", help="read Privoxy logs into a usage file")
+    usage_parser.add_argument("log", nargs="+", type=Path, help="Privoxy log, may be gzipped")
+    usage_parser.add_argument("-o", "--output", required=True, type=Path, help="usage file")
+    usage_parser.add_argument(
+        "-d", "--days", type=int, default=30, help="only read last days of logs, 0 for all"
+    )
+    trim_parser = commands.add_parser("trim", help="prune lists in place by a usage file")
+    trim_parser.add_argument("actionfile", type=Path, help="generated actionfile")
+    trim_parser.add_argument("filterfile", type=Path, help="generated filterfile")
+    trim_parser.add_argument("-u", "--usage", required=True, type=Path, help="usage file")
+    for command_parser in (usage_parser, trim_parser):
+        command_parser.add_argument("-v", "--debug", type=int, default=0, help="verbosity like DBG")
+    args = parser.parse_args(argv)
+
+    def log(message: str) -> None:
+        if args.debug >= 0:
+            print(message, flush=True)  # noqa: T201
+
+    if args.command == "usage":
+        usage = Usage()
+        since = datetime.now() - timedelta(days=args.days) if args.days > 0 else None
+        for path in args.log:
+            with open_log(path) as log_file:
+                usage.read(log_file, since)
+        usage.dump(args.output)
+        log(
+            f"... read {sum(usage.requests.values())} requests and"
+            f" {sum(usage.filter_runs.values())} content filter runs from the logs."
+        )
+        if not usage.requests:
+            log("... no requests found, block patterns are not pruned (needs debug 1 or 1024).")
+        if not usage.filter_runs:
+            log(
+                "... no content filter runs found, content filters are not pruned (needs debug 64)."
+            )
+        return 0
+
+    usage = Usage.load(args.usage)
+    filters, kept, pruned_filters = trim_filters(_read_lines(args.filterfile), usage)
+    actions, pruned_patterns = trim_actions(_read_lines(args.actionfile), usage, kept)
+    _write_lines(args.actionfile, actions)
+    _write_lines(args.filterfile, filters)
+    log(
+        f"... pruned {pruned_patterns} block patterns and {pruned_filters} content filters"
+        " without hits."
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
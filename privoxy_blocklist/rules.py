@@ -0,0 +1,85 @@
+"""Typed model of AdblockPlus rules, classified like classify() of privoxy-blocklist.sh."""
+
+import re
+from typing import Iterable, Iterator
+
+# rule types in the order of the counts printed by classify()
+RULE_TYPES = (
+    "domain",
+    "domain_except",
+    "address",
+    "address_except",
+    "url",
+    "url_except",
+    "regex",
+    "regex_except",
+    "html",
+    "html_except",
+    "image_except",
+)
+
+# precompiled matcher of each rule type and the first character of matching rules
+#   a rule matches every type whose regex is found, HTML element rules may start with any character
+CLASSIFIERS = (
+    # domain-name block
+    ("domain", "|", re.compile(r"^\|\|")),
+    ("domain_except", "@", re.compile(r"^@@\|\|")),
+    # exact address block
+    ("address", "|", re.compile(r"^\|[^|].*\|")),
+    ("address_except", "@", re.compile(r"^@@\|[^|].*\|")),
+    # url block
+    ("url", "/", re.compile(r"^/[^^]")),
+    ("url_except", "@", re.compile(r"^@@/[^^]")),
+    # regex block
+    ("regex", "/", re.compile(r"^/\^")),
+    ("regex_except", "@", re.compile(r"^@@/\^")),
+    # html element block
+    ("html", "", re.compile(r"##.")),
+    ("html_except", "", re.compile(r"#@#.")),
+    # image allowlist
+    ("image_except", "@", re.compile(r"^@@.*\$.*image")),
+)
+# matchers to try for rules starting with each character, any other start only allows HTML rules
+_CANDIDATES = {
+    first: tuple(
+        (rule_type, regex) for rule_type, start, regex in CLASSIFIERS if start in ("", first)
+    )
+    for first in "|/@"
+}
+_HTML = tuple((rule_type, regex) for rule_type, start, regex in CLASSIFIERS if not start)
+
+
+class Rule:
+    """Single rule of an AdblockPlus list and all rule types it matches."""
+
+    __slots__ = ("text", "types")
+
+    def __init__(self, text: str, types: tuple[str, ...]) -> None:
+        """Store rule text without line break and its types."""
+        self.text = text
+        self.types = types
+
+    def __repr__(self) -> str:
+        """Return representation for debugging."""
+        return f"Rule({self.text!r}, {self.types!r})"
+
+    def __eq__(self, other: object) -> bool:
+        """Compare text and types of rules."""
+        if not isinstance(other, Rule):
+            return NotImplemented
+        return self.text == other.text and self.types == other.types
+
+    __hash__ = None  # type: ignore[assignment]
+
+
+def classify(text: str) -> tuple[str, ...]:
+    """Return all rule types matched by given rule."""
+    candidates = _CANDIDATES.get(text[:1], _HTML)
+    return tuple(rule_type for rule_type, regex in candidates if regex.search(text))
+
+
+def parse_rules(lines: Iterable[str]) -> Iterator[Rule]:
+    """Parse given lines of a list without comments into rules, line breaks are removed."""
+    for line in lines:
+        text = line[:-1] if line.endswith("\n") else line
+        yield Rule(text, classify(text))
@@ -0,0 +1,272 @@
+"""Conversion of HTML element rules into jobs of Privoxy content filters.
+
+The functions mirror split_selectors(), job_template(), domain_selectors() and merge_selectors()
+of privoxy-blocklist.sh, selectors are prepared for regex merging by a trailing "|".
+"""
+
+import re
+from typing import Iterable, Iterator, Optional
+
+# global content filters in the order they are written into the filterfile
+GLOBAL_FILTERS = (
+    "class_global",
+    "id_global",
+    "attribute_global_name",
+    "attribute_global_exact",
+    "attribute_global_contain",
+    "attribute_global_startswith",
+    "attribute_global_endswith",
+)
+# domain based content filters in the order of their jobs within each domain filter
+DOMAIN_FILTERS = tuple(name.replace("_global", "_domain") for name in GLOBAL_FILTERS)
+
+# GNU sed matches \s by these characters only
+_SPACE = "[ \t\n\r\f\v]"
+_COMBINATORS = re.compile(r"^##.*[>+~ ]")
+_DOTS = re.compile(r"\.([^\\.])")
+
+_CLASS_GLOBAL = re.compile(r"^##\.")
+_CLASS_ATTRIBUTE = re.compile(r"^##\..*\[")
+_CLASS_COMBINATORS = re.compile(r"^##\..*[>+~ :]")
+_ID_GLOBAL = re.compile(r"^###")
+_ID_COMBINATORS = re.compile(r"^###.*[>+~ ]")
+_NAME_GLOBAL = re.compile(r"##\[[^=]+")
+_NAME = re.compile(r"^\[([^=]+)\]")
+_NAME_COMBINED = re.compile(r"\]" + _SPACE + r"*\[")
+_EXACT_GLOBAL = re.compile(r"^##\[[^=^*]+=")
+_EXACT = re.compile(r"^\[([^=]+)=(.*)\]")
+_CONTAIN_GLOBAL = re.compile(r"^##\[[^*]+\*=")
+_CONTAIN = re.compile(r"""^\[([^*]+)\*=(["']*)([^"]+)"*(["']*)\]""")
+_STARTSWITH_GLOBAL = re.compile(r"^##\[[^=^]+\^=")
+_STARTSWITH = re.compile(r"""^\[([^^]+)\^=(["']*)(.*[^"'])(["']*)\]""")
+_ENDSWITH_GLOBAL = re.compile(r"^##\[[^$][^=$]*\$=")
+_ENDSWITH = re.compile(r"""^\[([^\\$]+)\$=(["']*)(.*[^"'])(["']*)\]""")
+
+_DOMAIN = re.compile(r"[a-z0-9][a-z0-9.-]*")
+_DOMAIN_WILDCARD = re.compile(r"[.][*]$")
+_KEYED = re.compile(r"^(.*)#([^#]*)\|$")
+_FILTER_NAME = re.compile(r"[^a-zA-Z0-9._-]")
+# regex atom of a selector followed by its quantifiers: an escaped character, a bracket expression
+#   or any character except groups, alternations, braces and unterminated bracket expressions
+#   the lookahead keeps a leading ^ and ] of bracket expressions from backtracking like awk
+_ATOM = re.compile(
+    r"(?:\\.?|\[(?=(\^?\]?))\1(?:\\.|[^\]\\])*\]|[^(){}|\[\\])(?:[*+?][?+]?)*", re.DOTALL
+)
+
+
+def _escape_dots(selector: str) -> str:
+    """Return given selector with dots escaped for regex matching."""
+    return _DOTS.sub(r"\\.\1", selector)
+
+
+def split_selectors(rule: str) -> Iterator[tuple[str, str]]:
+    """Yield global content filter and selector for each filter matching given HTML element rule."""
+    # only process gloabl class matches without attribute matching and combinators
+    if (
+        _CLASS_GLOBAL.match(rule)
+        and not _CLASS_ATTRIBUTE.match(rule)
+        and not _CLASS_COMBINATORS.match(rule)
+    ):
+        yield "class_global", rule[3:] + "|"
+    # only process gloabl id-only matches without combinators
+    if _ID_GLOBAL.match(rule) and not _ID_COMBINATORS.match(rule):
+        yield "id_global", rule[3:] + "|"
+    if _COMBINATORS.match(rule):
+        return
+    # convert attribute name-only matches including combined ones (e.g. ##[data-freestar-ad][id])
+    if _NAME_GLOBAL.fullmatch(rule):
+        selector = _escape_dots(_NAME.sub(r"\1", rule[2:], count=1))
+        yield "attribute_global_name", _NAME_COMBINED.sub("[^>]*", selector) + "|"
+    if _EXACT_GLOBAL.match(rule):
+        yield "attribute_global_exact", _escape_dots(_EXACT.sub(r"\1=\2", rule[2:], count=1)) + "|"
+    # attributes with contain, startswith and endswith match are converted after escaping dots
+    if _CONTAIN_GLOBAL.match(rule):
+        selector = _CONTAIN.sub(r"\1=\2[^>]*\3[^>]*\4", _escape_dots(rule[2:]), count=1)
+        yield "attribute_global_contain", selector + "|"
+    if _STARTSWITH_GLOBAL.match(rule):
+        selector = _STARTSWITH.sub(r"\1=\2\3[^>]*\4", _escape_dots(rule[2:]), count=1)
+        yield "attribute_global_startswith", selector + "|"
+    if _ENDSWITH_GLOBAL.match(rule):
+        selector = _ENDSWITH.sub(r"\1=\2[^>]*\3\4", _escape_dots(rule[2:]), count=1)
+        yield "attribute_global_endswith", selector + "|"
+
+
+def job_template(filter_type: str) -> tuple[str, str]:
+    """Return regex prefix and suffix of jobs of given content filter."""
+    if filter_type.startswith("class_"):
+        return (
+            """s@<([a-zA-Z0-9]+)\\s[^>]*class=["'][^"']*(""",
+            """)[^"']*["'][^>]*>.*?<\\/\\1[^>]*>@@g""",
+        )
+    if filter_type.startswith("id_"):
+        return (
+            """s@<([a-zA-Z0-9]+)\\s[^>]*id=["'](""",
+            """)["'][^>]*>.*?<\\/\\1[^>]*>@@g""",
+        )
+    return "s@<([a-zA-Z0-9]+)\\s[^>]*(", ")[^>]*>.*?<\\/\\1[^>]*>@@g"
+
+
+def domain_selectors(rule: str) -> Iterator[str]:
+    """Yield given element hiding rule restricted to domains as one global rule per domain.
+
+    The domain is appended after a "#", e.g. example.com,example.org##.ad becomes ##.ad#example.com
+    and ##.ad#example.org, rules excluding domains by ~ are skipped.
+    """
+    domains, _, selector = rule.partition("##")
+    if domains == "" or "~" in domains:
+        return
+    for entry in domains.split(","):
+        # entity wildcards like example.* match any top-level domain by Privoxy's trailing dot
+        domain = _DOMAIN_WILDCARD.sub(".", entry.lower(), count=1)
+        if _DOMAIN.fullmatch(domain):
+            yield f"##{selector}#{domain}"
+
+
+def domain_key(selector: str) -> str:
+    """Return selector of a domain based rule keyed by its domain, e.g. "example.com ad|"."""
+    match = _KEYED.match(selector)
+    if match:
+        selector = f"{match.group(2)} {match.group(1)}|"
+    # dots of domains were escaped for attribute filters
+    domain = selector.split(" ", 1)[0]
+    return domain.replace("\\.", ".") + selector[len(domain) :]
+
+
+def domain_filter_name(list_name: str, domain: str) -> str:
+    """Return name of content filter of given list and domain."""
+    return _FILTER_NAME.sub("_", f"{list_name}_domain_{domain}")
+
+
+def _tokenize(selector: str) -> Optional[list[str]]:
+    """Return regex atoms of given selector including their quantifiers.
+
+    Returns None for selectors which cannot be factored safely (groups, alternations, braces).
+    """
+    tokens = []
+    position = 0
+    while position < len(selector):
+        atom = _ATOM.match(selector, position)
+        if atom is None:
+            return None
+        tokens.append(atom.group())
+        position = atom.end()
+    return tokens
+
+
+def _factor(tokens: list[list[str]], first: int, last: int, depth: int, top: bool) -> str:
+    """Return alternation of selectors first to last which share their first depth atoms."""
+    alternatives = []
+    optional = False
+    index = first
+    while index <= last:
+        if len(tokens[index]) <= depth:
+            # selector is a prefix of the following ones
+            optional = True
+            index += 1
+            continue
+        next_index = index
+        while (
+            next_index < last
+            and len(tokens[next_index + 1]) > depth
+            and tokens[next_index + 1][depth] == tokens[index][depth]
+        ):
+            next_index += 1
+        if next_index == index:
+            alternatives.append("".join(tokens[index][depth:]))
+        else:
+            alternatives.append(
+                tokens[index][depth] + _factor(tokens, index, next_index, depth + 1, False)
+            )
+        index = next_index + 1
+    result = "|".join(alternatives)
+    if top or (len(alternatives) == 1 and not optional):
+        return result
+    return f"(?:{result})" + ("?" if optional else "")
+
+
+class _Job:
+    """Selectors of one job of merge_selectors() and its size."""
+
+    __slots__ = ("bytes", "key", "plain", "selectors", "tokens")
+
+    def __init__(self, key: Optional[str], template_bytes: int) -> None:
+        self.key = key
+        self.bytes = template_bytes
+        # selectors which cannot be factored are appended to the factored ones
+        self.plain: list[str] = []
+        self.selectors = 0
+        self.tokens: list[list[str]] = []
+
+    def add(self, selector: str) -> None:
+        """Add given selector without trailing "|" to the job."""
+        tokens = _tokenize(selector)
+        if tokens is None:
+            self.plain.append(selector)
+        else:
+            self.tokens.append(tokens)
+        self.bytes += len(selector) + 1
+        self.selectors += 1
+
+    def flush(self, prefix: str, suffix: str, max_bytes: int) -> Iterator[str]:
+        """Yield jobs of all added selectors using given regex prefix and suffix."""
+        if self.selectors > 0:
+            yield from self.emit(prefix, suffix, max_bytes, 0, len(self.tokens) - 1)
+
+    def emit(
+        self, prefix: str, suffix: str, max_bytes: int, first: int, last: int
+    ) -> Iterator[str]:
+        """Yield job of factored selectors first to last, the last part gets the plain selectors.
+
+        Jobs exceeding the byte budget are split in halves as factoring adds groups to the regex.
+        """
+        alternation = _factor(self.tokens, first, last, 0, True) if first <= last else ""
+        if last == len(self.tokens) - 1 and self.plain:
+            alternation += ("|" if alternation else "") + "|".join(self.plain)
+        if first < last and len(prefix + alternation + suffix) > max_bytes:
+            middle = (first + last) // 2
+            yield from self.emit(prefix, suffix, max_bytes, first, middle)
+            yield from self.emit(prefix, suffix, max_bytes, middle + 1, last)
+            return
+        yield (f"{self.key} " if self.key is not None else "") + prefix + alternation + suffix
+
+
+def merge_selectors(  # noqa: PLR0913
+    selectors: Iterable[str],
+    prefix: str,
+    suffix: str,
+    *,
+    max_selectors: int = 1000,
+    max_bytes: int = 32768,
+    keyed: bool = False,
+) -> Iterator[str]:
+    """Yield jobs merging given sorted selectors using given regex prefix and suffix.
+
+    With keyed each selector is prefixed by a key and a space, e.g. its domain, selectors of
+    different keys never share a job and each job is prefixed by its key and a space.
+    Size of each job is limited by max_selectors and max_bytes, common prefixes of selectors are
+    factored into a trie-shaped regex, e.g. ad(?:-(?:banner|box)|vert).
+    """
+    template_bytes = len(prefix + suffix)
+    job = _Job("" if keyed else None, template_bytes)
+    for line in selectors:
+        selector = line
+        if keyed:
+            # start a new job for each key
+            separator = line.find(" ")
+            key, selector = line[: max(separator, 0)], line[separator + 1 :]
+            if key != job.key:
+                yield from job.flush(prefix, suffix, max_bytes)
+                job = _Job(key, template_bytes)
+        # selectors end with "|" for regex merging
+        selector = selector.removesuffix("|")
+        if not selector:
+            continue
+        # start a new job if the selector would exceed the byte budget of the current one
+        if job.selectors > 0 and job.bytes + len(selector) + 1 > max_bytes:
+            yield from job.flush(prefix, suffix, max_bytes)
+            job = _Job(job.key, template_bytes)
+        job.add(selector)
+        if job.selectors >= max_selectors:
+            yield from job.flush(prefix, suffix, max_bytes)
+            job = _Job(job.key, template_bytes)
+    yield from job.flush(prefix, suffix, max_bytes)
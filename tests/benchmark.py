@@ -0,0 +1,331 @@
+"""Helpers to generate synthetic lists and pages and to evaluate generated filters."""
+
+import json
+import os
+import re
+import sys
+from datetime import datetime, timezone
+from itertools import islice, product
+from math import log
+from pathlib import Path
+from shutil import copyfile, which
+from statistics import quantiles
+from subprocess import run
+from tempfile import mkdtemp
+from time import perf_counter
+from typing import Optional
+
+import pytest
+import requests
+from pytestshellutils.shell import ProcessResult, Subprocess
+
+from conftest import EXIT_SUCCESS, is_openwrt
+
+# benchmarks take long and only report timings, run them on demand
+requires_benchmark = pytest.mark.skipif(
+    os.environ.get("BENCHMARK", None) is None,
+    reason="benchmarks are only run when BENCHMARK is set",
+)
+
+# templates of jobs generated by privoxy-blocklist.sh per filter type as (prefix, suffix)
+JOB_TEMPLATES = {
+    "class_global": (
+        r"""<([a-zA-Z0-9]+)\s[^>]*class=["'][^"']*(""",
+        r""")[^"']*["'][^>]*>.*?<\/\1[^>]*>""",
+    ),
+    "id_global": (
+        r"""<([a-zA-Z0-9]+)\s[^>]*id=["'](""",
+        r""")["'][^>]*>.*?<\/\1[^>]*>""",
+    ),
+    "attribute": (
+        r"""<([a-zA-Z0-9]+)\s[^>]*(""",
+        r""")[^>]*>.*?<\/\1[^>]*>""",
+    ),
+}
+# templates used before matching was limited to the opening tag and the first closing tag
+LEGACY_JOB_TEMPLATES = {
+    "class_global": (
+        r"""<([a-zA-Z0-9]+)\s+.*class=["'][^"']*(""",
+        r""")[^"']*["'].*>.*<\/\1[^>]*>""",
+    ),
+    "id_global": (
+        r"""<([a-zA-Z0-9]+)\s+.*id=["'](""",
+        r""")["'].*>.*<\/\1[^>]*>""",
+    ),
+    "attribute": (
+        r"""<([a-zA-Z0-9]+)\s+.*(""",
+        r""").*>.*<\/\1[^>]*>""",
+    ),
+}
+
+# directory keeping results of benchmark runs to compare them for regressions
+RESULTS_DIR = Path(
+    os.environ.get("BENCHMARK_RESULTS", str(Path(__file__).parent.parent / ".benchmarks"))
+)
+
+# weight of each rule type within synthetic lists
+RULE_MIX = {"domain": 50, "address": 5, "exception": 10, "class": 15, "id": 10, "attribute": 10}
+
+# runs given command and prints its wall time and the peak RSS of its largest process as JSON
+#   ru_maxrss is given in KiB on Linux
+MEASURE_WRAPPER = """
+import json, resource, subprocess, sys, time
+start = time.perf_counter()
+returncode = subprocess.run(sys.argv[1:], check=False).returncode
+wall_time = time.perf_counter() - start
+peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+print(json.dumps({"wall_time": wall_time, "peak_rss_kib": peak_rss}))
+sys.exit(returncode)
+"""
+
+SELECTOR_PREFIXES = ["ad", "ads", "advert", "banner", "promo", "sponsor"]
+SELECTOR_SEPARATORS = ["-", "_", ""]
+SELECTOR_SYLLABLES = ["box", "top", "side", "wrap", "unit", "slot", "frame", "tile", "zone"]
+
+
+def generate_selectors(count: int) -> list[str]:
+    """Return given number of unique, deterministic selectors sharing prefixes like real lists."""
+    return [
+        f"{prefix}{separator}{first}{second}{number}"
+        for number, prefix, separator, first, second in islice(
+            product(
+                ["", *map(str, range(1, 1000))],
+                SELECTOR_PREFIXES,
+                SELECTOR_SEPARATORS,
+                SELECTOR_SYLLABLES,
+                SELECTOR_SYLLABLES,
+            ),
+            count,
+        )
+    ]
+
+
+def generate_list(count: int, mix: Optional[dict[str, int]] = None) -> str:
+    """Return deterministic AdblockPlus list with given number of rules distributed by given mix."""
+    # weighted round-robin keeps the distribution exact without randomness
+    slots = [rule_type for rule_type, weight in (mix or RULE_MIX).items() for _ in range(weight)]
+    attributes = [
+        '##[data-{}="1"]',
+        "##[data-{}]",
+        '##[href*="{}"]',
+        '##[class^="{}"]',
+        '##[src$="{}.gif"]',
+    ]
+    rules = ["[Adblock Plus 2.0]", "! Title: synthetic list", "! Expires: 4 days"]
+    for index, name in enumerate(generate_selectors(count)):
+        rule_type = slots[index % len(slots)]
+        if rule_type == "domain":
+            rules.append(f"||{name}.com^")
+        elif rule_type == "address":
+            rules.append(f"|http://{name}.net/banner/|")
+        elif rule_type == "exception":
+            rules.append(f"@@||{name}.org^")
+        elif rule_type == "class":
+            rules.append(f"##.{name}")
+        elif rule_type == "id":
+            rules.append(f"###{name}")
+        else:
+            rules.append(attributes[index % len(attributes)].format(name))
+    return "\n".join(rules) + "\n"
+
+
+def generate_page(selectors: list[str], size: int, minified: bool = False) -> str:
+    """Return HTML page of at least given size in bytes with few elements matching selectors.
+
+    Minified pages contain all elements within one line like many pages delivered today.
+    """
+    lines = ["<html><body>"]
+    length = 0
+    index = 0
+    while length < size:
+        if index % 50 == 0 and selectors:
+            selector = selectors[index % len(selectors)]
+            line = f'<div class="wrapper {selector}"><p>advertisement {index}</p></div>'
+        else:
+            line = (
+                f'<div id="content-{index}" class="content article">'
+                f"<p>just some text {index}</p></div>"
+            )
+        lines.append(line)
+        length += len(line) + 1
+        index += 1
+    lines.append("</body></html>")
+    return ("" if minified else "\n").join(lines)
+
+
+def convert_command(
+    privoxy_blocklist: str,
+    privoxy_config: str,
+    httpserver,
+    content: str,
+    *filters: str,
+) -> tuple[list[str], Path]:
+    """Return command converting given list content with given filters and the lists directory."""
+    privoxy_config_dir = mkdtemp()
+    privoxy_config_test = f"{privoxy_config_dir}/test_config"
+    lists_dir = Path(f"{privoxy_config_dir}/lists")
+    if is_openwrt():
+        copyfile("/etc/config/privoxy", privoxy_config_test)
+    else:
+        copyfile(privoxy_config, privoxy_config_test)
+    httpserver.expect_request("/benchmark.txt").respond_with_data(content)
+    command = [
+        privoxy_blocklist,
+        "-A",
+        "-C",
+        "-p",
+        privoxy_config_test,
+        "-d",
+        str(lists_dir),
+        "-v",
+        "1",
+        "-t",
+        f"{privoxy_config_dir}/convert",
+        "-u",
+        httpserver.url_for("/benchmark.txt"),
+    ]
+    for filter_type in filters:
+        command.extend(["-f", filter_type])
+    return command, lists_dir
+
+
+def convert_list(
+    shell: Subprocess,
+    privoxy_blocklist: str,
+    privoxy_config: str,
+    httpserver,
+    content: str,
+    *filters: str,
+) -> Path:
+    """Convert given list content with given filters and return the lists directory."""
+    command, lists_dir = convert_command(
+        privoxy_blocklist, privoxy_config, httpserver, content, *filters
+    )
+    process = shell.run(*command)
+    assert process.returncode == EXIT_SUCCESS
+    return lists_dir
+
+
+def measure(shell: Subprocess, command: list[str]) -> tuple[ProcessResult, dict[str, float]]:
+    """Run given command and return its result, wall time and peak RSS."""
+    process = shell.run(sys.executable, "-c", MEASURE_WRAPPER, *command)
+    return process, json.loads(process.stdout.splitlines()[-1])
+
+
+def count_rules(lists_dir: Path, output: str) -> dict[str, dict[str, int]]:
+    """Return rules per type of the input and patterns per action and jobs per filter of output."""
+    input_rules = {}
+    match = re.search(r"rules per type: (.*)", output)
+    if match:
+        for count in match.group(1).split():
+            rule_type, _, number = count.partition("=")
+            input_rules[rule_type] = int(number)
+    patterns: dict[str, int] = {}
+    action = ""
+    for action_file in sorted(lists_dir.glob("*.script.action")):
+        for line in action_file.read_text(encoding="UTF-8").splitlines():
+            if line.startswith("{"):
+                # use action without list name, e.g. +block from { +block{easylist} }
+                action = re.sub(r"(?<=\w)\{[^{}]*\}", "", line).strip("{} ")
+            elif line and not line.startswith("#"):
+                patterns[action] = patterns.get(action, 0) + 1
+    jobs = {}
+    for filter_file in sorted(lists_dir.glob("*.script.filter")):
+        for name, filter_jobs in read_filters(filter_file).items():
+            jobs[name.split("_", 1)[1]] = len(filter_jobs)
+    return {"input": input_rules, "action_patterns": patterns, "filter_jobs": jobs}
+
+
+def proxy_latencies(url: str, count: int) -> list[float]:
+    """Return latency in milliseconds of given number of requests for given URL through Privoxy."""
+    latencies = []
+    with requests.Session() as session:
+        session.proxies = {"http": "http://localhost:8118"}
+        for _ in range(count):
+            start = perf_counter()
+            response = session.get(url, timeout=60)
+            latencies.append((perf_counter() - start) * 1000)
+            assert response.status_code == requests.codes.ok
+    return latencies
+
+
+def percentiles(latencies: list[float]) -> dict[str, float]:
+    """Return p50, p95 and p99 of given latencies."""
+    cut_points = quantiles(latencies, n=100, method="inclusive")
+    return {"p50": cut_points[49], "p95": cut_points[94], "p99": cut_points[98]}
+
+
+def growth_exponent(sizes: list[int], costs: list[float]) -> float:
+    """Return exponent of power-law fitted to given costs over sizes, 1 means linear growth."""
+    points = [(log(size), log(cost)) for size, cost in zip(sizes, costs, strict=True) if cost > 0]
+    # at least two different sizes are needed for a fit
+    if len({x for x, _ in points}) <= 1:
+        return 0.0
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+def load_results(name: str) -> list[dict]:
+    """Return all saved runs of benchmark with given name, oldest first."""
+    return [
+        json.loads(result_file.read_text(encoding="UTF-8"))
+        for result_file in sorted(RESULTS_DIR.glob(f"{name}-*.json"))
+    ]
+
+
+def save_results(name: str, results: list[dict]) -> Path:
+    """Save given results of benchmark with given name and return path of the result file."""
+    revision = "unknown"
+    git = which("git")
+    if git:
+        git_run = run(
+            [git, "-C", str(Path(__file__).parent), "rev-parse", "--short", "HEAD"],
+            check=False,
+            capture_output=True,
+            text=True,
+        )
+        if git_run.returncode == 0:
+            revision = git_run.stdout.strip()
+    now = datetime.now(timezone.utc)
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    result_file = RESULTS_DIR / f"{name}-{now:%Y%m%dT%H%M%S}.json"
+    result_file.write_text(
+        json.dumps(
+            {"timestamp": now.isoformat(), "revision": revision, "results": results}, indent=2
+        ),
+        encoding="UTF-8",
+    )
+    return result_file
+
+
+def read_filters(filter_file: Path) -> dict[str, list[str]]:
+    """Return regex of all jobs per filter of given Privoxy filterfile."""
+    filters: dict[str, list[str]] = {}
+    jobs: list[str] = []
+    for line in filter_file.read_text(encoding="UTF-8").splitlines():
+        if line.startswith("FILTER: "):
+            jobs = filters.setdefault(line.split()[1], [])
+        elif line.startswith("s@") and line.endswith("@@g"):
+            jobs.append(line[2:-3])
+    return filters
+
+
+def legacy_job(filter_type: str, job: str) -> str:
+    """Return given generated job converted to the legacy template of its filter type."""
+    template_type = filter_type if filter_type in JOB_TEMPLATES else "attribute"
+    prefix, suffix = JOB_TEMPLATES[template_type]
+    legacy_prefix, legacy_suffix = LEGACY_JOB_TEMPLATES[template_type]
+    assert job.startswith(prefix)
+    assert job.endswith(suffix)
+    selectors = job[len(prefix) : -len(suffix)].replace("[^>]*", ".*")
+    return legacy_prefix + selectors + legacy_suffix
+
+
+def apply_jobs(jobs: list[re.Pattern], content: str) -> tuple[str, float]:
+    """Apply all jobs to given content like Privoxy and return result and runtime in seconds."""
+    start = perf_counter()
+    for job in jobs:
+        content = job.sub("", content)
+    return content, perf_counter() - start
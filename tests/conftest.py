@@ -6,7 +6,7 @@ from re import search
 from shutil import copyfile, which
 from subprocess import run
 from tempfile import mkdtemp
-from typing import Generator, Optional
+from typing import Callable, Generator, Optional
 
 import pytest
 import requests
@@ -203,6 +203,56 @@ def webserver(httpserver) -> UrlParsed:
     return UrlParsed(httpserver.url_for("/"))
 
 
+@pytest.fixture
+def install_list(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> Generator[Callable[..., None], None, None]:
+    """Return function installing list of given name and content with given filters into Privoxy.
+
+    Installed lists are removed again afterwards.
+    """
+    names = set()
+
+    def install(name: str, content: str, *filters: str) -> None:
+        if name not in names:
+            httpserver.expect_request(f"/{name}.txt").respond_with_data(content)
+            names.add(name)
+        command = [
+            privoxy_blocklist,
+            "-C",
+            "-v",
+            "1",
+            "-t",
+            f"{mkdtemp()}/{name}",
+            "-u",
+            httpserver.url_for(f"/{name}.txt"),
+        ]
+        for filter_type in filters:
+            command.extend(["-f", filter_type])
+        process = shell.run(*command)
+        assert process.returncode == EXIT_SUCCESS
+        if is_openwrt():
+            run_generate_config(shell)
+
+    yield install
+
+    # remove installed lists to keep Privoxy configuration of following tests
+    config_path = Path("/etc/config/privoxy" if is_openwrt() else privoxy_config)
+    config_path.write_text(
+        "".join(
+            line
+            for line in config_path.read_text(encoding="UTF-8").splitlines(keepends=True)
+            if not any(f"/{name}.script." in line for name in names)
+        ),
+        encoding="UTF-8",
+    )
+    for name in names:
+        for list_file in config_path.parent.glob(f"{name}.script.*"):
+            list_file.unlink()
+    if is_openwrt():
+        run_generate_config(shell)
+
+
 @pytest.fixture(scope="module")
 def filtertypes() -> list[str]:
     """Return filtertypes supported by privoxy-blocklist."""
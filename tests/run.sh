@@ -68,12 +68,12 @@ for os in ${oses}; do
 
     if [ "${interactive}" -eq 0 ]; then
         echo "running tests on ${os}"
-        if ! docker run --rm -w /app -v "${GIT_DIR}:/app" -v "${pytest_cache}:/pytest_cache" "${img_tag}" "${@:-./tests}"; then
+        if ! docker run --rm -e BENCHMARK -e ENGINE -e BENCHMARK_REQUESTS -e BENCHMARK_TOLERANCE -w /app -v "${GIT_DIR}:/app" -v "${pytest_cache}:/pytest_cache" "${img_tag}" "${@:-./tests}"; then
             fails="${fails} ${os}"
         fi
     else
         echo "interactive mode on ${os}"
-        docker run -ti --rm -w /app -v "${GIT_DIR}:/app" -v "${pytest_cache}:/pytest_cache" --entrypoint /bin/bash "${img_tag}"
+        docker run -ti --rm -e BENCHMARK -e ENGINE -e BENCHMARK_REQUESTS -e BENCHMARK_TOLERANCE -w /app -v "${GIT_DIR}:/app" -v "${pytest_cache}:/pytest_cache" --entrypoint /bin/bash "${img_tag}"
     fi
 done
 
@@ -20,6 +20,15 @@ def test_permissions() -> None:
         "LICENSE",
         ".pre-commit-config.yaml",
         "README.md",
+        "privoxy_blocklist/__init__.py",
+        "privoxy_blocklist/__main__.py",
+        "privoxy_blocklist/analyze.py",
+        "privoxy_blocklist/converter.py",
+        "privoxy_blocklist/patterns.py",
+        "privoxy_blocklist/prune.py",
+        "privoxy_blocklist/rules.py",
+        "privoxy_blocklist/selectors.py",
+        "tests/benchmark.py",
         "tests/config.py",
         "tests/configs/debugging.conf",
         "tests/configs/url_extended_config.conf",
@@ -33,6 +42,11 @@ def test_permissions() -> None:
         "tests/test_00_minimal.py",
         "tests/test_01_root_execute.py",
         "tests/test_02_non_root_execute.py",
+        "tests/test_50_benchmark_filters.py",
+        "tests/test_51_benchmark_templates.py",
+        "tests/test_52_benchmark_conversion.py",
+        "tests/test_53_benchmark_latency.py",
+        "tests/test_54_benchmark_page_size.py",
         "tests/test_99_helper.py",
     ]
     for filepath in executables:
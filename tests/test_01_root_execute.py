@@ -1,15 +1,26 @@
 """Test execution as root."""
 
+import gzip
+import json
+import os
+import signal
+import sys
+import tarfile
+import time
+from datetime import datetime, timedelta
 from pathlib import Path
 from shutil import copyfile, copymode
-from subprocess import run
+from subprocess import DEVNULL, Popen, run
 from tempfile import mkdtemp
+from threading import Event
 
 import requests
 from pytestshellutils.customtypes import EnvironDict
 from pytestshellutils.shell import Subprocess
+from werkzeug import Request, Response
 
 import config
+from benchmark import convert_command, generate_list, generate_selectors, measure
 from conftest import (
     EXIT_CREATE_DEFAULT,
     EXIT_MISSING_ARGUMENT,
@@ -22,6 +33,13 @@ from conftest import (
     run_generate_config,
 )
 
+# documented peak memory of each process while streaming a list
+STREAMING_MAX_RSS_KIB = 32 * 1024
+# runs of the scheduler expected within its timeout
+SCHEDULER_MIN_RUNS = 2
+# documented bound of pruning a list of 20000 rules by 50000 logged requests
+PRUNE_MAX_SECONDS = 5
+
 
 def test_config_generator(
     shell: Subprocess,
@@ -219,6 +237,28 @@ def test_config_update(
         '"https://test_url.update_in_config"',
         Path(privoxy_blocklist_config).read_text(encoding="UTF-8"),
     )
+    # check PARALLEL_DOWNLOADS change
+    process = shell.run(privoxy_blocklist, "-U", "-j", "2")
+    assert process.returncode == 0
+    assert check_in(
+        "PARALLEL_DOWNLOADS=2", Path(privoxy_blocklist_config).read_text(encoding="UTF-8")
+    )
+    # check content filter job budget is kept
+    config_file = Path(privoxy_blocklist_config)
+    config_file.write_text(
+        config_file.read_text(encoding="UTF-8").replace(
+            "FILTER_MAX_SELECTORS=1000", "FILTER_MAX_SELECTORS=500"
+        ),
+        encoding="UTF-8",
+    )
+    process = shell.run(privoxy_blocklist, "-U", "-j", "4")
+    assert process.returncode == 0
+    assert check_in(
+        "FILTER_MAX_SELECTORS=500", Path(privoxy_blocklist_config).read_text(encoding="UTF-8")
+    )
+    assert check_in(
+        "FILTER_MAX_BYTES=32768", Path(privoxy_blocklist_config).read_text(encoding="UTF-8")
+    )
 
 
 def test_env_based_config(shell: Subprocess, privoxy_blocklist: str, privoxy_config: str) -> None:
@@ -247,6 +287,7 @@ def test_env_based_config(shell: Subprocess, privoxy_blocklist: str, privoxy_con
     assert process.returncode == EXIT_WRONG_URL
     assert check_in("URLs: https://foo", process.stdout)
     assert check_in("TMPDIR: /temp/blub", process.stdout)
+    assert check_in("Downloading https://foo failed with exit code 4.", process.stderr)
 
     privoxy_config_test = f"{mkdtemp()}/test_config"
     if is_openwrt():
@@ -345,6 +386,7 @@ def test_argument_based_config(
     assert process.returncode == EXIT_SUCCESS
     assert check_in("URLs: https://easylist.to/easylist/easyprivacy.txt", process.stdout)
     assert check_in("TMPDIR: /temp/blub3", process.stdout)
+    assert check_in("... rules per type: domain=", process.stdout)
     assert check_in("Content filters: class_global", process.stdout)
     assert check_in("Running in Activate Mode", process.stdout)
     assert check_in(f"Target directory for lists: {lists_dir}", process.stdout)
@@ -414,6 +456,1100 @@ def test_convert_mode(shell: Subprocess, privoxy_blocklist: str, privoxy_config:
         )
 
 
+def test_download_cache(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> None:
+    """Test persistent download cache using conditional requests and list expiration."""
+    privoxy_config_dir = mkdtemp()
+    privoxy_config_test = f"{privoxy_config_dir}/test_config"
+    lists_dir = f"{privoxy_config_dir}/lists"
+    cache_dir = f"{privoxy_config_dir}/cache"
+    if is_openwrt():
+        copyfile("/etc/config/privoxy", privoxy_config_test)
+    else:
+        copyfile(privoxy_config, privoxy_config_test)
+    httpserver.expect_request(
+        "/conditional.txt", headers={"If-None-Match": '"v1"'}
+    ).respond_with_data("", status=304)
+    httpserver.expect_request("/conditional.txt").respond_with_data(
+        "[Adblock Plus 2.0]\n||andrwe.org/ads/^\n", headers={"ETag": '"v1"'}
+    )
+    httpserver.expect_request("/expires.txt").respond_with_data(
+        "[Adblock Plus 2.0]\n! Expires: 4 days (update frequency)\n||andrwe.jp/ads/^\n"
+    )
+    cmd = [
+        privoxy_blocklist,
+        "-A",
+        "-C",
+        "-p",
+        privoxy_config_test,
+        "-d",
+        lists_dir,
+        "-v",
+        "2",
+        "-t",
+        "/temp/blub5",
+        "-k",
+        cache_dir,
+        "-u",
+        httpserver.url_for("/conditional.txt"),
+        "-u",
+        httpserver.url_for("/expires.txt"),
+    ]
+    process = shell.run(*cmd)
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in(f"CACHE_DIR: {cache_dir}", process.stdout)
+    assert check_not_in("not modified since last run", process.stdout)
+    assert Path(f"{lists_dir}/conditional.script.action").is_file()
+    assert Path(f"{lists_dir}/expires.script.action").is_file()
+    process = shell.run(*cmd)
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in(" 304 ", process.stdout)
+    assert check_in("has not expired yet, using cached version.", process.stdout)
+    assert check_in(
+        f"{httpserver.url_for('/conditional.txt')} not modified since last run, "
+        "skipping conversion.",
+        process.stdout,
+    )
+    assert check_in(
+        f"{httpserver.url_for('/expires.txt')} not modified since last run, skipping conversion.",
+        process.stdout,
+    )
+    # changed target directory requires installation but no conversion
+    cmd[cmd.index(lists_dir)] = f"{lists_dir}_new"
+    process = shell.run(*cmd)
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in(
+        f"{httpserver.url_for('/conditional.txt')} found in conversion cache, "
+        "reusing converted lists.",
+        process.stdout,
+    )
+    assert Path(f"{lists_dir}_new/conditional.script.action").read_text(encoding="UTF-8") == Path(
+        f"{lists_dir}/conditional.script.action"
+    ).read_text(encoding="UTF-8")
+    # lists converted in Convert Mode are registered by a later run in Activate Mode
+    unregistered = Path(privoxy_config_test).read_text(encoding="UTF-8")
+    cmd[cmd.index("-A")] = "-a"
+    process = shell.run(*cmd)
+    assert process.returncode == EXIT_SUCCESS
+    assert check_not_in("not modified since last run", process.stdout)
+    config = Path(privoxy_config_test).read_text(encoding="UTF-8")
+    assert check_in(f"{lists_dir}_new/conditional.script.action", config)
+    assert check_in(f"{lists_dir}_new/expires.script.filter", config)
+    process = shell.run(*cmd)
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in("not modified since last run, skipping conversion.", process.stdout)
+    # registrations removed from the config are added again
+    Path(privoxy_config_test).write_text(unregistered, encoding="UTF-8")
+    process = shell.run(*cmd)
+    assert process.returncode == EXIT_SUCCESS
+    assert check_not_in("not modified since last run", process.stdout)
+    assert Path(privoxy_config_test).read_text(encoding="UTF-8") == config
+
+
+def test_merge_lists(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> None:
+    """Test merging of all lists into one list without duplicates."""
+    privoxy_config_dir = mkdtemp()
+    privoxy_config_test = f"{privoxy_config_dir}/test_config"
+    lists_dir = f"{privoxy_config_dir}/lists"
+    if is_openwrt():
+        copyfile("/etc/config/privoxy", privoxy_config_test)
+    else:
+        copyfile(privoxy_config, privoxy_config_test)
+    httpserver.expect_request("/first.txt").respond_with_data(
+        "[Adblock Plus 2.0]\n||andrwe.org/ads/^\n||andrwe.jp/ads/^\n@@||duckduckgo.com^\n"
+    )
+    httpserver.expect_request("/second.txt").respond_with_data(
+        "[Adblock Plus 2.0]\n||andrwe.jp/ads/^\n||pubfeed.linkby.com^\n@@||duckduckgo.com^\n"
+    )
+    process = shell.run(
+        privoxy_blocklist,
+        "-A",
+        "-C",
+        "-m",
+        "-p",
+        privoxy_config_test,
+        "-d",
+        lists_dir,
+        "-v",
+        "2",
+        "-t",
+        "/temp/blub6",
+        "-u",
+        httpserver.url_for("/first.txt"),
+        "-u",
+        httpserver.url_for("/second.txt"),
+    )
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in("Merge lists: 1", process.stdout)
+    assert check_in("... removed 2 duplicate patterns.", process.stdout)
+    assert not Path(f"{lists_dir}/first.script.action").exists()
+    assert not Path(f"{lists_dir}/second.script.action").exists()
+    assert Path(f"{lists_dir}/merged.script.filter").is_file()
+    merged = Path(f"{lists_dir}/merged.script.action").read_text(encoding="UTF-8").splitlines()
+    assert merged.count(".andrwe.jp/ads/") == 1
+    assert len([line for line in merged if "duckduckgo" in line]) == 1
+    # duplicates stay in the section of the first list
+    assert merged.index("{ +block{first} }") < merged.index(".andrwe.jp/ads/")
+    assert merged.index(".andrwe.jp/ads/") < merged.index("{ +block{second} }")
+    assert merged.index("{ +block{second} }") < merged.index(".pubfeed.linkby.com")
+
+
+def test_prune_domains(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> None:
+    """Test removal of block patterns covered by broader domain patterns."""
+    privoxy_config_dir = mkdtemp()
+    privoxy_config_test = f"{privoxy_config_dir}/test_config"
+    lists_dir = f"{privoxy_config_dir}/lists"
+    if is_openwrt():
+        copyfile("/etc/config/privoxy", privoxy_config_test)
+    else:
+        copyfile(privoxy_config, privoxy_config_test)
+    httpserver.expect_request("/prune.txt").respond_with_data(
+        "[Adblock Plus 2.0]\n"
+        "||ads.andrwe.org^\n"
+        "||andrwe.org^\n"
+        "||andrwe.org/ads/^\n"
+        "||andrwe.jp/ads/^\n"
+        "||wild*.andrwe.org^\n"
+        "@@||good.ads.andrwe.org^\n"
+    )
+    process = shell.run(
+        privoxy_blocklist,
+        "-A",
+        "-C",
+        "-p",
+        privoxy_config_test,
+        "-d",
+        lists_dir,
+        "-v",
+        "2",
+        "-t",
+        "/temp/blub7",
+        "-u",
+        httpserver.url_for("/prune.txt"),
+    )
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in(
+        "... removed 2 block patterns covered by broader domain patterns", process.stdout
+    )
+    actions = Path(f"{lists_dir}/prune.script.action").read_text(encoding="UTF-8").splitlines()
+    block_section = actions[: actions.index("{ -block }")]
+    assert ".andrwe.org" in block_section
+    assert ".andrwe.jp/ads/" in block_section
+    assert ".wild.*.andrwe.org" in block_section
+    assert ".ads.andrwe.org" not in block_section
+    assert ".andrwe.org/ads/" not in block_section
+    # exceptions of covered patterns are kept
+    assert check_in("good", "\n".join(actions[actions.index("{ -block }") :]))
+
+
+def test_filter_budget(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> None:
+    """Test splitting of content filters into jobs by configured budget."""
+    privoxy_config_dir = mkdtemp()
+    privoxy_config_test = f"{privoxy_config_dir}/test_config"
+    lists_dir = f"{privoxy_config_dir}/lists"
+    if is_openwrt():
+        copyfile("/etc/config/privoxy", privoxy_config_test)
+    else:
+        copyfile(privoxy_config, privoxy_config_test)
+    httpserver.expect_request("/budget.txt").respond_with_data(
+        "[Adblock Plus 2.0]\n##.ad-banner\n##.ad-box\n##.advert\n##.sponsor\n##.promo\n"
+    )
+    command = [
+        privoxy_blocklist,
+        "-A",
+        "-C",
+        "-p",
+        privoxy_config_test,
+        "-d",
+        lists_dir,
+        "-v",
+        "1",
+        "-t",
+        "/temp/blub8",
+        "-f",
+        "class_global",
+        "-u",
+        httpserver.url_for("/budget.txt"),
+    ]
+    for budget, jobs in [({"FILTER_MAX_SELECTORS": "2"}, 3), ({"FILTER_MAX_BYTES": "1"}, 5)]:
+        process = shell.run(*command, env=EnvironDict(budget))
+        assert process.returncode == EXIT_SUCCESS
+        assert check_in(f"... merged 5 'class_global'-rules into {jobs} jobs", process.stdout)
+        filters = Path(f"{lists_dir}/budget.script.filter").read_text(encoding="UTF-8")
+        assert len([line for line in filters.splitlines() if line.startswith("s@")]) == jobs
+    process = shell.run(*command, env=EnvironDict({"FILTER_MAX_SELECTORS": "2001"}))
+    assert process.returncode == EXIT_MISSING_ARGUMENT
+    assert check_in(
+        "FILTER_MAX_SELECTORS must be a number between 1 and 2000, got '2001'.", process.stderr
+    )
+
+
+def test_timings(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> None:
+    """Test per-stage timings written as JSON lines."""
+    privoxy_config_dir = mkdtemp()
+    privoxy_config_test = f"{privoxy_config_dir}/test_config"
+    lists_dir = f"{privoxy_config_dir}/lists"
+    timings_file = Path(f"{privoxy_config_dir}/timings/timings.json")
+    if is_openwrt():
+        copyfile("/etc/config/privoxy", privoxy_config_test)
+    else:
+        copyfile(privoxy_config, privoxy_config_test)
+    httpserver.expect_request("/timings.txt").respond_with_data(
+        "[Adblock Plus 2.0]\n! comment\n||andrwe.org^\n@@||duckduckgo.com^\n"
+        "##.ad-banner\n##.advert\n"
+    )
+    command = [
+        privoxy_blocklist,
+        "-A",
+        "-C",
+        "-p",
+        privoxy_config_test,
+        "-d",
+        lists_dir,
+        "-v",
+        "2",
+        "-t",
+        "/temp/blub9",
+        "-T",
+        str(timings_file),
+        "-f",
+        "class_global",
+        "-u",
+        httpserver.url_for("/timings.txt"),
+    ]
+    process = shell.run(*command)
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in(f"TIMINGS_FILE: {timings_file}", process.stdout)
+    timings = [json.loads(line) for line in timings_file.read_text(encoding="UTF-8").splitlines()]
+    assert [timing["stage"] for timing in timings] == [
+        "download",
+        "comments",
+        "classify",
+        "actions",
+        "selectors",
+        "class_global",
+        "exceptions",
+        "staging",
+        "install",
+        "total",
+    ]
+    assert all(timing["seconds"] >= 0 for timing in timings)
+    assert all(timing["list"] == "timings" for timing in timings[:-2])
+    stages = {timing["stage"]: timing for timing in timings}
+    assert stages["class_global"]["rules"] == len(["ad-banner", "advert"])
+    assert stages["install"]["list"] == ""
+    assert stages["total"]["list"] == ""
+    # timings of following runs are appended
+    process = shell.run(*command)
+    assert process.returncode == EXIT_SUCCESS
+    assert len(timings_file.read_text(encoding="UTF-8").splitlines()) == len(timings) * 2
+
+
+def test_metrics(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> None:
+    """Test metrics written in Prometheus text format."""
+    privoxy_config_dir = mkdtemp()
+    privoxy_config_test = f"{privoxy_config_dir}/test_config"
+    lists_dir = f"{privoxy_config_dir}/lists"
+    metrics_file = Path(f"{privoxy_config_dir}/metrics/privoxy-blocklist.prom")
+    if is_openwrt():
+        copyfile("/etc/config/privoxy", privoxy_config_test)
+    else:
+        copyfile(privoxy_config, privoxy_config_test)
+    httpserver.expect_request("/metrics.txt").respond_with_data(
+        "[Adblock Plus 2.0]\n||andrwe.org^\n||andrwe.jp^\n@@||duckduckgo.com^\n"
+        "##.ad-banner\n##.advert\n"
+    )
+    command = [
+        privoxy_blocklist,
+        "-A",
+        "-C",
+        "-p",
+        privoxy_config_test,
+        "-d",
+        lists_dir,
+        "-v",
+        "2",
+        "-t",
+        "/temp/blub10",
+        "-P",
+        str(metrics_file),
+        "-f",
+        "class_global",
+        "-u",
+        httpserver.url_for("/metrics.txt"),
+    ]
+    process = shell.run(*command)
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in(f"METRICS_FILE: {metrics_file}", process.stdout)
+    metrics = metrics_file.read_text(encoding="UTF-8").splitlines()
+    for sample in [
+        "privoxy_blocklist_last_run_status 0",
+        'privoxy_blocklist_download_status{list="metrics"} 0',
+        'privoxy_blocklist_rules{list="metrics",bucket="block"} 2',
+        'privoxy_blocklist_rules{list="metrics",bucket="exception"} 1',
+        'privoxy_blocklist_rules{list="metrics",bucket="image_exception"} 0',
+        'privoxy_blocklist_rules{list="metrics",bucket="class_global"} 2',
+        'privoxy_blocklist_filter_jobs{list="metrics",filter="class_global"} 1',
+    ]:
+        assert sample in metrics
+    assert "# TYPE privoxy_blocklist_run_duration_seconds gauge" in metrics
+    last_success = [
+        line for line in metrics if line.startswith("privoxy_blocklist_last_success_timestamp")
+    ]
+    assert len(last_success) == 1
+    # failed runs keep time of last successful run
+    process = shell.run(*command, "-u", "http://127.0.0.1:1/missing.txt")
+    assert process.returncode == EXIT_WRONG_URL
+    metrics = metrics_file.read_text(encoding="UTF-8").splitlines()
+    assert f"privoxy_blocklist_last_run_status {EXIT_WRONG_URL}" in metrics
+    assert f'privoxy_blocklist_download_status{{list="missing"}} {EXIT_WRONG_URL}' in metrics
+    assert last_success[0] in metrics
+    assert not list(metrics_file.parent.glob("*.prom.*"))
+
+
+def test_domain_filters(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> None:
+    """Test conversion of element hiding rules restricted to domains."""
+    privoxy_config_dir = mkdtemp()
+    privoxy_config_test = f"{privoxy_config_dir}/test_config"
+    lists_dir = f"{privoxy_config_dir}/lists"
+    if is_openwrt():
+        copyfile("/etc/config/privoxy", privoxy_config_test)
+    else:
+        copyfile(privoxy_config, privoxy_config_test)
+    httpserver.expect_request("/domains.txt").respond_with_data(
+        "[Adblock Plus 2.0]\n"
+        "##.global-ad\n"
+        "example.com,Example.org##.ad-banner\n"
+        "example.com##.ad-box\n"
+        "example.com###sponsor\n"
+        'example.com##[data-role="ad.slot"]\n'
+        "example.*##.wild-ad\n"
+        "example.com,~sub.example.com##.negated-ad\n"
+        "~example.com##.negated-ad\n"
+    )
+    process = shell.run(
+        privoxy_blocklist,
+        "-A",
+        "-C",
+        "-p",
+        privoxy_config_test,
+        "-d",
+        lists_dir,
+        "-v",
+        "1",
+        "-t",
+        "/temp/blub11",
+        "-f",
+        "class_domain",
+        "-f",
+        "id_domain",
+        "-f",
+        "attribute_domain_exact",
+        "-u",
+        httpserver.url_for("/domains.txt"),
+    )
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in("... merged 6 domain based rules into 3 domain filters", process.stdout)
+    filters = Path(f"{lists_dir}/domains.script.filter").read_text(encoding="UTF-8")
+    actions = Path(f"{lists_dir}/domains.script.action").read_text(encoding="UTF-8").splitlines()
+    # global rules are only converted by global content filters
+    assert check_not_in("global-ad", filters)
+    assert check_not_in("negated-ad", filters)
+    blocks = {
+        block.splitlines()[0]: block.splitlines()[1:] for block in filters.split("FILTER: ")[1:]
+    }
+    assert set(blocks) == {
+        "domains_domain_example. Tag filter of domains for example. (1 selectors)",
+        "domains_domain_example.com Tag filter of domains for example.com (4 selectors)",
+        "domains_domain_example.org Tag filter of domains for example.org (1 selectors)",
+    }
+    # one job per content filter, selectors sharing a prefix are factored
+    jobs = blocks["domains_domain_example.com Tag filter of domains for example.com (4 selectors)"]
+    assert len(jobs) == len(["class_domain", "id_domain", "attribute_domain_exact"])
+    assert check_in("(ad-b(?:anner|ox))", jobs[0])
+    assert check_in("(sponsor)", jobs[1])
+    assert check_in('(data-role="ad\\.slot")', jobs[2])
+    # filters are only activated for their domain and its subdomains
+    for domain, pattern in [
+        ("example.", ".example."),
+        ("example.com", ".example.com"),
+        ("example.org", ".example.org"),
+    ]:
+        assert actions[actions.index(f"{{ +filter{{domains_domain_{domain}}} }}") + 1] == pattern
+    assert "/" not in actions
+
+
+def test_install_staged(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> None:
+    """Test installation of all lists with a single config update."""
+    privoxy_config_dir = mkdtemp()
+    privoxy_config_test = f"{privoxy_config_dir}/test_config"
+    lists_dir = f"{privoxy_config_dir}/lists"
+    if is_openwrt():
+        copyfile("/etc/config/privoxy", privoxy_config_test)
+    else:
+        copyfile(privoxy_config, privoxy_config_test)
+    httpserver.expect_request("/first.txt").respond_with_data(
+        "[Adblock Plus 2.0]\n||andrwe.org/ads/^\n##.ad-banner\n"
+    )
+    httpserver.expect_request("/second.txt").respond_with_data(
+        "[Adblock Plus 2.0]\n||andrwe.jp/ads/^\n##.ad-box\n"
+    )
+    process = shell.run(
+        privoxy_blocklist,
+        "-C",
+        "-p",
+        privoxy_config_test,
+        "-d",
+        lists_dir,
+        "-v",
+        "1",
+        "-t",
+        "/temp/blub12",
+        "-u",
+        httpserver.url_for("/first.txt"),
+        "-u",
+        httpserver.url_for("/second.txt"),
+    )
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in("... all lists installed successfully.", process.stdout)
+    # all lists are registered within one rewrite of the config
+    assert process.stdout.count(f"Modifying {privoxy_config_test} ...") == 1
+    config = Path(privoxy_config_test).read_text(encoding="UTF-8")
+    for list_name in ["first", "second"]:
+        assert check_in(f"{lists_dir}/{list_name}.script.action", config)
+        assert check_in(f"{lists_dir}/{list_name}.script.filter", config)
+    # staged files are renamed into place
+    assert sorted(path.name for path in Path(lists_dir).iterdir()) == [
+        "first.script.action",
+        "first.script.filter",
+        "second.script.action",
+        "second.script.filter",
+    ]
+    assert check_in(
+        "Changed lists: first.script.action first.script.filter second.script.action"
+        " second.script.filter",
+        process.stdout,
+    )
+    modified = Path(f"{lists_dir}/first.script.action").stat().st_mtime_ns
+    # already registered lists do not modify the config again
+    process = shell.run(
+        privoxy_blocklist,
+        "-C",
+        "-p",
+        privoxy_config_test,
+        "-d",
+        lists_dir,
+        "-v",
+        "1",
+        "-t",
+        "/temp/blub12",
+        "-u",
+        httpserver.url_for("/first.txt"),
+    )
+    assert process.returncode == EXIT_SUCCESS
+    assert check_not_in("Modifying", process.stdout)
+    assert Path(privoxy_config_test).read_text(encoding="UTF-8") == config
+    # unchanged lists are not replaced
+    assert check_in("No list changed.", process.stdout)
+    assert Path(f"{lists_dir}/first.script.action").stat().st_mtime_ns == modified
+    # lists are registered in the order of their URLs, which sets their precedence within Privoxy
+    copyfile("/etc/config/privoxy" if is_openwrt() else privoxy_config, privoxy_config_test)
+    process = shell.run(
+        privoxy_blocklist,
+        "-C",
+        "-p",
+        privoxy_config_test,
+        "-d",
+        f"{lists_dir}_ordered",
+        "-v",
+        "1",
+        "-t",
+        "/temp/blub12",
+        "-u",
+        httpserver.url_for("/second.txt"),
+        "-u",
+        httpserver.url_for("/first.txt"),
+    )
+    assert process.returncode == EXIT_SUCCESS
+    config = Path(privoxy_config_test).read_text(encoding="UTF-8")
+    for file_type in ["action", "filter"]:
+        assert config.index(f"{lists_dir}_ordered/second.script.{file_type}") < config.index(
+            f"{lists_dir}_ordered/first.script.{file_type}"
+        )
+
+
+def test_bundle(shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver) -> None:
+    """Test export of converted lists as bundle and installation of bundle."""
+    privoxy_config_dir = mkdtemp()
+    privoxy_config_test = f"{privoxy_config_dir}/test_config"
+    lists_dir = f"{privoxy_config_dir}/lists"
+    bundle = f"{mkdtemp()}/bundle.tar.gz"
+    if is_openwrt():
+        copyfile("/etc/config/privoxy", privoxy_config_test)
+    else:
+        copyfile(privoxy_config, privoxy_config_test)
+    httpserver.expect_request("/bundled.txt").respond_with_data(
+        "[Adblock Plus 2.0]\n||andrwe.org/ads/^\n##.ad-banner\n"
+    )
+    process = shell.run(
+        privoxy_blocklist,
+        "-A",
+        "-C",
+        "-d",
+        mkdtemp(),
+        "-v",
+        "1",
+        "-t",
+        "/temp/blub13",
+        "-f",
+        "class_global",
+        "-b",
+        bundle,
+        "-u",
+        httpserver.url_for("/bundled.txt"),
+    )
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in("... bundle exported.", process.stdout)
+    with tarfile.open(bundle) as archive:
+        assert sorted(archive.getnames()) == [
+            "bundled.script.action",
+            "bundled.script.filter",
+            "manifest",
+        ]
+        manifest_file = archive.extractfile("manifest")
+        assert manifest_file
+        manifest = manifest_file.read().decode("UTF-8").splitlines()
+    assert "filters class_global" in manifest
+    assert f"url {httpserver.url_for('/bundled.txt')}" in manifest
+    assert len([line for line in manifest if line.startswith("file ")]) == len(
+        ["bundled.script.action", "bundled.script.filter"]
+    )
+    # installing the bundle does not download any list
+    httpserver.clear()
+    process = shell.run(
+        privoxy_blocklist,
+        "-C",
+        "-p",
+        privoxy_config_test,
+        "-d",
+        lists_dir,
+        "-v",
+        "1",
+        "-t",
+        "/temp/blub13",
+        "-i",
+        bundle,
+    )
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in("... bundle verified.", process.stdout)
+    assert check_not_in("Downloading", process.stdout)
+    config = Path(privoxy_config_test).read_text(encoding="UTF-8")
+    assert check_in(f"{lists_dir}/bundled.script.action", config)
+    assert check_in(f"{lists_dir}/bundled.script.filter", config)
+    assert check_in("ad-banner", Path(f"{lists_dir}/bundled.script.filter").read_text())
+    # bundles not matching their checksum are rejected
+    with Path(bundle).open("ab") as bundle_file:
+        bundle_file.write(b"tampered")
+    process = shell.run(
+        privoxy_blocklist,
+        "-C",
+        "-p",
+        privoxy_config_test,
+        "-d",
+        lists_dir,
+        "-v",
+        "1",
+        "-t",
+        "/temp/blub13",
+        "-i",
+        bundle,
+    )
+    assert process.returncode == 1
+    assert check_in(f"Checksum of bundle {bundle} does not match", process.stderr)
+
+
+def test_compressed_lists(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> None:
+    """Test conversion of lists transferred compressed and of gzip compressed lists."""
+    lists_dir = mkdtemp()
+    content = "[Adblock Plus 2.0]\n! Expires: 1 days\n||andrwe.org/ads/^\n##.ad-banner\n"
+    httpserver.expect_request(
+        "/encoded.txt", headers={"Accept-Encoding": "gzip"}
+    ).respond_with_data(gzip.compress(content.encode()), headers={"Content-Encoding": "gzip"})
+    httpserver.expect_request("/archived.txt.gz").respond_with_data(
+        gzip.compress(content.encode()), content_type="application/gzip"
+    )
+    process = shell.run(
+        privoxy_blocklist,
+        "-A",
+        "-C",
+        "-d",
+        lists_dir,
+        "-v",
+        "1",
+        "-t",
+        "/temp/blub14",
+        "-k",
+        f"{mkdtemp()}/cache",
+        "-f",
+        "class_global",
+        "-u",
+        httpserver.url_for("/encoded.txt"),
+        "-u",
+        httpserver.url_for("/archived.txt.gz"),
+    )
+    assert process.returncode == EXIT_SUCCESS
+    assert check_not_in("does not contain AdblockPlus list header", process.stdout)
+    for list_name in ["encoded", "archived"]:
+        actions = Path(f"{lists_dir}/{list_name}.script.action").read_text(encoding="UTF-8")
+        assert check_in(".andrwe.org/ads/", actions)
+        filters = Path(f"{lists_dir}/{list_name}.script.filter").read_text(encoding="UTF-8")
+        assert check_in("ad-banner", filters)
+
+
+def test_streaming(shell: Subprocess, privoxy_blocklist: str, httpserver) -> None:
+    """Test conversion of lists as stream without files per rule type."""
+    lists_dir = mkdtemp()
+    temp_dir = f"{mkdtemp()}/stream"
+    httpserver.expect_request("/streamed.txt").respond_with_data(
+        "[Adblock Plus 2.0]\n"
+        "! Title: streamed\n"
+        "||andrwe.org^\n"
+        "||ads.andrwe.org^\n"
+        "|http://andrwe.jp/banner/|\n"
+        "@@||duckduckgo.com^\n"
+        "@@||andrwe.org/logo.png$image\n"
+        "##.ad-banner\n"
+        "###sponsor\n"
+        "example.com##.ad-box\n"
+    )
+    process = shell.run(
+        privoxy_blocklist,
+        "-A",
+        "-C",
+        "-s",
+        "-d",
+        lists_dir,
+        "-v",
+        "3",
+        "-t",
+        temp_dir,
+        "-f",
+        "class_global",
+        "-f",
+        "class_domain",
+        "-u",
+        httpserver.url_for("/streamed.txt"),
+    )
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in(
+        "Domain based content filters are not supported while streaming", process.stdout
+    )
+    actions = Path(f"{lists_dir}/streamed.script.action").read_text(encoding="UTF-8").splitlines()
+    # sections are written in the same order as without streaming, domains are not pruned
+    assert actions == [
+        "{ +block{streamed} }",
+        ".andrwe.org",
+        ".ads.andrwe.org",
+        "^http://andrwe.jp/banner/$",
+        "{ +filter{streamed_class_global} }",
+        "/",
+        "{ -block }",
+        ".duckduckgo\\.com[/&:?=_]",
+        "{ -block +handle-as-image }",
+        ".andrwe\\.org/logo\\.png",
+    ]
+    filters = Path(f"{lists_dir}/streamed.script.filter").read_text(encoding="UTF-8")
+    assert check_in("FILTER: streamed_class_global Tag filter of streamed (1 selectors)", filters)
+    assert check_in("(ad-banner)", filters)
+    assert check_not_in("ad-box", filters)
+    # only the downloaded list and the converted lists are written, no files per rule type
+    assert sorted(
+        path.name for path in Path(temp_dir).iterdir() if path.name.startswith("streamed.")
+    ) == [
+        "streamed.script.action",
+        "streamed.script.filter",
+        "streamed.txt",
+        "streamed.txt.counts",
+    ]
+
+
+def test_streaming_memory(shell: Subprocess, privoxy_blocklist: str, httpserver) -> None:
+    """Test documented peak memory while streaming a large list."""
+    httpserver.expect_request("/large.txt").respond_with_data(generate_list(400_000))
+    process, measurement = measure(
+        shell,
+        [
+            privoxy_blocklist,
+            "-A",
+            "-C",
+            "-s",
+            "-d",
+            mkdtemp(),
+            "-v",
+            "1",
+            "-t",
+            "/temp/blub15",
+            "-f",
+            "class_global",
+            "-f",
+            "id_global",
+            "-f",
+            "attribute_global_exact",
+            "-u",
+            httpserver.url_for("/large.txt"),
+        ],
+    )
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in("'class_global'-rules into", process.stdout)
+    assert measurement["peak_rss_kib"] < STREAMING_MAX_RSS_KIB
+
+
+def test_engines(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver, filtertypes
+) -> None:
+    """Test that the shell and the python engine generate identical lists."""
+    content = (
+        generate_list(2000)
+        + "example.com,~sub.example.com##.negated-ad\n"
+        + "example.*##.wild-ad\n"
+        + '##[data-role="ad.slot"]\n'
+        + "##[class^='promo-']\n"
+        + '##[id$="-sponsor"]\n'
+        + '##[src*="/ads/"]\n'
+        + "|https://ads.example.com/banner|\n"
+        + "@@||example.com/assets/*.png$image\n"
+    )
+    outputs = {}
+    for engine in ["shell", "python"]:
+        command, lists_dir = convert_command(
+            privoxy_blocklist, privoxy_config, httpserver, content, *filtertypes
+        )
+        process = shell.run(*command, "-e", engine)
+        assert process.returncode == EXIT_SUCCESS
+        outputs[engine] = (
+            {path.name: path.read_bytes() for path in lists_dir.glob("*.script.*")},
+            [line for line in process.stdout.splitlines() if line.startswith("... merged")],
+        )
+    files, messages = outputs["shell"]
+    assert set(files) == {"benchmark.script.action", "benchmark.script.filter"}
+    assert messages
+    assert outputs["python"] == outputs["shell"]
+
+    # package can be used on its own
+    list_file = Path(mkdtemp()) / "list.txt"
+    list_file.write_text("||andrwe.org^\n##.ad-banner\n", encoding="UTF-8")
+    process = shell.run(
+        sys.executable,
+        "-m",
+        "privoxy_blocklist",
+        "-n",
+        "own",
+        "-a",
+        str(list_file.with_suffix(".action")),
+        "-F",
+        str(list_file.with_suffix(".filter")),
+        "-f",
+        "class_global",
+        str(list_file),
+        cwd=Path(privoxy_blocklist).parent,
+    )
+    assert process.returncode == EXIT_SUCCESS
+    actions = list_file.with_suffix(".action").read_text(encoding="UTF-8").splitlines()
+    assert actions[:2] == ["{ +block{own} }", ".andrwe.org"]
+    filters = list_file.with_suffix(".filter").read_text(encoding="UTF-8")
+    assert check_in("FILTER: own_class_global", filters)
+
+    command, _ = convert_command(privoxy_blocklist, privoxy_config, httpserver, content)
+    process = shell.run(*command, "-e", "perl")
+    assert process.returncode == EXIT_MISSING_ARGUMENT
+    assert check_in("ENGINE must be either 'shell' or 'python', got 'perl'.", process.stderr)
+
+
+def test_analyze(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> None:
+    """Test analyze mode timing each job of the generated filterfiles."""
+    command, lists_dir = convert_command(
+        privoxy_blocklist,
+        privoxy_config,
+        httpserver,
+        "##.ad_970x250\n##.AdRight2\n###sponsor\n",
+        "class_global",
+        "id_global",
+    )
+    process = shell.run(*command)
+    assert process.returncode == EXIT_SUCCESS
+    # job backtracking exponentially on the page and a job Python cannot compile
+    lists_dir.joinpath("slow.script.filter").write_text(
+        "FILTER: slow_class_global Tag filter\ns@(a+)+b@@g\ns@<p>@@g\ns@(unclosed@@g\n",
+        encoding="UTF-8",
+    )
+    page = lists_dir.parent / "page.html"
+    page.write_text(f"<html><body>{'a' * 20}<p>x</p></body></html>\n", encoding="UTF-8")
+    analyze_command = [*command[: command.index("-u")], "-x", str(page)]
+    process = shell.run(*analyze_command)
+    assert process.returncode == EXIT_SUCCESS
+    lines = process.stdout.splitlines()
+    assert check_in("Analyzed 5 jobs on 2 pages", process.stdout)
+    filters = [line.split()[0] for line in lines if " all " in line]
+    assert filters == ["slow_class_global", "benchmark_class_global", "benchmark_id_global"]
+    slow = lines[lines.index(next(line for line in lines if line.startswith("slow_"))) + 1]
+    assert slow.split()[0] == "1"
+    assert slow.endswith("outlier")
+    assert check_in("skipped: missing ), unterminated subpattern", process.stdout)
+    # jobs of the generated filterfile match the elements of tests/response.html
+    class_job = next(line for line in lines if line.startswith("benchmark_class_global"))
+    assert int(class_job.split()[3]) > 0
+    assert [line for line in lines if line.endswith("outlier")] == [slow]
+
+    process = shell.run(*analyze_command, "-x", "/temp/missing.html")
+    assert process.returncode == 1
+    assert check_in("Page /temp/missing.html does not exist.", process.stderr)
+
+    process = shell.run(
+        sys.executable,
+        "-m",
+        "privoxy_blocklist.analyze",
+        "-r",
+        "0",
+        "-p",
+        str(page),
+        str(lists_dir / "slow.script.filter"),
+        cwd=Path(privoxy_blocklist).parent,
+    )
+    assert process.returncode != EXIT_SUCCESS
+    assert check_in("repeat must be at least 1, got 0", process.stderr)
+
+
+def test_prune_logs(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> None:
+    """Test pruning of block patterns and content filters without hits in Privoxy logs."""
+    content = (
+        "[Adblock Plus 2.0]\n"
+        "||used.example.com^\n"
+        "||unused.example.org^\n"
+        "||ads.example.net/banner/\n"
+        "@@||allowed.example.com^\n"
+        "##.ad-banner\n"
+        "###sponsor\n"
+    )
+    command, lists_dir = convert_command(
+        privoxy_blocklist, privoxy_config, httpserver, content, "class_global", "id_global"
+    )
+    now = datetime.now()
+    log_file = lists_dir.parent / "logfile"
+    log_file.write_text(
+        "".join(
+            f"{timestamp:%Y-%m-%d %H:%M:%S}.123 7f0c3affe6c0 {message}\n"
+            for timestamp, message in [
+                # requests older than PRUNE_DAYS are ignored
+                (now - timedelta(days=60), "Request: unused.example.org/"),
+                (now, "Request: www.used.example.com/index.html"),
+                (now, "Crunch: Blocked: http://www.ads.example.net/banner/1.png"),
+                (
+                    now,
+                    "Re-Filter: filtering used.example.com/index.html (size 1024) with"
+                    " 'benchmark_class_global' produced 1 hits (new size 900).",
+                ),
+                (
+                    now,
+                    "Re-Filter: filtering used.example.com/index.html (size 1024) with"
+                    " 'benchmark_id_global' produced 0 hits (new size 1024).",
+                ),
+            ]
+        ),
+        encoding="UTF-8",
+    )
+    process = shell.run(*command, "-l", str(log_file))
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in("... read 2 requests and 2 content filter runs from the logs.", process.stdout)
+    assert check_in(
+        "... pruned 1 block patterns and 1 content filters without hits.", process.stdout
+    )
+    actions = lists_dir.joinpath("benchmark.script.action").read_text(encoding="UTF-8")
+    assert actions.splitlines() == [
+        "{ +block{benchmark} }",
+        ".used.example.com",
+        ".ads.example.net/banner/",
+        "{ +filter{benchmark_class_global} }",
+        "/",
+        "{ -block }",
+        ".allowed\\.example\\.com[/&:?=_]",
+        "{ -block +handle-as-image }",
+    ]
+    filters = lists_dir.joinpath("benchmark.script.filter").read_text(encoding="UTF-8")
+    assert check_in("FILTER: benchmark_class_global", filters)
+    assert check_not_in("benchmark_id_global", filters)
+
+    # pruned content filters are not run by Privoxy anymore, thus they are kept by the next run
+    log_file.write_text(
+        f"{now:%Y-%m-%d %H:%M:%S}.123 7f0c3affe6c0 Request: www.used.example.com/index.html\n"
+        f"{now:%Y-%m-%d %H:%M:%S}.123 7f0c3affe6c0 Re-Filter: filtering used.example.com/index.html"
+        " (size 1024) with 'benchmark_class_global' produced 1 hits (new size 900).\n",
+        encoding="UTF-8",
+    )
+    process = shell.run(*command, "-l", str(log_file))
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in("... pruned 2 block patterns and 0 content filters", process.stdout)
+    filters = lists_dir.joinpath("benchmark.script.filter").read_text(encoding="UTF-8")
+    assert check_in("FILTER: benchmark_id_global", filters)
+    actions = lists_dir.joinpath("benchmark.script.action").read_text(encoding="UTF-8")
+    assert check_in("{ +filter{benchmark_id_global} }", actions)
+
+    # allowlisted lists are never pruned
+    process = shell.run(*command, "-l", str(log_file), env=EnvironDict({"PRUNE_KEEP": "benchmark"}))
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in("... benchmark is kept by PRUNE_KEEP, skipping pruning.", process.stdout)
+    actions = lists_dir.joinpath("benchmark.script.action").read_text(encoding="UTF-8")
+    assert check_in(".unused.example.org", actions)
+
+    # logs without requests do not prune any block pattern
+    log_file.write_text("", encoding="UTF-8")
+    process = shell.run(*command, "-l", str(log_file))
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in("... no requests found, block patterns are not pruned", process.stdout)
+    assert check_in("... pruned 0 block patterns and 0 content filters", process.stdout)
+
+    process = shell.run(*command, "-l", "/temp/missing.log")
+    assert process.returncode == EXIT_MISSING_ARGUMENT
+    assert check_in("Privoxy log /temp/missing.log is not readable.", process.stderr)
+
+
+def test_prune_logs_scale(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> None:
+    """Test pruning time of a large list by a month of logged requests stays bounded."""
+    command, lists_dir = convert_command(
+        privoxy_blocklist, privoxy_config, httpserver, generate_list(20000)
+    )
+    timings_file = lists_dir.parent / "timings.json"
+    log_file = lists_dir.parent / "logfile"
+    names = generate_selectors(20000)
+    now = f"{datetime.now():%Y-%m-%d %H:%M:%S}"
+    with log_file.open("w", encoding="UTF-8") as log:
+        for index in range(50000):
+            # every second host is blocked by a domain pattern of the list
+            host = f"www.{names[index % 5000 * 4]}.{'com' if index % 2 else 'example'}"
+            log.write(f"{now}.123 7f0c3affe6c0 Request: {host}/page/{index}.html\n")
+    process = shell.run(*command, "-l", str(log_file), "-T", str(timings_file))
+    assert process.returncode == EXIT_SUCCESS
+    assert check_in(
+        "... read 50000 requests and 0 content filter runs from the logs.", process.stdout
+    )
+    timings = [json.loads(line) for line in timings_file.read_text(encoding="UTF-8").splitlines()]
+    prune = next(timing for timing in timings if timing["stage"] == "prune")
+    assert prune["seconds"] < PRUNE_MAX_SECONDS
+
+
+def test_scheduler(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> None:
+    """Test scheduler mode refreshing lists by their intervals within the cache."""
+    command, lists_dir = convert_command(
+        privoxy_blocklist, privoxy_config, httpserver, "[Adblock Plus 2.0]\n||andrwe.org/ads/^\n"
+    )
+    cache_dir = lists_dir.parent / "cache"
+    # the scheduler keeps running until it is stopped, expired lists are refreshed by each run
+    env = EnvironDict({"SCHEDULER_MIN_SLEEP": "2", "REFRESH_INTERVAL": "1"})
+    process = shell.run("timeout", "7", *command, "-k", str(cache_dir), "-D", env=env)
+    assert process.returncode != EXIT_SUCCESS
+    assert (
+        process.stdout.count("Next list expires in 2 seconds, sleeping ...") >= SCHEDULER_MIN_RUNS
+    )
+    assert process.stdout.count("... all lists installed successfully.") >= SCHEDULER_MIN_RUNS
+    assert lists_dir.joinpath("benchmark.script.action").is_file()
+
+    # intervals of single lists take precedence
+    env = EnvironDict({"SCHEDULER_MIN_SLEEP": "2", "REFRESH_INTERVALS": "benchmark=7200"})
+    start = datetime.now().timestamp()
+    process = shell.run("timeout", "4", *command, "-k", str(cache_dir), "-D", env=env)
+    assert process.returncode != EXIT_SUCCESS
+    assert process.stdout.count("Next list expires in 7") == 1
+    expires = int(next(cache_dir.glob("*.expires")).read_text(encoding="UTF-8"))
+    assert int(start) + 7200 <= expires <= datetime.now().timestamp() + 7200
+
+    # lists without expiry are refreshed daily instead of after each minimal sleep
+    env = EnvironDict({"SCHEDULER_MIN_SLEEP": "2"})
+    process = shell.run("timeout", "4", *command, "-k", f"{cache_dir}_new", "-D", env=env)
+    assert process.returncode != EXIT_SUCCESS
+    assert process.stdout.count("Next list expires in 86") == 1
+
+    process = shell.run(
+        *command, "-k", str(cache_dir), "-D", env=EnvironDict({"SCHEDULER_MIN_SLEEP": "0"})
+    )
+    assert process.returncode == EXIT_MISSING_ARGUMENT
+    assert check_in("SCHEDULER_MIN_SLEEP must be a positive number, got '0'.", process.stderr)
+
+    process = shell.run(*command, "-D")
+    assert process.returncode == EXIT_MISSING_ARGUMENT
+    assert check_in(
+        "Scheduler Mode keeps the expiry of each list within the cache.", process.stderr
+    )
+
+    env["REFRESH_INTERVALS"] = "benchmark=2h"
+    process = shell.run(*command, "-k", str(cache_dir), "-D", env=env)
+    assert process.returncode == EXIT_MISSING_ARGUMENT
+
+
+def test_scheduler_stop(privoxy_blocklist: str, privoxy_config: str, httpserver) -> None:
+    """Test stopping only the scheduler terminates its current run before the lock is removed."""
+    released = Event()
+
+    def slow_list(_: Request) -> Response:
+        released.wait(30)
+        return Response("[Adblock Plus 2.0]\n||andrwe.org/ads/^\n")
+
+    httpserver.expect_request("/slow.txt").respond_with_handler(slow_list)
+    command, lists_dir = convert_command(privoxy_blocklist, privoxy_config, httpserver, "")
+    slow_command = [*command[: command.index("-u")], "-u", httpserver.url_for("/slow.txt")]
+    tmp_dir = lists_dir.parent / "convert"
+    scheduler = Popen(
+        [*slow_command, "-k", str(lists_dir.parent / "cache"), "-D"],
+        env={**os.environ, "SCHEDULER_MIN_SLEEP": "2"},
+        stdout=DEVNULL,
+        stderr=DEVNULL,
+        start_new_session=True,
+    )
+    try:
+        for _ in range(100):
+            if list(tmp_dir.glob("wget-*slow.txt.log")):
+                break
+            time.sleep(0.1)
+        scheduler.send_signal(signal.SIGTERM)
+        scheduler.wait(timeout=10)
+        for _ in range(50):
+            try:
+                os.killpg(scheduler.pid, 0)
+            except ProcessLookupError:
+                break
+            time.sleep(0.1)
+        else:
+            os.killpg(scheduler.pid, signal.SIGKILL)
+            raise AssertionError("run of the scheduler kept running after it was stopped")
+    finally:
+        released.set()
+    assert not tmp_dir.exists()
+    assert not lists_dir.joinpath("slow.script.action").exists()
+
+
 # must be second last test as it will generate unpredictable privoxy configurations
 def test_predefined_custom_config_generator(
     shell: Subprocess,
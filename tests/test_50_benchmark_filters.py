@@ -0,0 +1,96 @@
+"""Verify and benchmark the regex of generated content filters."""
+
+import re
+from pathlib import Path
+
+from pytestshellutils.shell import Subprocess
+
+from benchmark import (
+    JOB_TEMPLATES,
+    apply_jobs,
+    convert_list,
+    generate_page,
+    generate_selectors,
+    read_filters,
+    requires_benchmark,
+)
+
+# filter types whose selectors are generated by generate_selectors
+FILTER_TYPES = ["class_global", "id_global"]
+
+
+def build_jobs(
+    shell: Subprocess,
+    privoxy_blocklist: str,
+    privoxy_config: str,
+    httpserver,
+    selectors: list[str],
+) -> dict[str, tuple[list[re.Pattern], list[re.Pattern]]]:
+    """Return generated and flat jobs per filter type for given selectors."""
+    content = "[Adblock Plus 2.0]\n" + "".join(f"##.{sel}\n###{sel}\n" for sel in selectors)
+    lists_dir = convert_list(
+        shell,
+        privoxy_blocklist,
+        privoxy_config,
+        httpserver,
+        content,
+        *FILTER_TYPES,
+    )
+    filters = read_filters(lists_dir / "benchmark.script.filter")
+    sorted_selectors = sorted(set(selectors))
+    jobs = {}
+    for filter_type in FILTER_TYPES:
+        prefix, suffix = JOB_TEMPLATES[filter_type]
+        factored = [re.compile(job) for job in filters[f"benchmark_{filter_type}"]]
+        flat = [
+            re.compile(prefix + "|".join(sorted_selectors[index : index + 1000]) + suffix)
+            for index in range(0, len(sorted_selectors), 1000)
+        ]
+        assert len(factored) == len(flat)
+        jobs[filter_type] = (factored, flat)
+    return jobs
+
+
+def test_factored_filters_equivalent(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> None:
+    """Test that prefix-factored filters remove exactly what flat alternations remove."""
+    selectors = generate_selectors(2000)
+    jobs = build_jobs(shell, privoxy_blocklist, privoxy_config, httpserver, selectors)
+    response_html = (Path(__file__).parent / "response.html").read_text(encoding="UTF-8")
+    near_misses = "\n".join(
+        f'<div class="{sel[:-1]}">a</div>\n<div id="{sel}x">b</div>\n<p id="{sel}">c</p>'
+        for sel in selectors[::10]
+    )
+    page = "\n".join([response_html, near_misses, generate_page(selectors, 20000)])
+    for filter_type, (factored, flat) in jobs.items():
+        # factored jobs are not flat alternations anymore
+        assert all("(?:" in job.pattern for job in factored), filter_type
+        assert apply_jobs(factored, page)[0] == apply_jobs(flat, page)[0], filter_type
+
+
+@requires_benchmark
+def test_benchmark_factored_filters(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> None:
+    """Benchmark per-page filtering time of prefix-factored against flat alternations."""
+    selectors = generate_selectors(4000)
+    jobs = build_jobs(shell, privoxy_blocklist, privoxy_config, httpserver, selectors)
+    pages = {
+        "response.html": (Path(__file__).parent / "response.html").read_text(encoding="UTF-8"),
+        "synthetic-100k": generate_page(selectors, 100_000),
+        "synthetic-500k": generate_page(selectors, 500_000),
+    }
+    print("\nfilter        page              flat [s]  factored [s]")  # noqa: T201
+    for filter_type, (factored, flat) in jobs.items():
+        flat_total = factored_total = 0.0
+        for page_name, page in pages.items():
+            # best of three runs to reduce noise
+            flat_time = min(apply_jobs(flat, page)[1] for _ in range(3))
+            factored_time = min(apply_jobs(factored, page)[1] for _ in range(3))
+            flat_total += flat_time
+            factored_total += factored_time
+            print(  # noqa: T201
+                f"{filter_type:<13} {page_name:<16} {flat_time:>9.4f} {factored_time:>13.4f}"
+            )
+        assert factored_total < flat_total
@@ -0,0 +1,161 @@
+"""Compare content removal and runtime of tag-bounded and legacy filter templates."""
+
+import re
+from pathlib import Path
+
+from pytestshellutils.shell import Subprocess
+
+import config
+from benchmark import (
+    apply_jobs,
+    convert_list,
+    generate_page,
+    generate_selectors,
+    legacy_job,
+    read_filters,
+    requires_benchmark,
+)
+from conftest import check_in, check_not_in
+
+FILTER_TYPES = [
+    "class_global",
+    "id_global",
+    "attribute_global_name",
+    "attribute_global_exact",
+    "attribute_global_contain",
+    "attribute_global_startswith",
+    "attribute_global_endswith",
+]
+
+# rules matching the elements of tests/response.html
+CORPUS_RULES = [
+    "##.ad_970x250",
+    "##.AdRight2",
+    "###sellwild-loader",
+    "##[data-taboola-options]",
+    "##[data-freestar-ad][id]",
+    '##[data-role="tile-ads-module"]',
+    '##[onclick*="content.ad/"]',
+    '##[class^="adDisplay-module_"]',
+    '##[onclick^="location.href=\'https://1337x.vpnonly.site/"]',
+]
+
+# HTML snippets with expected result of current and legacy templates
+CORPUS = [
+    ('<div class="ad_970x250">ad</div>', "", ""),
+    (
+        '<p class="text">ad_970x250</p>',
+        '<p class="text">ad_970x250</p>',
+        '<p class="text">ad_970x250</p>',
+    ),
+    # legacy templates match the attribute of a nested element and remove the enclosing element
+    ('<div id="main"><span class="ad_970x250">ad</span></div>', '<div id="main"></div>', ""),
+    ('<div id="sellwild-loader">ad</div>', "", ""),
+    (
+        '<section id="page"><div id="sellwild-loader">ad</div></section>',
+        '<section id="page"></section>',
+        "",
+    ),
+    ('<div data-taboola-options class="x">ad</div>', "", ""),
+    # legacy templates match attribute names within text content
+    (
+        '<div class="x">data-taboola-options</div><div>y</div>',
+        '<div class="x">data-taboola-options</div><div>y</div>',
+        "",
+    ),
+    ('<div onclick="content.ad/">ad</div>', "", ""),
+    # legacy templates remove everything up to the last closing tag of the line
+    (
+        '<div class="ad_970x250">ad</div><div class="content">text</div>',
+        '<div class="content">text</div>',
+        "",
+    ),
+    # nested elements of the same type are only removed up to the first closing tag
+    ('<div class="ad_970x250"><div>ad</div>more ad</div>', "more ad</div>", ""),
+    (
+        '<a href="/" onclick="x">content.ad/</a><a href="/">y</a>',
+        '<a href="/" onclick="x">content.ad/</a><a href="/">y</a>',
+        "",
+    ),
+]
+
+
+def build_jobs(
+    shell: Subprocess,
+    privoxy_blocklist: str,
+    privoxy_config: str,
+    httpserver,
+    rules: list[str],
+) -> tuple[list[re.Pattern], list[re.Pattern]]:
+    """Return generated jobs of all filter types and their legacy counterparts."""
+    lists_dir = convert_list(
+        shell,
+        privoxy_blocklist,
+        privoxy_config,
+        httpserver,
+        "[Adblock Plus 2.0]\n" + "\n".join(rules) + "\n",
+        *FILTER_TYPES,
+    )
+    filters = read_filters(lists_dir / "benchmark.script.filter")
+    jobs = []
+    legacy_jobs = []
+    for filter_type in FILTER_TYPES:
+        for job in filters.get(f"benchmark_{filter_type}", []):
+            jobs.append(re.compile(job))
+            legacy_jobs.append(re.compile(legacy_job(filter_type, job)))
+    return jobs, legacy_jobs
+
+
+def test_filter_templates_corpus(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> None:
+    """Test removal of current and legacy templates on corpus of HTML snippets."""
+    jobs, legacy_jobs = build_jobs(
+        shell, privoxy_blocklist, privoxy_config, httpserver, CORPUS_RULES
+    )
+    for html, expected, legacy_expected in CORPUS:
+        assert apply_jobs(jobs, html)[0] == expected, html
+        assert apply_jobs(legacy_jobs, html)[0] == legacy_expected, html
+
+    response_html = (Path(__file__).parent / "response.html").read_text(encoding="UTF-8")
+    for templates in [jobs, legacy_jobs]:
+        filtered = apply_jobs(templates, response_html)[0]
+        for needle in config.content_removed:
+            assert check_not_in(needle, filtered), needle
+        for needle in config.content_exists:
+            assert check_in(needle, filtered), needle
+
+
+@requires_benchmark
+def test_benchmark_filter_templates(
+    shell: Subprocess, privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> None:
+    """Benchmark per-page filtering time of current against legacy templates."""
+    selectors = generate_selectors(1000)
+    rules = CORPUS_RULES + [f"##.{sel}" for sel in selectors] + [f"###{sel}" for sel in selectors]
+    jobs, legacy_jobs = build_jobs(shell, privoxy_blocklist, privoxy_config, httpserver, rules)
+    pages = {
+        "response.html": (Path(__file__).parent / "response.html").read_text(encoding="UTF-8"),
+        "synthetic-100k": generate_page(selectors, 100_000),
+        "minified-10k": generate_page(selectors, 10_000, minified=True),
+        "minified-50k": generate_page(selectors, 50_000, minified=True),
+        # pages without matching elements show the cost of backtracking
+        "minified-10k-clean": generate_page([], 10_000, minified=True),
+        "minified-50k-clean": generate_page([], 50_000, minified=True),
+    }
+    print("\npage                legacy [s]  current [s]  legacy removed  current removed")  # noqa: T201
+    for page_name, page in pages.items():
+        # best of three runs to reduce noise
+        legacy_filtered, legacy_time = min(
+            (apply_jobs(legacy_jobs, page) for _ in range(3)), key=lambda result: result[1]
+        )
+        filtered, current_time = min(
+            (apply_jobs(jobs, page) for _ in range(3)), key=lambda result: result[1]
+        )
+        print(  # noqa: T201
+            f"{page_name:<18} {legacy_time:>11.4f} {current_time:>12.4f}"
+            f" {len(page) - len(legacy_filtered):>15} {len(page) - len(filtered):>16}"
+        )
+        # legacy templates are only faster when removing the whole rest of the page
+        if len(legacy_filtered) == len(filtered) and page_name != "response.html":
+            assert current_time < legacy_time
@@ -0,0 +1,84 @@
+"""Benchmark conversion of synthetic lists of different sizes."""
+
+import os
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Generator
+
+import pytest
+from pytestshellutils.shell import Subprocess
+
+from benchmark import (
+    convert_command,
+    count_rules,
+    generate_list,
+    load_results,
+    measure,
+    requires_benchmark,
+    save_results,
+)
+from conftest import EXIT_SUCCESS
+
+SIZES = [10_000, 100_000, 500_000]
+# results of the python engine are saved separately to compare both engines
+ENGINE = os.environ.get("ENGINE", "shell")
+RESULTS_NAME = "conversion" if ENGINE == "shell" else f"conversion_{ENGINE}"
+
+
+@pytest.fixture(scope="module")
+def conversion_results() -> Generator[tuple[dict[int, dict], list[dict]], None, None]:
+    """Return results of previous runs and collect results of this run to save them afterwards."""
+    previous = {}
+    # latest result of each size, runs may only cover some sizes
+    for benchmark_run in load_results(RESULTS_NAME):
+        previous.update({result["rules"]: result for result in benchmark_run["results"]})
+    results: list[dict] = []
+    yield previous, results
+    if results:
+        print(f"\nbenchmark results saved to {save_results(RESULTS_NAME, results)}")  # noqa: T201
+
+
+@pytest.fixture
+def list_converter(
+    privoxy_blocklist: str, privoxy_config: str, httpserver
+) -> Callable[..., tuple[list[str], Path]]:
+    """Return function creating the command to convert given list content with given filters."""
+    return partial(convert_command, privoxy_blocklist, privoxy_config, httpserver)
+
+
+@requires_benchmark
+@pytest.mark.parametrize("rules", SIZES)
+def test_benchmark_conversion(
+    shell: Subprocess,
+    list_converter: Callable[..., tuple[list[str], Path]],
+    filtertypes: list[str],
+    conversion_results: tuple[dict[int, dict], list[dict]],
+    rules: int,
+) -> None:
+    """Benchmark conversion of synthetic list with given number of rules and all filters."""
+    previous, results = conversion_results
+    command, lists_dir = list_converter(generate_list(rules), *filtertypes)
+    process, measurement = measure(shell, command)
+    assert process.returncode == EXIT_SUCCESS
+    result: dict[str, Any] = {
+        "rules": rules,
+        **measurement,
+        **count_rules(lists_dir, process.stdout),
+    }
+    assert sum(result["input"].values()) == rules
+    results.append(result)
+
+    message = (
+        f"\n{rules} rules: {result['wall_time']:.2f}s wall time, "
+        f"{result['peak_rss_kib']} KiB peak RSS"
+    )
+    if rules in previous:
+        message += (
+            f" (previous run: {previous[rules]['wall_time']:.2f}s, "
+            f"{previous[rules]['peak_rss_kib']} KiB)"
+        )
+    print(message)  # noqa: T201
+    # fail on slowdowns compared to previous run if tolerated factor is given
+    tolerance = os.environ.get("BENCHMARK_TOLERANCE", None)
+    if tolerance is not None and rules in previous:
+        assert result["wall_time"] <= previous[rules]["wall_time"] * float(tolerance)
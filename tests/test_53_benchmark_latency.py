@@ -0,0 +1,47 @@
+"""Benchmark request latency through a live Privoxy for each content filter type."""
+
+import os
+from typing import Callable
+
+from benchmark import (
+    generate_list,
+    percentiles,
+    proxy_latencies,
+    requires_benchmark,
+    save_results,
+)
+from conftest import UrlParsed
+
+# number of measured requests per filter type
+REQUESTS = int(os.environ.get("BENCHMARK_REQUESTS", "200"))
+# number of rules of the synthetic list, about the size of easylist
+LIST_RULES = 50_000
+
+
+@requires_benchmark
+def test_benchmark_filter_latency(
+    start_privoxy,
+    webserver: UrlParsed,
+    filtertypes: list[str],
+    install_list: Callable[..., None],
+) -> None:
+    """Benchmark request latency with one content filter type enabled at a time."""
+    assert start_privoxy
+    content = generate_list(LIST_RULES)
+    results = []
+    baseline = 0.0
+    print(f"\n{REQUESTS} requests per filter type")  # noqa: T201
+    print("filter type                    p50 [ms]  p95 [ms]  p99 [ms]  p50 vs. none")  # noqa: T201
+    for filter_type in ["none", *filtertypes]:
+        install_list("latency", content, *([] if filter_type == "none" else [filter_type]))
+        # first requests let Privoxy load the changed configuration and lists
+        proxy_latencies(webserver.origin_url, 5)
+        latency = percentiles(proxy_latencies(webserver.origin_url, REQUESTS))
+        if filter_type == "none":
+            baseline = latency["p50"]
+        results.append({"filter": filter_type, "requests": REQUESTS, **latency})
+        print(  # noqa: T201
+            f"{filter_type:<28} {latency['p50']:>10.2f} {latency['p95']:>9.2f}"
+            f" {latency['p99']:>9.2f} {latency['p50'] - baseline:>+13.2f}"
+        )
+    print(f"benchmark results saved to {save_results('latency', results)}")  # noqa: T201
@@ -0,0 +1,96 @@
+"""Benchmark filtering time of content filters through a live Privoxy over page sizes."""
+
+from statistics import median
+from typing import Callable
+
+from benchmark import (
+    generate_list,
+    generate_page,
+    generate_selectors,
+    growth_exponent,
+    proxy_latencies,
+    requires_benchmark,
+    save_results,
+)
+
+# page sizes in bytes, Privoxy only filters pages smaller than its buffer-limit (default: 4 MiB)
+PAGE_SIZES = [1_000, 10_000, 100_000, 1_000_000, 3_000_000]
+# pages with one element per line and pages with all elements in one line
+LAYOUTS = ["lines", "minified"]
+# smaller pages are dominated by the noise of each request and not used to fit the growth
+FIT_MIN_SIZE = 100_000
+# growth exponent above which the cost of a filter is marked as super-linear
+SUPERLINEAR = 1.2
+# number of requests per page, the median is used
+REQUESTS = 5
+LIST_RULES = 10_000
+
+
+@requires_benchmark
+def test_benchmark_page_size(
+    start_privoxy,
+    httpserver,
+    filtertypes: list[str],
+    install_list: Callable[..., None],
+) -> None:
+    """Benchmark filtering time of each content filter type over page sizes."""
+    assert start_privoxy
+    selectors = generate_selectors(LIST_RULES)
+    pages = {}
+    for layout in LAYOUTS:
+        for size in PAGE_SIZES:
+            path = f"/page-{layout}-{size}.html"
+            httpserver.expect_request(path).respond_with_data(
+                generate_page(selectors, size, minified=layout == "minified"),
+                content_type="text/html",
+            )
+            pages[layout, size] = httpserver.url_for(path)
+    content = generate_list(LIST_RULES)
+    baseline = {}
+    results = []
+    print(  # noqa: T201
+        f"\nfiltering time [ms] per page size\n{'filter type':<28} {'layout':<9}"
+        + "".join(f"{size:>10}" for size in PAGE_SIZES)
+        + "  exponent"
+    )
+    for filter_type in ["none", *filtertypes]:
+        install_list("pagesize", content, *([] if filter_type == "none" else [filter_type]))
+        # first requests let Privoxy load the changed configuration and lists
+        proxy_latencies(pages[LAYOUTS[0], PAGE_SIZES[0]], 3)
+        for layout in LAYOUTS:
+            latencies = [
+                median(proxy_latencies(pages[layout, size], REQUESTS)) for size in PAGE_SIZES
+            ]
+            if filter_type == "none":
+                baseline[layout] = latencies
+                continue
+            # filtering time is the latency added to the one without content filters
+            costs = [
+                max(latency - base, 0.0)
+                for latency, base in zip(latencies, baseline[layout], strict=True)
+            ]
+            exponent = growth_exponent(
+                [size for size in PAGE_SIZES if size >= FIT_MIN_SIZE],
+                [
+                    cost
+                    for size, cost in zip(PAGE_SIZES, costs, strict=True)
+                    if size >= FIT_MIN_SIZE
+                ],
+            )
+            results.append(
+                {
+                    "filter": filter_type,
+                    "layout": layout,
+                    "sizes": PAGE_SIZES,
+                    "costs": costs,
+                    "exponent": exponent,
+                    "superlinear": exponent > SUPERLINEAR,
+                }
+            )
+            print(  # noqa: T201
+                f"{filter_type:<28} {layout:<9}"
+                + "".join(f"{cost:>10.1f}" for cost in costs)
+                + f"{exponent:>10.2f}"
+                + (" super-linear" if exponent > SUPERLINEAR else "")
+            )
+    print(f"benchmark results saved to {save_results('page_size', results)}")  # noqa: T201